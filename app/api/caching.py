@@ -0,0 +1,18 @@
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from pathlib import Path
+from typing import Union
+
+def cached_image_response(request: Request, content: Union[bytes, Path], media_type: str,
+                          etag: str, cache_control: str) -> Response:
+    """Image response with validators; 304 when the client already has this version."""
+    etag = f'"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/")
+                                                 for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if isinstance(content, Path):
+        return FileResponse(path=content, media_type=media_type, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
@@ -4,6 +4,7 @@ from app.services.segmentation_service import SegmentationService
 from app.services.feature_extraction_service import FeatureExtractionService
 
 from app.services.report_service import ReportService
+from app.services.pipeline_service import PipelineService
 
 from app.services.task_service import task_service, TaskService
 
@@ -19,5 +20,9 @@ def get_feature_extraction_service() -> FeatureExtractionService:
 def get_report_service() -> ReportService:
     return ReportService()
 
+def get_pipeline_service() -> PipelineService:
+    return PipelineService(SegmentationService(), FeatureExtractionService(),
+                           ReportService(), task_service)
+
 def get_task_service() -> TaskService:
     return task_service
\ No newline at end of file
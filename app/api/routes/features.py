@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from app.models.schemas import (
     FeatureExtractionRequest, FeatureExtractionResponse, 
     TaskStatusResponse, TaskStatus
@@ -6,10 +6,13 @@ from app.models.schemas import (
 from app.services.feature_extraction_service import FeatureExtractionService
 from app.services.file_service import FileService
 from app.services.task_service import TaskService
+from app.services.job_executor import job_executor, QueueFullError
+from app.services.result_cache import result_cache
 from app.api.dependencies import (
     get_feature_extraction_service, get_file_service, get_task_service
 )
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
 from pathlib import Path
 import logging
@@ -20,7 +23,8 @@ router = APIRouter()
 def run_feature_extraction_task(task_id: str, segmentation_task_id: str,
                                feature_service: FeatureExtractionService,
                                file_service: FileService,
-                               task_service: TaskService):
+                               task_service: TaskService,
+                               cache_key: str = None):
 
     try:
         task_service.update_task(task_id, TaskStatus.PROCESSING, 0.1,
@@ -34,8 +38,7 @@ def run_feature_extraction_task(task_id: str, segmentation_task_id: str,
         upload_id = seg_task.result.get('upload_id') if seg_task.result else None
         if not upload_id:
 
-            seg_task_data = task_service.tasks.get(segmentation_task_id, {})
-            upload_id = seg_task_data.get('upload_id')
+            upload_id = task_service.get_task_params(segmentation_task_id).get('upload_id')
         
         if not upload_id:
             raise Exception("Cannot find original upload files")
@@ -52,6 +55,8 @@ def run_feature_extraction_task(task_id: str, segmentation_task_id: str,
         features = feature_service.extract_features(
             file_paths, segmentation_path, f"case_{task_id}"
         )
+        if cache_key:
+            result_cache.put_features(cache_key, features)
         
 
         output_path = settings.OUTPUT_DIR / f"{task_id}_features.csv"
@@ -70,10 +75,31 @@ def run_feature_extraction_task(task_id: str, segmentation_task_id: str,
         task_service.update_task(task_id, TaskStatus.FAILED,
                                message=f"Feature extraction failed: {str(e)}")
 
+def complete_features_from_cache(task_id: str, segmentation_task_id: str, cache_key: str,
+                                 feature_service: FeatureExtractionService,
+                                 task_service: TaskService) -> bool:
+    """Finish a feature extraction task from the result cache; False on a miss."""
+    features = result_cache.get_features(cache_key)
+    if features is None:
+        return False
+    
+    features['case_id'] = f"case_{task_id}"
+    output_path = settings.OUTPUT_DIR / f"{task_id}_features.csv"
+    feature_service.save_features_to_csv(features, output_path)
+    
+    task_service.update_task(task_id, TaskStatus.COMPLETED, 1.0,
+                           "Features loaded from cache",
+                           {
+                               "features": features,
+                               "output_path": str(output_path),
+                               "segmentation_task_id": segmentation_task_id,
+                               "cached": True
+                           })
+    return True
+
 @router.post("/extract", response_model=FeatureExtractionResponse)
 async def extract_features(
     request: FeatureExtractionRequest,
-    background_tasks: BackgroundTasks,
     feature_service: FeatureExtractionService = Depends(get_feature_extraction_service),
     file_service: FileService = Depends(get_file_service),
     task_service: TaskService = Depends(get_task_service)
@@ -81,7 +107,7 @@ async def extract_features(
 
     try:
 
-        seg_task = task_service.get_task(request.task_id)
+        seg_task = task_service.get_task(request.task_id, include_result=False)
         if not seg_task:
             raise HTTPException(status_code=404, 
                               detail="Segmentation task not found")
@@ -93,10 +119,29 @@ async def extract_features(
         task_id = task_service.create_task("feature_extraction",
                                          segmentation_task_id=request.task_id)
         
-        background_tasks.add_task(
-            run_feature_extraction_task, task_id, request.task_id,
-            feature_service, file_service, task_service
+        upload_id = task_service.get_task_params(request.task_id).get('upload_id')
+        cache_key = result_cache.key_for_manifest(
+            file_service.get_upload_manifest(upload_id) if upload_id else None
         )
+        if cache_key and await run_in_threadpool(
+                complete_features_from_cache, task_id, request.task_id, cache_key,
+                feature_service, task_service):
+            return FeatureExtractionResponse(
+                task_id=task_id,
+                status=TaskStatus.COMPLETED,
+                message="Features loaded from cache"
+            )
+        
+        try:
+            job_executor.submit(
+                "cpu", run_feature_extraction_task, task_id, request.task_id,
+                feature_service, file_service, task_service, cache_key,
+                job_id=task_id, priority=request.priority
+            )
+        except QueueFullError as e:
+            task_service.delete_task(task_id)
+            raise HTTPException(status_code=429, detail=str(e),
+                              headers={"Retry-After": str(settings.JOB_RETRY_AFTER_SECONDS)})
         
         return FeatureExtractionResponse(
             task_id=task_id,
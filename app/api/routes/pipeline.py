@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.models.schemas import (
+    PipelineRequest, PipelineResponse, TaskStatusResponse, TaskStatus
+)
+from app.services.pipeline_service import PipelineService
+from app.services.file_service import FileService
+from app.services.task_service import TaskService
+from app.services.job_executor import QueueFullError
+from app.services.result_cache import result_cache
+from app.api.dependencies import (
+    get_pipeline_service, get_file_service, get_task_service
+)
+from fastapi.responses import FileResponse
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+ARTIFACTS = {
+    'segmentation': ('output_path', "segmentation_{task_id}.nii.gz", "application/gzip"),
+    'features': ('features_path', "features_{task_id}.csv", "text/csv"),
+    'report': ('pdf_path', "brain_tumor_comprehensive_report_{task_id}.pdf", "application/pdf"),
+}
+
+@router.post("", response_model=PipelineResponse)
+async def run_pipeline(
+    request: PipelineRequest,
+    pipeline_service: PipelineService = Depends(get_pipeline_service),
+    file_service: FileService = Depends(get_file_service),
+    task_service: TaskService = Depends(get_task_service)
+):
+    """Segment an upload, extract its features and generate the report in one task."""
+
+    try:
+        file_paths = file_service.get_upload_files(request.upload_id)
+        if not file_paths:
+            raise HTTPException(status_code=404,
+                              detail="Upload not found or incomplete")
+
+        task_id = task_service.create_task("pipeline",
+                                         upload_id=request.upload_id,
+                                         patient_info=request.patient_info)
+
+        cache_key = result_cache.key_for_manifest(
+            file_service.get_upload_manifest(request.upload_id)
+        )
+
+        try:
+            pipeline_service.submit(task_id, request.upload_id, file_paths,
+                                    request.patient_info, request.priority, cache_key,
+                                    request.bypass_cache)
+        except QueueFullError as e:
+            task_service.delete_task(task_id)
+            raise HTTPException(status_code=429, detail=str(e),
+                              headers={"Retry-After": str(settings.JOB_RETRY_AFTER_SECONDS)})
+
+        return PipelineResponse(
+            task_id=task_id,
+            status=TaskStatus.PENDING,
+            message="Pipeline task started"
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to start pipeline: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/status/{task_id}", response_model=TaskStatusResponse)
+async def get_pipeline_status(
+    task_id: str,
+    task_service: TaskService = Depends(get_task_service)
+):
+
+    task = task_service.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+@router.get("/download/{task_id}/{artifact}")
+async def download_pipeline_artifact(
+    task_id: str,
+    artifact: str,
+    task_service: TaskService = Depends(get_task_service)
+):
+
+    if artifact not in ARTIFACTS:
+        raise HTTPException(status_code=404, detail="Unknown artifact")
+
+    task = task_service.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    if task.status != TaskStatus.COMPLETED:
+        raise HTTPException(status_code=400,
+                          detail="Task not completed yet")
+
+    result_key, filename, media_type = ARTIFACTS[artifact]
+    if not task.result or result_key not in task.result:
+        raise HTTPException(status_code=500,
+                          detail=f"No {artifact} file available")
+
+    return FileResponse(
+        path=task.result[result_key],
+        filename=filename.format(task_id=task_id),
+        media_type=media_type
+    )
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from app.models.schemas import (
     ReportGenerationRequest, ReportGenerationResponse, 
     TaskStatusResponse, TaskStatus
@@ -6,6 +6,8 @@ from app.models.schemas import (
 from app.services.report_service import ReportService
 from app.services.file_service import FileService
 from app.services.task_service import TaskService
+from app.services.job_executor import job_executor, QueueFullError
+from app.services.render_store import render_store
 from app.api.dependencies import get_report_service, get_task_service, get_file_service
 from fastapi.responses import FileResponse
 from app.core.config import settings
@@ -17,7 +19,7 @@ router = APIRouter()
 
 def run_report_generation_task(task_id: str, features_task_id: str, patient_info: dict,
                               report_service: ReportService, task_service: TaskService,
-                              file_service: FileService):
+                              file_service: FileService, bypass_cache: bool = False):
     """Background task for comprehensive report generation."""
     try:
         task_service.update_task(task_id, TaskStatus.PROCESSING, 0.1,
@@ -33,14 +35,19 @@ def run_report_generation_task(task_id: str, features_task_id: str, patient_info
         
         features = features_task.result['features']
         
-        segmentation_task_id = features_task.result.get('segmentation_task_id') or task_service.tasks[features_task_id].get('segmentation_task_id')
+        segmentation_task_id = features_task.result.get('segmentation_task_id') or task_service.get_task_params(features_task_id).get('segmentation_task_id')
         segmentation_task = task_service.get_task(segmentation_task_id) if segmentation_task_id else None
 
         file_paths = None
         segmentation_path = None
+        visualizations = None
         
         if segmentation_task and segmentation_task.result:
-            upload_id = segmentation_task.result.get('upload_id') or task_service.tasks[segmentation_task_id].get('upload_id')
+            # Reuse the segmentation stage's images; they are only rendered again once evicted
+            stored = segmentation_task.result.get('visualizations')
+            if stored and render_store.reuse(stored.values()):
+                visualizations = stored
+            upload_id = segmentation_task.result.get('upload_id') or task_service.get_task_params(segmentation_task_id).get('upload_id')
             if upload_id:
                 file_paths = file_service.get_upload_files(upload_id)
             segmentation_path = Path(segmentation_task.result['output_path']) if 'output_path' in segmentation_task.result else None
@@ -49,7 +56,10 @@ def run_report_generation_task(task_id: str, features_task_id: str, patient_info
                                message="Generating AI report with visualizations...")
 
         report_data = report_service.generate_report(
-            features, patient_info, task_id, file_paths, segmentation_path
+            features, patient_info, task_id, file_paths, segmentation_path,
+            visualizations=visualizations,
+            on_delta=lambda text: task_service.publish_event(task_id, {"report_delta": text}),
+            bypass_cache=bypass_cache
         )
         
         task_service.update_task(task_id, progress=0.7,
@@ -73,7 +83,6 @@ def run_report_generation_task(task_id: str, features_task_id: str, patient_info
 @router.post("/generate", response_model=ReportGenerationResponse)
 async def generate_report(
     request: ReportGenerationRequest,
-    background_tasks: BackgroundTasks,
     report_service: ReportService = Depends(get_report_service),
     task_service: TaskService = Depends(get_task_service),
     file_service: FileService = Depends(get_file_service)
@@ -81,7 +90,7 @@ async def generate_report(
 
     try:
 
-        features_task = task_service.get_task(request.features_task_id)
+        features_task = task_service.get_task(request.features_task_id, include_result=False)
         if not features_task:
             raise HTTPException(status_code=404, 
                               detail="Features task not found")
@@ -94,10 +103,16 @@ async def generate_report(
                                          features_task_id=request.features_task_id,
                                          patient_info=request.patient_info)
 
-        background_tasks.add_task(
-            run_report_generation_task, task_id, request.features_task_id,
-            request.patient_info or {}, report_service, task_service, file_service
-        )
+        try:
+            job_executor.submit(
+                "llm", run_report_generation_task, task_id, request.features_task_id,
+                request.patient_info or {}, report_service, task_service, file_service,
+                request.bypass_cache, job_id=task_id, priority=request.priority
+            )
+        except QueueFullError as e:
+            task_service.delete_task(task_id)
+            raise HTTPException(status_code=429, detail=str(e),
+                              headers={"Retry-After": str(settings.JOB_RETRY_AFTER_SECONDS)})
         
         return ReportGenerationResponse(
             task_id=task_id,
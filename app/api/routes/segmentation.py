@@ -1,15 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from app.models.schemas import (
-    SegmentationRequest, SegmentationResponse, TaskStatusResponse, TaskStatus
+    SegmentationRequest, SegmentationResponse, TaskStatusResponse, TaskStatus,
+    JobPriority
 )
 from app.services.segmentation_service import SegmentationService
 from app.services.file_service import FileService
 from app.services.task_service import TaskService
 from app.services.visualization_service import VisualizationService
+from app.services.job_executor import job_executor, QueueFullError
+from app.services.result_cache import result_cache
 from app.api.dependencies import (
     get_segmentation_service, get_file_service, get_task_service
 )
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
 import logging
 
@@ -18,7 +22,9 @@ router = APIRouter()
 
 def run_segmentation_task(task_id: str, file_paths: dict, 
                          segmentation_service: SegmentationService,
-                         task_service: TaskService):
+                         task_service: TaskService,
+                         priority: JobPriority = JobPriority.NORMAL,
+                         cache_key: str = None):
 
     try:
         task_service.update_task(task_id, TaskStatus.PROCESSING, 0.1, 
@@ -28,26 +34,35 @@ def run_segmentation_task(task_id: str, file_paths: dict,
         task_service.update_task(task_id, progress=0.4, 
                                message="Running model prediction...")
         
-        output_path = segmentation_service.predict(file_paths, task_id)
+        output_path = segmentation_service.predict(file_paths, task_id, cache_key)
         
         task_service.update_task(task_id, progress=0.7,
                                message="Generating visualizations...")
+
+        # Rendering is CPU work; hand it to that pool and free the inference slot
+        job_executor.submit("cpu", run_segmentation_visualization_task, task_id,
+                            file_paths, output_path, task_service, cache_key,
+                            job_id=task_id, priority=priority, force=True)
         
-        visualization_service = VisualizationService()
-        visualizations = visualization_service.create_all_modality_overlays(
-            file_paths, output_path
-        )
-        
-        volume_viz = visualization_service.create_3d_volume_visualization(output_path)
-        if volume_viz:
-            visualizations['3d_volume'] = volume_viz
+    except Exception as e:
+        logger.error(f"Segmentation task {task_id} failed: {e}")
+        task_service.update_task(task_id, TaskStatus.FAILED, 
+                               message=f"Segmentation failed: {str(e)}")
+
+def run_segmentation_visualization_task(task_id: str, file_paths: dict, output_path,
+                                        task_service: TaskService, cache_key: str = None):
+
+    try:
+        visualizations = VisualizationService().create_case_figures(file_paths, output_path)
+        if cache_key:
+            result_cache.put_visualizations(cache_key, visualizations)
         
         task_service.update_task(task_id, TaskStatus.COMPLETED, 1.0,
                                "Segmentation completed successfully",
                                {
                                    "output_path": str(output_path),
                                    "visualizations": visualizations,
-                                   "upload_id": task_service.tasks[task_id].get('upload_id')
+                                   "upload_id": task_service.get_task_params(task_id).get('upload_id')
                                })
         
     except Exception as e:
@@ -55,10 +70,32 @@ def run_segmentation_task(task_id: str, file_paths: dict,
         task_service.update_task(task_id, TaskStatus.FAILED, 
                                message=f"Segmentation failed: {str(e)}")
 
+def complete_segmentation_from_cache(task_id: str, upload_id: str, cache_key: str,
+                                     segmentation_service: SegmentationService,
+                                     task_service: TaskService) -> bool:
+    """Finish a segmentation task from the result cache; False if anything is missing."""
+    visualizations = result_cache.get_visualizations(cache_key)
+    if visualizations is None:
+        return False
+    
+    # Same path as the pipeline: the mask is copied and gets its cropped copy and ranking
+    result = segmentation_service.segment_from_cache(task_id, cache_key)
+    if result is None:
+        return False
+    
+    task_service.update_task(task_id, TaskStatus.COMPLETED, 1.0,
+                           "Segmentation loaded from cache",
+                           {
+                               "output_path": str(result.output_path),
+                               "visualizations": visualizations,
+                               "upload_id": upload_id,
+                               "cached": True
+                           })
+    return True
+
 @router.post("/predict", response_model=SegmentationResponse)
 async def predict_segmentation(
     request: SegmentationRequest,
-    background_tasks: BackgroundTasks,
     segmentation_service: SegmentationService = Depends(get_segmentation_service),
     file_service: FileService = Depends(get_file_service),
     task_service: TaskService = Depends(get_task_service)
@@ -75,11 +112,28 @@ async def predict_segmentation(
         task_id = task_service.create_task("segmentation", 
                                          upload_id=request.upload_id)
         
-
-        background_tasks.add_task(
-            run_segmentation_task, task_id, file_paths,
-            segmentation_service, task_service
+        cache_key = result_cache.key_for_manifest(
+            file_service.get_upload_manifest(request.upload_id)
         )
+        if cache_key and await run_in_threadpool(
+                complete_segmentation_from_cache, task_id, request.upload_id, cache_key,
+                segmentation_service, task_service):
+            return SegmentationResponse(
+                task_id=task_id,
+                status=TaskStatus.COMPLETED,
+                message="Segmentation loaded from cache"
+            )
+
+        try:
+            job_executor.submit(
+                "inference", run_segmentation_task, task_id, file_paths,
+                segmentation_service, task_service, request.priority, cache_key,
+                job_id=task_id, priority=request.priority
+            )
+        except QueueFullError as e:
+            task_service.delete_task(task_id)
+            raise HTTPException(status_code=429, detail=str(e),
+                              headers={"Retry-After": str(settings.JOB_RETRY_AFTER_SECONDS)})
         
         return SegmentationResponse(
             task_id=task_id,
@@ -87,6 +141,8 @@ async def predict_segmentation(
             message="Segmentation task started"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to start segmentation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,89 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pathlib import Path
+from typing import Optional
+from app.services.file_service import FileService
+from app.services.task_service import TaskService
+from app.services.slice_service import slice_service, AXES, MEDIA_TYPES
+from app.services.slice_ranking import get_slice_ranking
+from app.api.caching import cached_image_response
+from app.api.dependencies import get_file_service, get_task_service
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+def _volume_path(upload_id: str, modality: str, file_service: FileService) -> Path:
+    file_paths = file_service.get_upload_files(upload_id)
+    if not file_paths:
+        raise HTTPException(status_code=404, detail="Upload not found or incomplete")
+    if modality not in file_paths:
+        raise HTTPException(status_code=400,
+                          detail=f"modality must be one of {', '.join(file_paths)}")
+    return file_paths[modality]
+
+def _mask_path(segmentation_task_id: Optional[str], task_service: TaskService) -> Optional[Path]:
+    if not segmentation_task_id:
+        return None
+    task = task_service.get_task(segmentation_task_id)
+    if not task or not task.result or 'output_path' not in task.result:
+        raise HTTPException(status_code=404, detail="Segmentation not found or not completed")
+    return Path(task.result['output_path'])
+
+# Plain def endpoints: reading and encoding slices runs in the threadpool
+
+@router.get("/{upload_id}/info")
+def get_slice_info(
+    upload_id: str,
+    segmentation_task_id: Optional[str] = Query(None, description="also return its key slices"),
+    file_service: FileService = Depends(get_file_service),
+    task_service: TaskService = Depends(get_task_service)
+):
+    """Slice counts per view, the default window/level of each modality and key slices."""
+
+    file_paths = file_service.get_upload_files(upload_id)
+    if not file_paths:
+        raise HTTPException(status_code=404, detail="Upload not found or incomplete")
+    mask_path = _mask_path(segmentation_task_id, task_service)
+    return {
+        "upload_id": upload_id,
+        "axes": list(AXES),
+        "modalities": {modality: slice_service.volume_info(path)
+                       for modality, path in file_paths.items()},
+        "key_slices": get_slice_ranking(mask_path).key_slices() if mask_path else None
+    }
+
+@router.get("/{upload_id}/{modality}/{axis}/{index}")
+def get_slice(
+    upload_id: str,
+    modality: str,
+    axis: str,
+    index: int,
+    request: Request,
+    segmentation_task_id: Optional[str] = Query(None, description="overlay this task's mask"),
+    window: Optional[float] = Query(None, gt=0),
+    level: Optional[float] = None,
+    size: Optional[int] = Query(None, ge=16, le=settings.SLICE_MAX_SIZE),
+    format: str = Query("png", pattern=f"^({'|'.join(MEDIA_TYPES)})$"),
+    file_service: FileService = Depends(get_file_service),
+    task_service: TaskService = Depends(get_task_service)
+):
+    """One axial, coronal or sagittal slice as an image."""
+
+    if axis not in AXES:
+        raise HTTPException(status_code=400, detail=f"axis must be one of {', '.join(AXES)}")
+    volume_path = _volume_path(upload_id, modality, file_service)
+    mask_path = _mask_path(segmentation_task_id, task_service)
+
+    try:
+        tile = slice_service.get_tile(volume_path, axis, index, mask_path,
+                                      window, level, size, format)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return cached_image_response(
+        request, tile.content, tile.media_type, tile.etag,
+        f"private, max-age={settings.SLICE_TILE_MAX_AGE_SECONDS}"
+    )
@@ -0,0 +1,104 @@
+# app/api/routes/tasks.py
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.models.schemas import TaskStatus
+from app.services.task_service import TaskService
+from app.api.dependencies import get_task_service
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+TERMINAL_STATUSES = {TaskStatus.COMPLETED.value, TaskStatus.FAILED.value}
+STATUS_KEYS = ('status', 'progress', 'message', 'queue_position')
+
+async def task_event_stream(task_id: str, task_service: TaskService) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield progress deltas for a task until it completes or fails.
+
+    Starts with a snapshot of the current state, then forwards change events
+    from TaskService. While idle the status row is re-read every
+    TASK_EVENTS_RECHECK_SECONDS, which picks up queue movement and updates
+    made by other worker processes.
+    """
+    subscription = task_service.events.subscribe(task_id)
+    try:
+        last = await run_in_threadpool(task_service.get_task_event, task_id)
+        if last is None:
+            return
+        yield last
+        if last['status'] in TERMINAL_STATUSES:
+            return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(),
+                                               timeout=settings.TASK_EVENTS_RECHECK_SECONDS)
+            except asyncio.TimeoutError:
+                event = await run_in_threadpool(task_service.get_task_event, task_id)
+                if event is None:
+                    return
+
+            delta = {k: v for k, v in event.items()
+                     if k != 'task_id' and not (k in STATUS_KEYS and last.get(k) == v)}
+            if not delta:
+                yield {}  # nothing new; lets the caller send a keep-alive
+                continue
+
+            last.update(delta)
+            yield {'task_id': task_id, **delta}
+            if delta.get('status') in TERMINAL_STATUSES:
+                return
+    finally:
+        task_service.events.unsubscribe(task_id, subscription)
+
+@router.get("/{task_id}/events")
+async def stream_task_events(
+    task_id: str,
+    request: Request,
+    task_service: TaskService = Depends(get_task_service)
+):
+    """Server-Sent Events stream of task progress."""
+
+    if await run_in_threadpool(task_service.get_task_event, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def event_source():
+        async for event in task_event_stream(task_id, task_service):
+            if await request.is_disconnected():
+                break
+            if not event:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/{task_id}/ws")
+async def task_events_websocket(
+    websocket: WebSocket,
+    task_id: str,
+    task_service: TaskService = Depends(get_task_service)
+):
+    """WebSocket stream of task progress; closes once the task finishes."""
+
+    await websocket.accept()
+    try:
+        if await run_in_threadpool(task_service.get_task_event, task_id) is None:
+            await websocket.close(code=4404, reason="Task not found")
+            return
+        async for event in task_event_stream(task_id, task_service):
+            if event:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
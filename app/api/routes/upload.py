@@ -28,6 +28,8 @@ async def upload_files(
             message="Files uploaded successfully",
             files_received={k: str(v) for k, v in saved_files.items()}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"File upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Request
+from app.api.caching import cached_image_response
+from app.services.render_store import render_store
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/{image_id}")
+async def get_visualization(image_id: str, request: Request):
+    """Serve a rendered overlay; the content under an ID never changes."""
+
+    found = render_store.open(image_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Visualization not found or expired")
+    path, media_type = found
+
+    return cached_image_response(
+        request, path, media_type, image_id,
+        f"private, max-age={settings.VISUALIZATION_CACHE_MAX_AGE_SECONDS}, immutable"
+    )
@@ -0,0 +1,67 @@
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class _RequestTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject upload requests over max_bytes before the multipart parser spools
+    them: up front from Content-Length, otherwise as soon as the streamed body
+    passes the limit.
+    """
+
+    def __init__(self, app: ASGIApp, path: str, max_bytes: int):
+        self.app = app
+        self.path = path.rstrip("/")
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope["type"] != "http" or scope["method"] != "POST"
+                or scope["path"].rstrip("/") != self.path):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() \
+                and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request" and not response_started:
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _RequestTooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            # FastAPI reports the aborted form parse as a 400; answer 413 instead
+            nonlocal response_started
+            if not exceeded:
+                response_started = response_started or message["type"] == "http.response.start"
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _RequestTooLarge:
+            pass
+        if exceeded:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds maximum request size of {self.max_bytes} bytes"},
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
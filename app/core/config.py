@@ -13,16 +13,105 @@ class Settings(BaseSettings):
     OUTPUT_DIR: Path = BASE_DIR / "data" / "outputs"
     MODEL_DIR: Path = BASE_DIR / "data" / "models"
     REPORTS_DIR: Path = BASE_DIR / "data" / "reports"
+    TASK_DB_PATH: Path = BASE_DIR / "data" / "tasks.db"
+    RESULT_CACHE_DIR: Path = BASE_DIR / "data" / "cache" / "results"
+    REPORT_CACHE_DB_PATH: Path = BASE_DIR / "data" / "cache" / "report_text.db"
+    RENDER_DIR: Path = BASE_DIR / "data" / "cache" / "renders"
+    SLICE_CACHE_DIR: Path = BASE_DIR / "data" / "cache" / "volumes"
 
     MODEL_PATH: str
     DEVICE: str 
+    MODEL_WARMUP: bool = True
+
+    # "crop" runs the fixed 128^3 training ROI, "sliding_window" tiles the whole volume.
+    # Sliding windows keep float32 class scores for one patch depth of the scan
+    # (4 x 128 x 240 x 155 x 4 B ~ 76 MB for BraTS) plus the uint8 labels.
+    INFERENCE_MODE: str = "crop"
+    SLIDING_WINDOW_PATCH_SIZE: tuple[int, int, int] = (128, 128, 128)
+    SLIDING_WINDOW_OVERLAP: float = 0.25
+    SLIDING_WINDOW_BATCH_SIZE: int = 1
+    SLIDING_WINDOW_BLEND_MODE: str = "gaussian"
+
+    # CPU execution engine: "eager", "torchscript" (traced and frozen),
+    # "compile" (torch.compile) or "onnxruntime" (needs onnx and onnxruntime).
+    # BatchNorm is folded into the Conv3d weights first unless disabled.
+    INFERENCE_ENGINE: str = "eager"
+    INFERENCE_FOLD_BATCHNORM: bool = True
+    INFERENCE_CHANNELS_LAST: bool = True
+    # "fp32", "bf16" (autocast) or "int8" (static, built by quantize_model.py).
+    # Reduced precision only loads once its accuracy gate report shows a mean
+    # Dice against fp32 of at least QUANTIZATION_MIN_DICE for every label.
+    INFERENCE_PRECISION: str = "fp32"
+    QUANTIZATION_MIN_DICE: float = 0.95
+    # Crop inference returns uint8 labels: eager engines free each activation
+    # once consumed and run the last decoder level, output convolution and
+    # argmax in depth slabs; other engines take the argmax after their forward
+    INFERENCE_LEAN: bool = True
+    INFERENCE_LEAN_CHUNK_DEPTH: int = 32
+    # Thread pools of each worker process; 0 keeps torch's defaults
+    TORCH_NUM_THREADS: int = 0
+    TORCH_NUM_INTEROP_THREADS: int = 0
+
+    # Micro-batching of concurrent forward passes
+    INFERENCE_BATCHING: bool = True
+    INFERENCE_MAX_BATCH_SIZE: int = 4
+    INFERENCE_MAX_WAIT_MS: float = 20.0
+
+    # Per-stage worker pools; inference concurrency also bounds how many
+    # requests the micro-batching scheduler can combine
+    JOB_INFERENCE_CONCURRENCY: int = 4
+    JOB_CPU_CONCURRENCY: int = 2
+    JOB_LLM_CONCURRENCY: int = 4
+    JOB_QUEUE_SIZE: int = 32
+    JOB_RETRY_AFTER_SECONDS: int = 30
+
+    # Decoded NIfTI volumes shared by all stages of a case
+    VOLUME_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+
+    # Segmentation masks: gzip level of the downloadable .nii.gz (0-9), and an
+    # uncompressed uint8 copy cropped to the tumor's bounding box that later
+    # stages read instead of inflating the .nii.gz
+    MASK_COMPRESSION_LEVEL: int = 1
+    MASK_CROPPED_COPY: bool = True
+
+    # Masks, features and overlays reused when the same study is submitted again
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+
+    # Rendered overlay figures shared by the segmentation and report stages and
+    # served by the image endpoint; evicted images are no longer downloadable
+    RENDER_STORE_MAX_BYTES: int = 1024 * 1024 * 1024
+    VISUALIZATION_CACHE_MAX_AGE_SECONDS: int = 7 * 24 * 60 * 60
+
+    # "matplotlib" draws overlays as figures, "numpy" composites them with
+    # lookup tables and encodes with Pillow; format is "png" or "webp"
+    VISUALIZATION_BACKEND: str = "matplotlib"
+    VISUALIZATION_IMAGE_FORMAT: str = "png"
+    VISUALIZATION_WEBP_QUALITY: int = 90
+
+    # Slice viewer: uncompressed memory-mapped copies of volumes and masks,
+    # plus an LRU of encoded tiles
+    SLICE_CACHE_MAX_BYTES: int = 4 * 1024 * 1024 * 1024
+    SLICE_TILE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SLICE_TILE_MAX_AGE_SECONDS: int = 60 * 60
+    SLICE_MAX_SIZE: int = 1024
 
     MAX_FILE_SIZE: int = 500 * 1024 * 1024
+    # Whole upload request (three modalities plus multipart framing); enforced
+    # as the body arrives, before Starlette spools it to disk
+    MAX_UPLOAD_REQUEST_SIZE: int = 3 * 500 * 1024 * 1024 + 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
     ALLOWED_EXTENSIONS: set = {".nii", ".nii.gz"}
 
 
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # "sqlite" persists tasks across restarts and workers, "memory" keeps them per process
+    TASK_STORE_BACKEND: str = "sqlite"
+    TASK_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    TASK_PURGE_INTERVAL_SECONDS: int = 60 * 60
+    TASK_EVENTS_RECHECK_SECONDS: float = 5.0
+
 
     BACKEND_CORS_ORIGINS: list[str]
 
@@ -31,6 +120,21 @@ class Settings(BaseSettings):
     MODEL_NAME: str
     HUGGINGFACE_API_URL: str
 
+    # OpenAI-compatible chat completions endpoint used for report text
+    LLM_CHAT_URL: str = "https://router.huggingface.co/v1/chat/completions"
+    LLM_MAX_CONCURRENCY: int = 4
+    LLM_MAX_CONNECTIONS: int = 8
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BACKOFF_SECONDS: float = 1.0
+    LLM_MAX_TOKENS: int = 1024
+
+    # Reuse report text when the same features are reported again
+    REPORT_CACHE_ENABLED: bool = True
+    REPORT_CACHE_TTL_SECONDS: int = 30 * 24 * 60 * 60
+    REPORT_CACHE_MAX_ENTRIES: int = 5000
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 
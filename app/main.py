@@ -1,11 +1,23 @@
 # app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from app.core.config import settings
-from app.api.routes import upload, segmentation, features, reports
+from app.api.upload_limit import UploadSizeLimitMiddleware
+from app.api.routes import upload, segmentation, features, reports, tasks, pipeline, visualizations, slices
+from app.services.model_registry import model_registry
+from app.services.inference_scheduler import inference_scheduler
+from app.services.volume_cache import volume_cache
+from app.services.job_executor import job_executor
+from app.services.result_cache import result_cache
+from app.services.llm_client import llm_client
+from app.services.report_cache import report_text_cache
+from app.services.render_store import render_store
+from app.services.slice_service import slice_service
+from starlette.concurrency import run_in_threadpool
 import logging
 
 # Configure logging
@@ -18,10 +30,24 @@ logging.basicConfig(
     ]
 )
 
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.MODEL_WARMUP:
+        try:
+            await run_in_threadpool(model_registry.warm_up)
+        except Exception as e:
+            # Keep serving; the first segmentation request will retry the load
+            logger.error(f"Model warm-up failed: {e}")
+    yield
+    await run_in_threadpool(llm_client.close)
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -33,6 +59,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Bound upload bodies before the multipart parser spools them to disk
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path=f"{settings.API_V1_STR}/upload",
+    max_bytes=settings.MAX_UPLOAD_REQUEST_SIZE,
+)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -44,6 +77,10 @@ app.include_router(upload.router, prefix=f"{settings.API_V1_STR}/upload", tags=[
 app.include_router(segmentation.router, prefix=f"{settings.API_V1_STR}/segmentation", tags=["segmentation"])
 app.include_router(features.router, prefix=f"{settings.API_V1_STR}/features", tags=["features"])
 app.include_router(reports.router, prefix=f"{settings.API_V1_STR}/reports", tags=["reports"])
+app.include_router(pipeline.router, prefix=f"{settings.API_V1_STR}/pipeline", tags=["pipeline"])
+app.include_router(tasks.router, prefix=f"{settings.API_V1_STR}/tasks", tags=["tasks"])
+app.include_router(visualizations.router, prefix=f"{settings.API_V1_STR}/visualizations", tags=["visualizations"])
+app.include_router(slices.router, prefix=f"{settings.API_V1_STR}/slices", tags=["slices"])
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -59,6 +96,21 @@ async def health_check():
         "version": settings.VERSION
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for the inference pipeline."""
+    return {
+        "models": model_registry.stats(),
+        "scheduler": inference_scheduler.stats(),
+        "volume_cache": volume_cache.stats(),
+        "jobs": job_executor.stats(),
+        "result_cache": result_cache.stats(),
+        "llm": llm_client.stats(),
+        "report_cache": report_text_cache.stats(),
+        "render_store": render_store.stats(),
+        "slices": slice_service.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
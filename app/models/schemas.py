@@ -9,6 +9,11 @@ class TaskStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class JobPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
 class FileUploadResponse(BaseModel):
     upload_id: str
     message: str
@@ -16,6 +21,7 @@ class FileUploadResponse(BaseModel):
 
 class SegmentationRequest(BaseModel):
     upload_id: str
+    priority: JobPriority = JobPriority.NORMAL
 
 class SegmentationResponse(BaseModel):
     task_id: str
@@ -28,11 +34,13 @@ class TaskStatusResponse(BaseModel):
     progress: Optional[float] = None
     message: Optional[str] = None
     result: Optional[Dict[str, Any]] = None
+    queue_position: Optional[int] = None
     created_at: datetime
     updated_at: datetime
 
 class FeatureExtractionRequest(BaseModel):
     task_id: str  # Segmentation task ID
+    priority: JobPriority = JobPriority.NORMAL
 
 class FeatureExtractionResponse(BaseModel):
     task_id: str
@@ -42,12 +50,25 @@ class FeatureExtractionResponse(BaseModel):
 class ReportGenerationRequest(BaseModel):
     features_task_id: str
     patient_info: Optional[Dict[str, str]] = None
+    priority: JobPriority = JobPriority.NORMAL
+    bypass_cache: bool = False  # regenerate the report text even if it is cached
 
 class ReportGenerationResponse(BaseModel):
     task_id: str
     status: TaskStatus
     message: str
 
+class PipelineRequest(BaseModel):
+    upload_id: str
+    patient_info: Optional[Dict[str, str]] = None
+    priority: JobPriority = JobPriority.NORMAL
+    bypass_cache: bool = False
+
+class PipelineResponse(BaseModel):
+    task_id: str
+    status: TaskStatus
+    message: str
+
 class ClinicalFeatures(BaseModel):
     case_id: str
     voxel_spacing_mm: str
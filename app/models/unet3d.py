@@ -59,3 +59,39 @@ class UNet3D(nn.Module):
         c9 = self.conv9(u9)
         outputs = self.out_conv(c9)
         return outputs
+
+    def segment(self, x, chunk_depth=32):
+        """
+        uint8 labels of shape (B, D, H, W), the same as `forward(x).argmax(1)`.
+
+        Each activation is released as soon as the decoder has consumed it,
+        and the last decoder level, the output convolution and the argmax run
+        over depth slabs with a 2-voxel halo for the two 3x3x3 convolutions,
+        so neither the full-resolution concatenation nor the logits ever
+        exist at full size.
+        """
+        c1 = self.conv1(x)
+        c2 = self.conv2(self.pool1(c1))
+        c3 = self.conv3(self.pool2(c2))
+        c4 = self.conv4(self.pool3(c3))
+        c5 = self.conv5(self.pool4(c4))
+        c6 = self.conv6(torch.cat([self.upconv6(c5), c4], dim=1))
+        del c5, c4
+        c7 = self.conv7(torch.cat([self.upconv7(c6), c3], dim=1))
+        del c6, c3
+        c8 = self.conv8(torch.cat([self.upconv8(c7), c2], dim=1))
+        del c7, c2
+
+        depth = c1.shape[2]
+        halo = 2
+        step = max(2, chunk_depth - chunk_depth % 2)  # even, so slabs align with upconv9
+        labels = torch.empty((x.shape[0], *c1.shape[2:]), dtype=torch.uint8, device=x.device)
+        for start in range(0, depth, step):
+            stop = min(depth, start + step)
+            lo, hi = max(0, start - halo), min(depth, stop + halo)
+            u9 = torch.cat([self.upconv9(c8[:, :, lo // 2:hi // 2]), c1[:, :, lo:hi]], dim=1)
+            logits = self.out_conv(self.conv9(u9)[:, :, start - lo:stop - lo])
+            labels[:, start:stop] = logits.argmax(dim=1)
+            del u9, logits
+        return labels
+
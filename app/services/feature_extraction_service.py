@@ -1,10 +1,10 @@
 import numpy as np
-import nibabel as nib
-from scipy import ndimage
-from skimage import measure
 import pandas as pd
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
+from app.services.volume_cache import volume_cache
+from app.utils.label_statistics import RegionStats, compute_label_statistics, merge_regions
+from app.utils.volume_io import cropped_box
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,19 +15,27 @@ class FeatureExtractionService:
     
     def extract_features(self, file_paths: Dict[str, Path], 
                         segmentation_path: Path, case_id: str) -> Dict[str, Any]:
+        t1ce_img = volume_cache.load(file_paths['t1ce']).data
+        seg_img = volume_cache.load(segmentation_path).data
+        voxel_size = volume_cache.load(file_paths['flair']).zooms[:3]
+        return self.extract_features_from_arrays(t1ce_img, seg_img, voxel_size, case_id,
+                                                 roi=cropped_box(segmentation_path))
+    
+    def extract_features_from_arrays(self, t1ce_img: np.ndarray, seg_img: np.ndarray,
+                                     voxel_size: tuple, case_id: str,
+                                     roi: Optional[Tuple[slice, ...]] = None) -> Dict[str, Any]:
+        """
+        Compute clinical features from in-memory T1CE and label volumes;
+        `roi` is the box around the labels when already known.
+        """
         try:
-            t1_img = nib.load(file_paths['flair']).get_fdata()
-            t1ce_img = nib.load(file_paths['t1ce']).get_fdata()
-            seg_img = nib.load(segmentation_path).get_fdata()
-
-            header = nib.load(file_paths['flair']).header
-            voxel_size = header.get_zooms()
-
-            enhancing_tumor = (seg_img == 3).astype(int)
-            necrotic_core = (seg_img == 1).astype(int)
-            peritumoral_edema = (seg_img == 2).astype(int)
-            tumor_core = ((seg_img == 1) | (seg_img == 3)).astype(int)
-            whole_tumor = (seg_img > 0).astype(int)
+            regions = compute_label_statistics(seg_img, intensity=t1ce_img, roi=roi)
+            empty = RegionStats()
+            necrotic_core = regions.get(1, empty)
+            peritumoral_edema = regions.get(2, empty)
+            enhancing_tumor = regions.get(3, empty)
+            tumor_core = merge_regions(necrotic_core, enhancing_tumor)
+            whole_tumor = merge_regions(*regions.values())
 
             whole_voxels, whole_mm3 = self._calculate_volume_mm3(whole_tumor, voxel_size)
             core_voxels, core_mm3 = self._calculate_volume_mm3(tumor_core, voxel_size)
@@ -39,16 +47,16 @@ class FeatureExtractionService:
             core_diameter = self._calculate_max_diameter(tumor_core, voxel_size)
             enhancing_diameter = self._calculate_max_diameter(enhancing_tumor, voxel_size)
 
-            hemisphere, location, cent_x, cent_y, cent_z = self._get_location_info(whole_tumor)
+            hemisphere, location, cent_x, cent_y, cent_z = self._get_location_info(whole_tumor,
+                                                                                   seg_img.shape)
 
             enhancing_ratio = enhancing_mm3 / whole_mm3 if whole_mm3 > 0 else 0
             necrotic_ratio = necrotic_mm3 / whole_mm3 if whole_mm3 > 0 else 0
             edema_ratio = edema_mm3 / whole_mm3 if whole_mm3 > 0 else 0
 
             if enhancing_voxels > 0:
-                t1ce_enhancing = t1ce_img[enhancing_tumor > 0]
-                enhancement_mean = np.mean(t1ce_enhancing)
-                enhancement_max = np.max(t1ce_enhancing)
+                enhancement_mean = enhancing_tumor.intensity_mean
+                enhancement_max = enhancing_tumor.intensity_max
             else:
                 enhancement_mean = 0
                 enhancement_max = 0
@@ -88,30 +96,27 @@ class FeatureExtractionService:
             logger.error(f"Feature extraction failed for case {case_id}: {e}")
             raise
     
-    def _calculate_volume_mm3(self, mask, voxel_size):
+    def _calculate_volume_mm3(self, region: RegionStats, voxel_size):
 
-        volume_voxels = np.sum(mask)
+        volume_voxels = region.voxels
         volume_mm3 = volume_voxels * np.prod(voxel_size)
         return volume_voxels, volume_mm3
     
-    def _calculate_max_diameter(self, mask, voxel_size):
+    def _calculate_max_diameter(self, region: RegionStats, voxel_size):
 
-        if np.sum(mask) == 0:
+        if region.empty:
             return 0
-        props = measure.regionprops(mask.astype(int))[0]
-        bbox = props.bbox
-        bbox_dims = np.array([bbox[3]-bbox[0], bbox[4]-bbox[1], bbox[5]-bbox[2]]) * voxel_size
+        bbox_dims = region.extent * voxel_size
         return np.max(bbox_dims)
     
-    def _get_location_info(self, mask):
+    def _get_location_info(self, region: RegionStats, shape):
 
-        if np.sum(mask) == 0:
+        if region.empty:
             return 'none', 'none', 0, 0, 0
-        props = measure.regionprops(mask.astype(int))[0]
-        centroid = np.array(props.centroid)
-        hemisphere = 'left' if centroid[0] < mask.shape[0]/2 else 'right'
-        z_rel = centroid[2] / mask.shape[2]
-        y_rel = centroid[1] / mask.shape[1]
+        centroid = region.centroid
+        hemisphere = 'left' if centroid[0] < shape[0]/2 else 'right'
+        z_rel = centroid[2] / shape[2]
+        y_rel = centroid[1] / shape[1]
         if z_rel < 0.3:
             location = 'inferior'
         elif z_rel > 0.7:
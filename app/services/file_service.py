@@ -1,11 +1,23 @@
 # app/services/file_service.py
 import aiofiles
+import asyncio
+import hashlib
+import json
+import struct
 import uuid
+import zlib
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 from fastapi import UploadFile, HTTPException
 from app.core.config import settings
+from app.utils.volume_io import find_volume, write_working_copy
 import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+NIFTI_HEADER_SIZES = (348, 540)  # NIfTI-1 and NIfTI-2 sizeof_hdr
+GZIP_MAGIC = b"\x1f\x8b"
 
 class FileService:
     def __init__(self):
@@ -13,36 +25,124 @@ class FileService:
         self.output_dir = settings.OUTPUT_DIR
     
     
-    async def save_uploaded_files(self, files: Dict[str, UploadFile]) -> Dict[str, Path]:
+    async def save_uploaded_files(self, files: Dict[str, UploadFile]) -> Tuple[str, Dict[str, Path]]:
+
+        for file_type, file in files.items():
+            if not self._validate_file(file):
+                raise HTTPException(status_code=400, detail=f"Invalid file format for {file_type}")
 
         upload_id = str(uuid.uuid4())
         upload_path = self.upload_dir / upload_id
         upload_path.mkdir(exist_ok=True)
-        
+
+        try:
+            streams = [
+                asyncio.ensure_future(self._stream_to_disk(
+                    file_type, file, upload_path / f"{file_type}{self._suffix(file.filename)}"))
+                for file_type, file in files.items()
+            ]
+            try:
+                results = await asyncio.gather(*streams)
+            except BaseException:
+                # Stop the other modalities before their directory is removed
+                for stream in streams:
+                    stream.cancel()
+                await asyncio.gather(*streams, return_exceptions=True)
+                raise
+            # Decode each upload once; every stage then maps the uncompressed copy.
+            # Threads cannot be cancelled, so all of them finish before a failure is raised.
+            working_copies = await asyncio.gather(*(
+                asyncio.to_thread(self._ingest, file_type, file_path)
+                for file_type, file_path, _, _ in results
+            ), return_exceptions=True)
+            for outcome in working_copies:
+                if isinstance(outcome, BaseException):
+                    raise outcome
+        except BaseException:
+            shutil.rmtree(upload_path, ignore_errors=True)
+            raise
+
         saved_files = {}
-        
-        for file_type, file in files.items():
-            if not self._validate_file(file):
-                raise HTTPException(status_code=400, detail=f"Invalid file format for {file_type}")
-            
-            file_path = upload_path / f"{file_type}.nii.gz"
-            
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
-            
+        manifest = {}
+        for (file_type, file_path, digest, size), meta in zip(results, working_copies):
             saved_files[file_type] = file_path
-        
+            manifest[file_type] = {
+                'filename': files[file_type].filename,
+                'sha256': digest,
+                'size': size,
+                'shape': meta['shape'],
+                'dtype': meta['dtype']
+            }
+        (upload_path / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
         return upload_id, saved_files
-    
+
+    async def _stream_to_disk(self, file_type: str, file: UploadFile,
+                              file_path: Path) -> Tuple[str, Path, str, int]:
+        """
+        Copy an upload to disk in fixed-size chunks, hashing and size-checking as it goes.
+        Starlette has already spooled the multipart body by now, so this only enforces the
+        per-file limit; UploadSizeLimitMiddleware bounds the request while it is received.
+        """
+        sha256 = hashlib.sha256()
+        size = 0
+        compressed = file.filename.lower().endswith(".gz")
+
+        async with aiofiles.open(file_path, 'wb') as f:
+            while True:
+                chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not self._has_nifti_header(chunk, compressed):
+                    raise HTTPException(status_code=400,
+                                        detail=f"{file_type} is not a valid NIfTI file")
+                size += len(chunk)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413,
+                                        detail=f"{file_type} exceeds the {settings.MAX_FILE_SIZE} byte limit")
+                sha256.update(chunk)
+                await f.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail=f"{file_type} is empty")
+        return file_type, file_path, sha256.hexdigest(), size
+
+    def _ingest(self, file_type: str, file_path: Path) -> Dict[str, Any]:
+        try:
+            return write_working_copy(file_path)
+        except Exception as e:
+            logger.warning(f"Could not decode {file_type} upload {file_path}: {e}")
+            raise HTTPException(status_code=400,
+                                detail=f"{file_type} could not be read as a NIfTI volume")
+
+    @staticmethod
+    def _suffix(filename: Optional[str]) -> str:
+        """Keep the original container: gzipped uploads stay `.nii.gz`, plain ones `.nii`."""
+        return ".nii.gz" if (filename or "").lower().endswith(".gz") else ".nii"
+
+    def _has_nifti_header(self, chunk: bytes, compressed: bool) -> bool:
+        """Check the leading bytes of an upload for a NIfTI-1/2 header."""
+        if compressed:
+            if not chunk.startswith(GZIP_MAGIC):
+                return False
+            try:
+                chunk = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS).decompress(chunk, 4)
+            except zlib.error:
+                return False
+        if len(chunk) < 4:
+            return False
+        return any(struct.unpack(order + "i", chunk[:4])[0] in NIFTI_HEADER_SIZES
+                   for order in ("<", ">"))
+
     def _validate_file(self, file: UploadFile) -> bool:
 
-        if file.size > settings.MAX_FILE_SIZE:
+        # file.size is only a hint from the client; the limit is enforced while streaming
+        if file.size is not None and file.size > settings.MAX_FILE_SIZE:
             return False
-        
-        filename = file.filename.lower()
+
+        filename = (file.filename or "").lower()
         return any(filename.endswith(ext) for ext in settings.ALLOWED_EXTENSIONS)
-    
+
     def get_upload_files(self, upload_id: str) -> Optional[Dict[str, Path]]:
 
         upload_path = self.upload_dir / upload_id
@@ -51,12 +151,19 @@ class FileService:
         
         files = {}
         for file_type in ['flair', 't1ce', 't2']:
-            file_path = upload_path / f"{file_type}.nii.gz"
-            if file_path.exists():
+            file_path = find_volume(upload_path, file_type)
+            if file_path is not None:
                 files[file_type] = file_path
         
         return files if len(files) == 3 else None
     
+    def get_upload_manifest(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """Original filenames, sizes and SHA-256 digests recorded at upload time."""
+        manifest_path = self.upload_dir / upload_id / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        return json.loads(manifest_path.read_text())
+    
     def cleanup_upload(self, upload_id: str):
 
         upload_path = self.upload_dir / upload_id
@@ -0,0 +1,145 @@
+# app/services/inference_scheduler.py
+import threading
+import time
+import torch
+from collections import deque, Counter
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _InferenceRequest:
+    model: torch.nn.Module
+    inputs: torch.Tensor
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def batch_key(self):
+        return id(self.model), tuple(self.inputs.shape[1:]), self.inputs.dtype, self.inputs.device
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batching for concurrent model calls.
+
+    Callers block in `infer` while a single worker thread gathers requests
+    that share a model and input shape for up to `max_wait_ms`, concatenates
+    them into one forward pass of at most `max_batch_size` samples and hands
+    each caller its own slice of the output.
+    """
+
+    def __init__(self, max_batch_size: int = 4, max_wait_ms: float = 20.0):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Deque[_InferenceRequest] = deque()
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._batch_sizes: Counter = Counter()
+        self._requests = 0
+        self._batches = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._max_queue_depth = 0
+
+    def infer(self, model: torch.nn.Module, inputs: torch.Tensor) -> torch.Tensor:
+        """Run `model(inputs)` as part of a shared batch and return its outputs."""
+        request = _InferenceRequest(model, inputs)
+        with self._cond:
+            self._ensure_worker()
+            self._queue.append(request)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._cond.notify()
+        return request.future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_queue_depth,
+                'requests': self._requests,
+                'batches': self._batches,
+                'mean_batch_size': round(sum(k * v for k, v in self._batch_sizes.items())
+                                         / self._batches, 2) if self._batches else 0.0,
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'mean_wait_ms': round(self._total_wait / self._requests * 1000, 2)
+                                if self._requests else 0.0,
+                'max_wait_ms': round(self._max_wait_seen * 1000, 2),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_window_ms': self.max_wait * 1000,
+            }
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="inference-scheduler",
+                                            daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            self._execute(batch)
+
+    def _collect_batch(self) -> List[_InferenceRequest]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            first = self._queue.popleft()
+            batch = [first]
+            size = first.inputs.shape[0]
+            deadline = first.enqueued_at + self.max_wait
+
+            while size < self.max_batch_size:
+                match = next((r for r in self._queue if r.batch_key == first.batch_key
+                              and size + r.inputs.shape[0] <= self.max_batch_size), None)
+                if match is not None:
+                    self._queue.remove(match)
+                    batch.append(match)
+                    size += match.inputs.shape[0]
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return batch
+
+    def _execute(self, batch: List[_InferenceRequest]):
+        started = time.perf_counter()
+        try:
+            inputs = batch[0].inputs if len(batch) == 1 else torch.cat([r.inputs for r in batch])
+            with torch.no_grad():
+                outputs = batch[0].model(inputs)
+            del inputs
+        except Exception as e:
+            logger.error(f"Batched inference failed for {len(batch)} request(s): {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        samples = sum(request.inputs.shape[0] for request in batch)
+        if len(batch) == 1:
+            batch[0].future.set_result(outputs)
+        else:
+            # Copies, so one slow caller does not keep the whole batch's outputs alive
+            sizes = [request.inputs.shape[0] for request in batch]
+            for request, output in zip(batch, torch.split(outputs, sizes)):
+                request.future.set_result(output.clone())
+        del outputs
+
+        with self._cond:
+            self._batches += 1
+            self._batch_sizes[samples] += 1
+            self._requests += len(batch)
+            for request in batch:
+                wait = started - request.enqueued_at
+                self._total_wait += wait
+                self._max_wait_seen = max(self._max_wait_seen, wait)
+
+inference_scheduler = InferenceScheduler(
+    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS
+)
@@ -0,0 +1,150 @@
+# app/services/job_executor.py
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.models.schemas import JobPriority
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_RANK = {JobPriority.HIGH: 0, JobPriority.NORMAL: 1, JobPriority.LOW: 2}
+
+class QueueFullError(Exception):
+    """Raised when a stage queue has no room for another job."""
+
+    def __init__(self, stage: str, max_queue: int):
+        super().__init__(f"The {stage} queue is full ({max_queue} jobs waiting)")
+        self.stage = stage
+
+@dataclass(order=True)
+class _Job:
+    rank: int
+    seq: int
+    job_id: str = field(compare=False)
+    fn: Callable = field(compare=False)
+    args: Tuple = field(compare=False)
+    kwargs: Dict[str, Any] = field(compare=False)
+    future: Future = field(compare=False, default_factory=Future)
+
+class _Stage:
+    def __init__(self, name: str, concurrency: int, max_queue: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(1, max_queue)
+        self.queue: List[_Job] = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cond = threading.Condition()
+        self.workers: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            worker = threading.Thread(target=self._run, name=f"job-{self.name}-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                job = heapq.heappop(self.queue)
+                self.running += 1
+
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+                except BaseException as e:
+                    logger.error(f"Job {job.job_id} on {self.name} stage failed: {e}")
+                    job.future.set_exception(e)
+
+            with self.cond:
+                self.running -= 1
+                if job.future.cancelled() or job.future.exception() is not None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+class JobExecutor:
+    """
+    Runs pipeline jobs on per-stage worker pools.
+
+    Each stage (model inference, CPU post-processing, LLM I/O) has its own
+    concurrency limit and a bounded priority queue. When a queue is full new
+    work is refused with QueueFullError so the API can answer 429 instead of
+    piling more jobs onto an overloaded worker.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, int]]):
+        self._stages = {name: _Stage(name, *limit) for name, limit in limits.items()}
+        self._seq = itertools.count()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def submit(self, stage: str, fn: Callable, *args, job_id: str = "",
+               priority: JobPriority = JobPriority.NORMAL, force: bool = False,
+               **kwargs) -> Future:
+        """
+        Queue `fn(*args, **kwargs)` on a stage.
+
+        `force` bypasses the queue limit; it is meant for follow-up work of a
+        job that was already admitted.
+        """
+        self._ensure_started()
+        stage_pool = self._stages[stage]
+        job = _Job(PRIORITY_RANK[JobPriority(priority)], next(self._seq),
+                   job_id, fn, args, kwargs)
+
+        with stage_pool.cond:
+            if not force and len(stage_pool.queue) >= stage_pool.max_queue:
+                stage_pool.rejected += 1
+                raise QueueFullError(stage, stage_pool.max_queue)
+            heapq.heappush(stage_pool.queue, job)
+            stage_pool.cond.notify()
+        return job.future
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position of a waiting job within its stage, or None if it is not queued."""
+        for stage_pool in self._stages.values():
+            with stage_pool.cond:
+                ordered = sorted(stage_pool.queue)
+            for position, job in enumerate(ordered, start=1):
+                if job.job_id == job_id:
+                    return position
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for name, stage_pool in self._stages.items():
+            with stage_pool.cond:
+                stats[name] = {
+                    'concurrency': stage_pool.concurrency,
+                    'running': stage_pool.running,
+                    'queued': len(stage_pool.queue),
+                    'max_queue': stage_pool.max_queue,
+                    'completed': stage_pool.completed,
+                    'failed': stage_pool.failed,
+                    'rejected': stage_pool.rejected,
+                }
+        return stats
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                for stage_pool in self._stages.values():
+                    stage_pool.start()
+                self._started = True
+
+job_executor = JobExecutor({
+    'inference': (settings.JOB_INFERENCE_CONCURRENCY, settings.JOB_QUEUE_SIZE),
+    'cpu': (settings.JOB_CPU_CONCURRENCY, settings.JOB_QUEUE_SIZE),
+    'llm': (settings.JOB_LLM_CONCURRENCY, settings.JOB_QUEUE_SIZE),
+})
@@ -0,0 +1,254 @@
+# app/services/llm_client.py
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import httpx
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+def _describe(error: BaseException) -> str:
+    return str(error) or type(error).__name__
+
+class LLMError(Exception):
+    """Raised when the LLM endpoint gives no usable answer within the deadline."""
+
+class _RetryableError(LLMError):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LLMClient:
+    """
+    Shared async client for an OpenAI-compatible chat completions endpoint.
+
+    One pooled httpx.AsyncClient lives on a private event loop thread, so
+    worker threads of the job executor can call `complete()` synchronously
+    while every request still reuses kept-alive connections. A semaphore
+    caps in-flight requests across all callers; each call has an overall
+    deadline that also bounds its retries. Tokens are streamed and handed
+    to `on_delta` as they arrive.
+    """
+
+    def __init__(self, url: str, api_key: str, model: str,
+                 max_concurrency: int = 4, max_connections: int = 8,
+                 timeout: float = 120.0, connect_timeout: float = 10.0,
+                 max_retries: int = 3, backoff: float = 1.0,
+                 max_tokens: int = 1024, temperature: float = 0.7, top_p: float = 0.9):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_connections = max(1, max_connections)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'succeeded': 0, 'failed': 0, 'retries': 0,
+                       'in_flight': 0, 'tokens_streamed': 0}
+        self._ttft: List[float] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url and self.api_key)
+
+    def complete(self, prompt: str, on_delta: Optional[Callable[[str], None]] = None,
+                 timeout: Optional[float] = None) -> str:
+        """Blocking call for worker threads; must not be used from the client's loop."""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            self.acomplete(prompt, on_delta, timeout), loop
+        )
+        return future.result()
+
+    async def acomplete(self, prompt: str, on_delta: Optional[Callable[[str], None]] = None,
+                        timeout: Optional[float] = None) -> str:
+        deadline = time.monotonic() + (timeout or self.timeout)
+        payload = {
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperature,
+            'top_p': self.top_p,
+            'stream': True,
+        }
+        self._count('requests')
+
+        # Waiting for a free slot counts against the deadline too
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(),
+                                   max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._count('failed')
+            raise LLMError("LLM deadline exceeded waiting for a free request slot") from None
+        try:
+            self._count('in_flight')
+            try:
+                text = await self._with_retries(payload, on_delta, deadline)
+            except Exception:
+                self._count('failed')
+                raise
+            finally:
+                self._count('in_flight', -1)
+        finally:
+            self._semaphore.release()
+        self._count('succeeded')
+        return text
+
+    async def _with_retries(self, payload: Dict[str, Any],
+                            on_delta: Optional[Callable[[str], None]], deadline: float) -> str:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError("LLM deadline exceeded")
+            streamed = []
+            try:
+                return await asyncio.wait_for(self._stream(payload, on_delta, streamed), remaining)
+            except (_RetryableError, httpx.TransportError, asyncio.TimeoutError) as e:
+                # Once tokens reached the caller a retry would duplicate them
+                if streamed or attempt >= self.max_retries:
+                    raise LLMError(f"LLM request failed: {_describe(e)}") from e
+                retry_after = getattr(e, 'retry_after', None)
+                # Full jitter: sleep anywhere up to the exponential backoff
+                delay = retry_after or random.uniform(0, self.backoff * 2 ** attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise LLMError(f"LLM request failed: {_describe(e)}") from e
+                attempt += 1
+                self._count('retries')
+                logger.warning(f"LLM request failed ({_describe(e)}), "
+                               f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _stream(self, payload: Dict[str, Any],
+                      on_delta: Optional[Callable[[str], None]], streamed: List[str]) -> str:
+        started = time.monotonic()
+        headers = {'Authorization': f"Bearer {self.api_key}", 'Accept': 'text/event-stream'}
+        async with self._client.stream("POST", self.url, json=payload, headers=headers) as response:
+            if response.status_code in RETRYABLE_STATUS:
+                await response.aread()
+                raise _RetryableError(f"HTTP {response.status_code}",
+                                      self._retry_after(response.headers.get('retry-after')))
+            if response.status_code >= 400:
+                body = (await response.aread()).decode(errors='replace')[:200]
+                raise LLMError(f"HTTP {response.status_code}: {body}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    # Keep reading to the end of the body so the connection can be reused
+                    continue
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if chunk.get('error'):
+                    raise _RetryableError(str(chunk['error']))
+                choices = chunk.get('choices') or [{}]
+                delta = (choices[0].get('delta') or {}).get('content')
+                if not delta:
+                    continue
+                if not streamed:
+                    self._record_ttft(time.monotonic() - started)
+                streamed.append(delta)
+                self._count('tokens_streamed')
+                if on_delta is not None:
+                    try:
+                        on_delta(delta)
+                    except Exception as e:
+                        logger.error(f"LLM delta callback failed: {e}")
+        if not streamed:
+            raise _RetryableError("empty completion")
+        return "".join(streamed)
+
+    def close(self):
+        """Close pooled connections and stop the loop thread."""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            loop, thread = self._loop, self._thread
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+            self._loop = self._thread = self._client = self._semaphore = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+            ttft = sorted(self._ttft)
+        stats['max_concurrency'] = self.max_concurrency
+        stats['ttft_p50_s'] = round(ttft[len(ttft) // 2], 3) if ttft else None
+        stats['ttft_p95_s'] = round(ttft[int(len(ttft) * 0.95)], 3) if ttft else None
+        return stats
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._client = httpx.AsyncClient(
+                        timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_connections),
+                    )
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    ready.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="llm-client", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    @staticmethod
+    def _retry_after(value: Optional[str]) -> Optional[float]:
+        try:
+            return max(0.0, float(value)) if value else None
+        except ValueError:
+            return None
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _record_ttft(self, seconds: float):
+        with self._stats_lock:
+            self._ttft.append(seconds)
+            if len(self._ttft) > 1000:
+                del self._ttft[:500]
+
+llm_client = LLMClient(
+    url=settings.LLM_CHAT_URL,
+    api_key=settings.HUGGINGFACEHUB_ACCESS_TOKEN,
+    model=settings.MODEL_NAME,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    timeout=settings.LLM_TIMEOUT_SECONDS,
+    connect_timeout=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff=settings.LLM_RETRY_BACKOFF_SECONDS,
+    max_tokens=settings.LLM_MAX_TOKENS,
+)
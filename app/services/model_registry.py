@@ -0,0 +1,216 @@
+# app/services/model_registry.py
+import hashlib
+import os
+import threading
+import time
+import torch
+from pathlib import Path
+from typing import Callable, Dict, Any, Optional, Tuple
+from app.utils.inference_engines import (LabelPredictor, build_engine, configure_threads,
+                                         fold_batchnorm)
+from app.utils.quantization import (PRECISIONS, Bf16Autocast, artifact_paths, check_gate,
+                                    load_unet3d)
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+Model = Callable[[torch.Tensor], torch.Tensor]
+
+class ModelRegistry:
+    """
+    Loads each UNet3D checkpoint once per worker and shares it read-only,
+    prepared for the configured execution engine (INFERENCE_ENGINE).
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, str], Model] = {}
+        self._predictors: Dict[Tuple[str, str], LabelPredictor] = {}
+        self._stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+        # Separate from _lock: _load hashes the checkpoint while holding _lock
+        self._digest_lock = threading.Lock()
+
+    def get_model(self, model_path: Optional[str] = None,
+                  device: Optional[str] = None) -> Model:
+        key = self._key(model_path, device)
+        model = self._models.get(key)
+        if model is not None:
+            with self._lock:
+                self._count_hit(key)
+            return model
+
+        with self._lock:
+            # Another request may have finished loading while we waited
+            model = self._models.get(key)
+            if model is None:
+                model = self._load(*key)
+                self._models[key] = model
+            else:
+                self._count_hit(key)
+        return model
+
+    def get_label_predictor(self, model_path: Optional[str] = None,
+                            device: Optional[str] = None) -> LabelPredictor:
+        """uint8-label view of `get_model`, one per model so concurrent requests still batch."""
+        model = self.get_model(model_path, device)
+        key = self._key(model_path, device)
+        predictor = self._predictors.get(key)
+        if predictor is not None and predictor.model is model:
+            return predictor
+
+        with self._lock:
+            # Another request may have built it while we waited
+            predictor = self._predictors.get(key)
+            if predictor is None or predictor.model is not model:
+                predictor = LabelPredictor(model, settings.INFERENCE_LEAN,
+                                           settings.INFERENCE_LEAN_CHUNK_DEPTH)
+                self._predictors[key] = predictor
+                if key in self._stats:
+                    self._stats[key]['lean_labels'] = predictor.lean
+        return predictor
+
+    def warm_up(self, model_path: Optional[str] = None, device: Optional[str] = None):
+        """Load the checkpoint ahead of the first request."""
+        return self.get_model(model_path, device)
+
+    def unload(self, model_path: Optional[str] = None, device: Optional[str] = None) -> bool:
+        key = self._key(model_path, device)
+        with self._lock:
+            self._stats.pop(key, None)
+            self._predictors.pop(key, None)
+            return self._models.pop(key, None) is not None
+
+    def checkpoint_digest(self, model_path: Optional[str] = None) -> str:
+        """SHA-256 of the checkpoint file, recomputed only when the file changes."""
+        path = str(Path(model_path or settings.MODEL_PATH).resolve())
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self._digests.get(key)
+        if digest is not None:
+            return digest
+
+        with self._digest_lock:
+            # Another thread may have hashed this version while we waited
+            digest = self._digests.get(key)
+            if digest is None:
+                sha256 = hashlib.sha256()
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b""):
+                        sha256.update(block)
+                digest = sha256.hexdigest()
+                self._digests[key] = digest
+        return digest
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                f"{path}@{device}": dict(info)
+                for (path, device), info in self._stats.items()
+            }
+
+    @staticmethod
+    def _weight_bytes(model: torch.nn.Module) -> int:
+        """Size of the weights, including those a frozen ScriptModule keeps as graph constants."""
+        tensors = list(model.state_dict().values())
+        if isinstance(model, torch.jit.ScriptModule):
+            for node in model.graph.nodes():
+                if node.kind() != "prim::Constant":
+                    continue
+                value = node.output().toIValue()
+                if isinstance(value, torch.Tensor):
+                    tensors.append(value)
+                elif hasattr(value, "unpack"):
+                    # Packed quantized conv/linear params: (weight, bias)
+                    tensors += [t for t in value.unpack() if isinstance(t, torch.Tensor)]
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def _count_hit(self, key: Tuple[str, str]):
+        """Callers hold the lock; the model may have been unloaded in between."""
+        if key in self._stats:
+            self._stats[key]['hits'] += 1
+
+    def _key(self, model_path: Optional[str], device: Optional[str]) -> Tuple[str, str]:
+        path = str(Path(model_path or settings.MODEL_PATH).resolve())
+        return path, str(torch.device(device or settings.DEVICE))
+
+    def _load(self, model_path: str, device: str) -> Model:
+        precision = settings.INFERENCE_PRECISION
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown inference precision {precision!r}, "
+                             f"expected one of {', '.join(PRECISIONS)}")
+        start = time.perf_counter()
+        try:
+            gate = None
+            if precision != "fp32":
+                quantized_path, gate_path = artifact_paths(
+                    settings.MODEL_DIR, self.checkpoint_digest(model_path), precision)
+                gate = check_gate(gate_path, self.checkpoint_digest(model_path), precision,
+                                  settings.QUANTIZATION_MIN_DICE)
+            if precision == "int8":
+                # Already fused, quantized and frozen by quantize_model.py; the fp32
+                # checkpoint is not needed
+                model = torch.jit.load(str(quantized_path), map_location=device)
+            else:
+                model = load_unet3d(model_path, device)
+        except Exception as e:
+            logger.error(f"Failed to load model {model_path}: {e}")
+            raise
+
+        load_time = time.perf_counter() - start
+        weight_bytes = self._weight_bytes(model)
+
+        start = time.perf_counter()
+        example = torch.zeros((1, 3, *settings.SLIDING_WINDOW_PATCH_SIZE), device=device)
+        engine, folded = self.build_serving_engine(model, model_path, precision, example)
+        build_time = time.perf_counter() - start
+        engine_name = "torchscript" if precision == "int8" else settings.INFERENCE_ENGINE
+
+        self._stats[(model_path, device)] = {
+            'load_time_s': round(load_time, 3),
+            'engine': engine_name,
+            'precision': precision,
+            'gate_mean_dice': gate['mean_dice'] if gate else None,
+            'engine_build_time_s': round(build_time, 3),
+            'folded_batchnorms': folded,
+            'weight_bytes': weight_bytes,
+            'weight_mb': round(weight_bytes / (1024 * 1024), 2),
+            'loaded_at': time.time(),
+            'hits': 0,
+        }
+        logger.info(f"Model {model_path} loaded on {device} in {load_time:.2f}s "
+                    f"({weight_bytes / (1024 * 1024):.1f} MB of weights), "
+                    f"{precision} {engine_name} engine ready in {build_time:.2f}s")
+        return engine
+
+    def build_serving_engine(self, model: torch.nn.Module, model_path: str, precision: str,
+                             example: torch.Tensor) -> Tuple[Model, int]:
+        """
+        Prepare a loaded model exactly as it is served: INT8 modules are run
+        as saved, others are BN-folded and wrapped by build_engine. Returns
+        the engine and the number of folded BatchNorms.
+        """
+        if precision == "int8":
+            with torch.no_grad():
+                for _ in range(2):
+                    model(example)
+            return model, 0
+        folded = fold_batchnorm(model) if settings.INFERENCE_FOLD_BATCHNORM else 0
+        engine = build_engine(
+            Bf16Autocast(model) if precision == "bf16" else model,
+            settings.INFERENCE_ENGINE, example,
+            channels_last=settings.INFERENCE_CHANNELS_LAST,
+            onnx_path=(self._onnx_path(model_path, folded > 0, precision)
+                       if settings.INFERENCE_ENGINE == "onnxruntime" else None),
+            intra_op=settings.TORCH_NUM_THREADS, inter_op=settings.TORCH_NUM_INTEROP_THREADS
+        )
+        return engine, folded
+
+    def _onnx_path(self, model_path: str, folded: bool, precision: str) -> Path:
+        """Exports are keyed by checkpoint content, so workers reuse one file."""
+        digest = self.checkpoint_digest(model_path)[:16]
+        return settings.MODEL_DIR / "engines" / f"{digest}-{precision}{'-folded' if folded else ''}.onnx"
+
+configure_threads(settings.TORCH_NUM_THREADS, settings.TORCH_NUM_INTEROP_THREADS)
+model_registry = ModelRegistry()
@@ -0,0 +1,167 @@
+# app/services/pipeline_service.py
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Optional
+from app.models.schemas import JobPriority, TaskStatus
+from app.services.segmentation_service import SegmentationService, SegmentationResult
+from app.services.feature_extraction_service import FeatureExtractionService
+from app.services.report_service import ReportService
+from app.services.visualization_service import VisualizationService
+from app.services.task_service import TaskService
+from app.services.volume_cache import volume_cache
+from app.services.job_executor import job_executor
+from app.services.result_cache import result_cache
+from app.utils.volume_io import cropped_box
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PipelineService:
+    """
+    Runs segmentation, feature extraction and report generation as one job.
+
+    The DAG is:
+
+        segmentation (inference) -> overlays (cpu)
+                                 -> features (cpu) -> report text (llm) -> PDF
+
+    The predicted mask is handed to the later stages in memory, and the
+    overlays render while the LLM call is in flight. Only the report branch
+    waits on other futures, and it waits on CPU jobs that never wait
+    themselves, so the stage pools cannot deadlock.
+    """
+
+    def __init__(self, segmentation_service: SegmentationService,
+                 feature_service: FeatureExtractionService,
+                 report_service: ReportService,
+                 task_service: TaskService):
+        self.segmentation_service = segmentation_service
+        self.feature_service = feature_service
+        self.report_service = report_service
+        self.task_service = task_service
+
+    def submit(self, task_id: str, upload_id: str, file_paths: Dict[str, Path],
+               patient_info: Optional[Dict[str, str]] = None,
+               priority: JobPriority = JobPriority.NORMAL,
+               cache_key: Optional[str] = None, bypass_cache: bool = False) -> Future:
+        """Queue the pipeline; raises QueueFullError if the inference queue is full."""
+        return job_executor.submit(
+            "inference", self._run_segmentation, task_id, upload_id, file_paths,
+            patient_info or {}, priority, cache_key, bypass_cache,
+            job_id=task_id, priority=priority
+        )
+
+    def _run_segmentation(self, task_id: str, upload_id: str, file_paths: Dict[str, Path],
+                          patient_info: Dict[str, str], priority: JobPriority,
+                          cache_key: Optional[str], bypass_cache: bool):
+        started = time.perf_counter()
+        try:
+            self.task_service.update_task(task_id, TaskStatus.PROCESSING, 0.1,
+                                          "Running model prediction...")
+            segmentation = self.segmentation_service.segment(file_paths, task_id, cache_key)
+            timings = {'segmentation_s': time.perf_counter() - started}
+
+            self.task_service.update_task(task_id, progress=0.4,
+                                          message="Extracting features and rendering overlays...")
+
+            # Follow-up work of an admitted job; never refused for queue size
+            overlays = job_executor.submit("cpu", self._run_visualization, file_paths,
+                                           segmentation.output_path, cache_key,
+                                           job_id=task_id, priority=priority, force=True)
+            features = job_executor.submit("cpu", self._run_features, task_id, file_paths,
+                                           segmentation, cache_key, job_id=task_id,
+                                           priority=priority, force=True)
+            job_executor.submit("llm", self._run_report, task_id, upload_id, patient_info,
+                                segmentation, features, overlays, timings, started,
+                                bypass_cache, job_id=task_id, priority=priority, force=True)
+        except Exception as e:
+            logger.error(f"Pipeline task {task_id} failed: {e}")
+            self.task_service.update_task(task_id, TaskStatus.FAILED,
+                                          message=f"Pipeline failed: {str(e)}")
+
+    def _run_visualization(self, file_paths: Dict[str, Path], segmentation_path: Path,
+                           cache_key: Optional[str]):
+        started = time.perf_counter()
+        visualizations = result_cache.get_visualizations(cache_key) if cache_key else None
+        if visualizations is not None:
+            return visualizations, time.perf_counter() - started
+
+        visualizations = VisualizationService().create_case_figures(file_paths, segmentation_path)
+        if cache_key:
+            result_cache.put_visualizations(cache_key, visualizations)
+        return visualizations, time.perf_counter() - started
+
+    def _run_features(self, task_id: str, file_paths: Dict[str, Path],
+                      segmentation: SegmentationResult, cache_key: Optional[str]):
+        started = time.perf_counter()
+        features = result_cache.get_features(cache_key) if cache_key else None
+        if features is not None:
+            features['case_id'] = f"case_{task_id}"
+        else:
+            features = self.feature_service.extract_features_from_arrays(
+                volume_cache.load(file_paths['t1ce']).data,
+                segmentation.mask,
+                volume_cache.load(file_paths['flair']).zooms[:3],
+                f"case_{task_id}",
+                roi=cropped_box(segmentation.output_path)
+            )
+            if cache_key:
+                result_cache.put_features(cache_key, features)
+        features_path = settings.OUTPUT_DIR / f"{task_id}_features.csv"
+        self.feature_service.save_features_to_csv(features, features_path)
+        return features, features_path, time.perf_counter() - started
+
+    def _run_report(self, task_id: str, upload_id: str, patient_info: Dict[str, str],
+                    segmentation: SegmentationResult, features_future: Future,
+                    overlays_future: Future, timings: Dict[str, float], started: float,
+                    bypass_cache: bool = False):
+        try:
+            features, features_path, timings['features_s'] = features_future.result()
+            self.task_service.update_task(task_id, progress=0.6,
+                                          message="Generating AI report...")
+
+            text_started = time.perf_counter()
+            report_text = self.report_service.generate_report_text(
+                features, patient_info, task_id,
+                on_delta=lambda text: self.task_service.publish_event(task_id, {'report_delta': text}),
+                bypass_cache=bypass_cache
+            )
+            timings['report_text_s'] = time.perf_counter() - text_started
+
+            visualizations, timings['visualization_s'] = overlays_future.result()
+            self.task_service.update_task(task_id, progress=0.8,
+                                          message="Creating PDF report...")
+
+            pdf_started = time.perf_counter()
+            report_data = self.report_service.generate_report(
+                features, patient_info, task_id,
+                segmentation_path=segmentation.output_path,
+                report_text=report_text, visualizations=visualizations
+            )
+            pdf_path = settings.REPORTS_DIR / f"{task_id}_comprehensive_report.pdf"
+            self.report_service.generate_pdf_report(report_data, pdf_path)
+            timings['pdf_s'] = time.perf_counter() - pdf_started
+            timings['total_s'] = time.perf_counter() - started
+
+            # Overlays are returned once at the top level
+            report_data.pop('visualizations', None)
+            self.task_service.update_task(task_id, TaskStatus.COMPLETED, 1.0,
+                                          "Pipeline completed successfully",
+                                          {
+                                              "upload_id": upload_id,
+                                              "output_path": str(segmentation.output_path),
+                                              "features_path": str(features_path),
+                                              "pdf_path": str(pdf_path),
+                                              "features": features,
+                                              "visualizations": visualizations,
+                                              "report_data": report_data,
+                                              "timings": {k: round(v, 3) for k, v in timings.items()}
+                                          })
+            logger.info(f"Pipeline task {task_id} finished in {timings['total_s']:.2f}s")
+
+        except Exception as e:
+            logger.error(f"Pipeline task {task_id} failed: {e}")
+            self.task_service.update_task(task_id, TaskStatus.FAILED,
+                                          message=f"Pipeline failed: {str(e)}")
@@ -0,0 +1,153 @@
+# app/services/render_store.py
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_ID = re.compile(r"[0-9a-f]{64}")
+
+def image_url(key: str) -> str:
+    return f"{settings.API_V1_STR}/visualizations/{key}"
+
+def image_key(url: str) -> str:
+    """Inverse of `image_url`; also accepts a bare key."""
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+class RenderStore:
+    """
+    Disk store of rendered figures (PNG or WebP) shared by every pipeline stage.
+
+    Keys are built from the inputs of a render - segmentation and source
+    file identity, modality, slice selection and render parameters - so the
+    segmentation stage renders an overlay once and report generation only
+    reads it back. The time each figure took to render is kept next to it,
+    which lets the store report how much rendering its hits saved.
+
+    Stored images never change under a key, so they are also what the image
+    endpoint serves; task results only carry their URLs.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._render_seconds = 0.0
+        self._saved_seconds = 0.0
+
+    @staticmethod
+    def key(**parts: Any) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def lookup(self, key: str) -> bool:
+        """Whether a finished image exists for `key`; counted as a hit or miss."""
+        path = self._path(key)
+        try:
+            meta = json.loads(path.with_suffix(".json").read_text())
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._misses += 1
+            return False
+        with self._lock:
+            self._hits += 1
+            self._saved_seconds += meta.get('render_s', 0.0)
+            entries = self._load_index()
+            if key in entries:
+                entries.move_to_end(key)
+        return True
+
+    def open(self, key: str) -> Optional[Tuple[Path, str]]:
+        """Path and media type of a stored image, for serving it."""
+        if not IMAGE_ID.fullmatch(key):
+            return None
+        path = self._path(key)
+        try:
+            meta = json.loads(path.with_suffix(".json").read_text())
+        except (OSError, ValueError):
+            return None
+        return (path, meta.get('media_type', 'image/png')) if path.exists() else None
+
+    def reuse(self, urls: Iterable[str]) -> bool:
+        """Whether every image behind these URLs is still stored, counting each as a hit."""
+        keys = [image_key(url) for url in urls]
+        return all(IMAGE_ID.fullmatch(key) for key in keys) and all(self.lookup(key) for key in keys)
+
+    def read(self, key: str) -> Optional[bytes]:
+        found = self.open(key)
+        if found is None:
+            return None
+        try:
+            return found[0].read_bytes()
+        except OSError:
+            return None
+
+    def put(self, key: str, image: bytes, render_seconds: float, media_type: str = "image/png"):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(image)
+            os.replace(tmp, path)
+            meta = {'render_s': render_seconds, 'media_type': media_type}
+            path.with_suffix(".json").write_text(json.dumps(meta))
+        except OSError as e:
+            logger.error(f"Failed to store render {key}: {e}")
+            return
+
+        with self._lock:
+            self._render_seconds += render_seconds
+            entries = self._load_index()
+            self._bytes -= entries.pop(key, 0)
+            entries[key] = len(image)
+            self._bytes += len(image)
+            while self._bytes > self.max_bytes and len(entries) > 1:
+                evicted, size = entries.popitem(last=False)
+                for stale in (self._path(evicted), self._path(evicted).with_suffix(".json")):
+                    stale.unlink(missing_ok=True)
+                self._bytes -= size
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._load_index()
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+                'render_seconds': round(self._render_seconds, 3),
+                'saved_render_seconds': round(self._saved_seconds, 3),
+            }
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.img"
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        if self._entries is None:
+            found = []
+            if self.root.exists():
+                for image in self.root.glob("*/*.img"):
+                    stat = image.stat()
+                    found.append((stat.st_mtime, image.stem, stat.st_size))
+            self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+            self._bytes = sum(self._entries.values())
+        return self._entries
+
+render_store = RenderStore(settings.RENDER_DIR, settings.RENDER_STORE_MAX_BYTES)
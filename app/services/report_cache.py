@@ -0,0 +1,148 @@
+# app/services/report_cache.py
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ReportTextCache:
+    """
+    Persistent memo of LLM report text.
+
+    Keys hash what the model actually sees - the formatted features and
+    patient info - with the per-task case ID and report date masked out,
+    together with the model name and prompt version. Those two volatile
+    values are stored alongside the text and swapped for the current ones
+    on a hit. Entries expire after `ttl` seconds and the least recently
+    used ones are dropped beyond `max_entries`.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS report_text (
+            key TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            model TEXT NOT NULL,
+            case_id TEXT,
+            report_date TEXT,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_report_text_last_used ON report_text(last_used_at);
+        CREATE INDEX IF NOT EXISTS idx_report_text_expires_at ON report_text(expires_at);
+    """
+
+    def __init__(self, db_path: Path, ttl: int, max_entries: int, enabled: bool = True):
+        self.db_path = Path(db_path)
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.enabled = enabled
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+
+    @staticmethod
+    def key(features_text: str, patient_text: str, model: str, prompt_version: str,
+            case_id: str) -> str:
+        normalized = features_text.replace(case_id, "<case>") if case_id else features_text
+        normalized = "\n".join(" ".join(line.split()) for line in normalized.strip().splitlines())
+        patient = "\n".join(sorted(" ".join(line.split()) for line in patient_text.splitlines()))
+        payload = "\x1f".join([prompt_version, model, normalized, patient])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str, case_id: str = "", report_date: str = "") -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT text, case_id, report_date FROM report_text "
+                               "WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE report_text SET last_used_at = ? WHERE key = ?", (now, key))
+        self._count(hit=row is not None)
+        if row is None:
+            return None
+        return self._substitute(row['text'], {row['case_id']: case_id,
+                                              row['report_date']: report_date})
+
+    def put(self, key: str, text: str, model: str, case_id: str = "", report_date: str = ""):
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO report_text (key, text, model, case_id, report_date, "
+                    "created_at, last_used_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, text, model, case_id, report_date, now, now, now + self.ttl)
+                )
+                conn.execute("DELETE FROM report_text WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM report_text WHERE key IN (SELECT key FROM report_text "
+                    "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            # A missed write only costs a future LLM call
+            logger.error(f"Failed to cache report text: {e}")
+
+    def record_bypass(self):
+        with self._stats_lock:
+            self._bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        entries = 0
+        if self.enabled:
+            entries = self._connection().execute("SELECT COUNT(*) FROM report_text").fetchone()[0]
+        with self._stats_lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'bypassed': self._bypassed,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    with conn:
+                        conn.executescript(self.SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    @staticmethod
+    def _substitute(text: str, replacements: Dict[Optional[str], str]) -> str:
+        for old, new in replacements.items():
+            if old and new and old != new:
+                text = text.replace(old, new)
+        return text
+
+report_text_cache = ReportTextCache(settings.REPORT_CACHE_DB_PATH, settings.REPORT_CACHE_TTL_SECONDS,
+                                    settings.REPORT_CACHE_MAX_ENTRIES, settings.REPORT_CACHE_ENABLED)
@@ -1,9 +1,8 @@
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional
 from pathlib import Path
 from datetime import datetime
-from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 from langchain.prompts import PromptTemplate
 from reportlab.lib.pagesizes import A4, letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
@@ -11,35 +10,30 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-import matplotlib.pyplot as plt
-import seaborn as sns
+from matplotlib.figure import Figure
 import io
 import base64
 from PIL import Image as PILImage
 
 from app.core.config import settings
 from app.services.visualization_service import VisualizationService
+from app.services.llm_client import llm_client
+from app.services.report_cache import report_text_cache
+from app.services.render_store import image_key, render_store
+from app.services.slice_ranking import get_slice_ranking
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever the prompt template or post-processing changes so cached report text is not reused
+REPORT_PROMPT_VERSION = "1"
+
 class ReportService:
     def __init__(self):
         self.report_prompt = self._create_report_prompt()
         self.visualization_service = VisualizationService()
-        try:
-            self.llm_endpoint = HuggingFaceEndpoint(
-                repo_id=settings.MODEL_NAME,
-                huggingfacehub_api_token=settings.HUGGINGFACEHUB_ACCESS_TOKEN,
-                temperature=0.7,
-                max_new_tokens=1024,
-                top_p=0.9,
-                repetition_penalty=1.1,
-            )
-            self.chat_model = ChatHuggingFace(llm=self.llm_endpoint)
-            logger.info(f"ReportService initialized successfully with model: {settings.MODEL_NAME}")
-        except Exception as e:
-            logger.error(f"Failed to initialize ReportService: {e}")
-            self.chat_model = None
+        # Shared by every ReportService so connections are pooled across requests
+        self.llm_client = llm_client
+        self.report_cache = report_text_cache
     
     def _create_report_prompt(self) -> PromptTemplate:
 
@@ -107,19 +101,16 @@ Use proper medical terminology and ensure each section is clearly formatted with
             template=template
         )
     
-    def _generate_ai_report(self, prompt: str) -> str:
+    def _generate_ai_report(self, prompt: str,
+                            on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """LLM report text, or None when the fallback report has to be used."""
 
         try:
-            if self.chat_model is None:
-                logger.warning("Chat model not initialized, using enhanced fallback")
-                return self._generate_enhanced_fallback_report()
+            if not self.llm_client.enabled:
+                logger.warning("LLM client not configured, using enhanced fallback")
+                return None
 
-            response = self.chat_model.invoke(prompt)
-
-            if hasattr(response, 'content'):
-                report_text = response.content.strip()
-            else:
-                report_text = str(response).strip()
+            report_text = self.llm_client.complete(prompt, on_delta).strip()
             
             report_text = self._post_process_report(report_text)
             logger.info("AI repsponce post processing been started")
@@ -128,7 +119,7 @@ Use proper medical terminology and ensure each section is clearly formatted with
                 
         except Exception as e:
             logger.error(f"Error generating AI report: {e}")
-            return self._generate_enhanced_fallback_report()
+            return None
     
     def _post_process_report(self, report: str) -> str:
         report = report.replace('#', '').replace('*', '')
@@ -195,45 +186,89 @@ Comprehensive tissue characterization completed:
 
 This analysis provides objective quantitative data to support clinical decision-making and should be integrated with comprehensive patient evaluation."""
     
+    def generate_report_text(self, features: Dict[str, Any],
+                             patient_info: Optional[Dict[str, str]] = None,
+                             task_id: str = "",
+                             on_delta: Optional[Callable[[str], None]] = None,
+                             bypass_cache: bool = False) -> str:
+        """
+        Ask the LLM for the report body; `on_delta` receives text as it streams in.
+
+        Text for identical features and patient info is served from the report
+        cache unless `bypass_cache` is set, in which case it is regenerated and
+        the cached copy refreshed.
+        """
+        features_formatted = self._format_features_for_report(features)
+        patient_info_str = self._format_patient_info(patient_info or {})
+        report_date = datetime.now().strftime("%B %d, %Y at %I:%M %p")
+        case_id = str(features.get('case_id', ''))
+        cache_key = self.report_cache.key(features_formatted, patient_info_str,
+                                          settings.MODEL_NAME, REPORT_PROMPT_VERSION, case_id)
+        
+        if bypass_cache:
+            self.report_cache.record_bypass()
+        else:
+            cached = self.report_cache.get(cache_key, case_id, report_date)
+            if cached is not None:
+                logger.info(f"Using cached report text for task {task_id}")
+                if on_delta is not None:
+                    on_delta(cached)
+                return cached
+        
+        formatted_prompt = self.report_prompt.format(
+            features_json=features_formatted,
+            patient_info=patient_info_str,
+            report_date=report_date
+        )
+        
+        logger.info(f"Generating structured AI report for task {task_id}")
+        report_text = self._generate_ai_report(formatted_prompt, on_delta)
+        if report_text is None:
+            return self._generate_enhanced_fallback_report()
+        
+        self.report_cache.put(cache_key, report_text, settings.MODEL_NAME, case_id, report_date)
+        return report_text
+    
     def generate_report(self, features: Dict[str, Any], 
                        patient_info: Optional[Dict[str, str]] = None,
                        task_id: str = "",
                        file_paths: Optional[Dict[str, Path]] = None,
-                       segmentation_path: Optional[Path] = None) -> Dict[str, Any]:
+                       segmentation_path: Optional[Path] = None,
+                       report_text: Optional[str] = None,
+                       visualizations: Optional[Dict[str, str]] = None,
+                       on_delta: Optional[Callable[[str], None]] = None,
+                       bypass_cache: bool = False) -> Dict[str, Any]:
+        """
+        Assemble report data. `report_text` and `visualizations` may be passed
+        in when a caller already produced them concurrently.
+        """
 
         try:
-            features_formatted = self._format_features_for_report(features)
-            patient_info_str = self._format_patient_info(patient_info or {})
-            report_date = datetime.now().strftime("%B %d, %Y at %I:%M %p")
-            
-            formatted_prompt = self.report_prompt.format(
-                features_json=features_formatted,
-                patient_info=patient_info_str,
-                report_date=report_date
-            )
-            
-            logger.info(f"Generating structured AI report for task {task_id}")
-
-            report_text = self._generate_ai_report(formatted_prompt)
-
-            visualizations = {}
-            if file_paths and segmentation_path:
-                visualizations = self.visualization_service.create_all_modality_overlays(
-                    file_paths, segmentation_path
-                )
-
-                visualizations['3d_volume'] = self.visualization_service.create_3d_volume_visualization(
-                    segmentation_path
-                )
+            if report_text is None:
+                report_text = self.generate_report_text(features, patient_info, task_id,
+                                                        on_delta, bypass_cache)
+
+            if visualizations is None:
+                visualizations = {}
+                if file_paths and segmentation_path:
+                    # Served from the render store when the segmentation stage already drew them
+                    visualizations = self.visualization_service.create_case_figures(
+                        file_paths, segmentation_path
+                    )
+
+            key_slices = {}
+            if segmentation_path:
+                key_slices = get_slice_ranking(segmentation_path).key_slices()
         
             report_data = {
                 "report_text": report_text,
                 "features": features,
                 "patient_info": patient_info or {},
                 "visualizations": visualizations,
+                "key_slices": key_slices,
                 "generated_at": datetime.now().isoformat(),
                 "task_id": task_id,
-                "model_used": "Qwen/Qwen3-Coder-30B-A3B-Instruct" if self.chat_model else "enhanced_fallback"
+                "model_used": settings.MODEL_NAME if self.llm_client.enabled else "enhanced_fallback"
             }
             
             logger.info(f"Comprehensive AI report generated successfully for task {task_id}")
@@ -316,9 +351,10 @@ TISSUE MARKERS:
         charts = {}
         
         try:
-            plt.style.use('default')
-            sns.set_palette("Set2")
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+            # Standalone Figures, not pyplot: reports render concurrently and pyplot's
+            # current-figure state is global. Every chart sets its own colors.
+            fig = Figure(figsize=(15, 6))
+            ax1, ax2 = fig.subplots(1, 2)
             volumes = [
                 features['enhancing_volume_cm3'],
                 features['necrotic_volume_cm3'],
@@ -356,14 +392,14 @@ TISSUE MARKERS:
                     ax2.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.02,
                            f'{value:.2f}', ha='center', va='bottom', fontweight='bold')
             
-            plt.tight_layout()
+            fig.tight_layout()
             
             buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
+            fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
             buffer.seek(0)
             charts['volume_analysis'] = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+            fig = Figure(figsize=(15, 6))
+            ax1, ax2 = fig.subplots(1, 2)
             enhancement_data = {
                 'Enhancement %': features['enhancing_percentage'],
                 'Necrosis %': features['necrotic_percentage'], 
@@ -407,14 +443,14 @@ TISSUE MARKERS:
                     ha='center', va='bottom', fontweight='bold', 
                     bbox=dict(boxstyle="round,pad=0.3", facecolor='yellow', alpha=0.7))
             
-            plt.tight_layout()
+            fig.tight_layout()
             
             buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
+            fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
             buffer.seek(0)
             charts['classification_analysis'] = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            fig, ax = plt.subplots(figsize=(12, 8))
+            fig = Figure(figsize=(12, 8))
+            ax = fig.subplots()
             ax.axis('tight')
             ax.axis('off')
             summary_data = [
@@ -449,10 +485,9 @@ TISSUE MARKERS:
             ax.set_title('Clinical Summary Table', fontsize=16, fontweight='bold', pad=20)
             
             buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
+            fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
             buffer.seek(0)
             charts['clinical_summary'] = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
             
         except Exception as e:
             logger.error(f"Error creating enhanced visualizations: {e}")
@@ -572,7 +607,9 @@ TISSUE MARKERS:
                 if viz_data and modality != '3d_volume':
                     story.append(Paragraph(f"{modality.upper()} Segmentation Overlay", heading_style))
                     try:
-                        img_data = base64.b64decode(viz_data)
+                        img_data = render_store.read(image_key(viz_data))
+                        if img_data is None:
+                            raise FileNotFoundError(f"image {viz_data} is no longer stored")
                         img_buffer = io.BytesIO(img_data)
                         img = Image(img_buffer, width=6*inch, height=4*inch)
                         story.append(img)
@@ -583,13 +620,23 @@ TISSUE MARKERS:
             if '3d_volume' in visualizations and visualizations['3d_volume']:
                 story.append(Paragraph("3D Volume Analysis", heading_style))
                 try:
-                    img_data = base64.b64decode(visualizations['3d_volume'])
+                    img_data = render_store.read(image_key(visualizations['3d_volume']))
+                    if img_data is None:
+                        raise FileNotFoundError("3D view is no longer stored")
                     img_buffer = io.BytesIO(img_data)
                     img = Image(img_buffer, width=7*inch, height=5*inch)
                     story.append(img)
                     story.append(Spacer(1, 0.2*inch))
                 except Exception as e:
                     logger.error(f"Error adding 3D visualization: {e}")
+
+            key_slices = report_data.get('key_slices') or {}
+            if key_slices:
+                story.append(Paragraph(
+                    "Key slices (largest tumor cross-section): " +
+                    ", ".join(f"{axis} {index}" for axis, index in key_slices.items()),
+                    body_style
+                ))
             
             story.append(PageBreak())
 
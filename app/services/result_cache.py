@@ -0,0 +1,212 @@
+# app/services/result_cache.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+from app.services.model_registry import model_registry
+from app.services.render_store import render_store
+from app.services.task_store import dumps
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+MASK_FILE = "segmentation.nii.gz"
+ARTIFACTS = ('mask', 'features', 'visualizations')
+
+class ResultCache:
+    """
+    Content-addressed store of finished results on disk.
+
+    A key combines the SHA-256 of the three modality files, the checkpoint
+    digest and the inference settings, so re-uploading the same study with
+    the same model reuses the mask, features and overlays. Entries live in
+    one directory per key; when the total size exceeds `max_bytes` the least
+    recently used entries are removed. Directory mtimes record last use, so
+    the LRU order survives restarts.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, enabled: bool = True):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = {name: 0 for name in ARTIFACTS}
+        self._misses = {name: 0 for name in ARTIFACTS}
+        self._evictions = 0
+
+    def key_for_manifest(self, manifest: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Cache key for an upload manifest, or None if caching does not apply."""
+        if not self.enabled or not manifest:
+            return None
+        try:
+            file_hashes = {m: manifest[m]['sha256'] for m in ('flair', 't1ce', 't2')}
+            identity = {
+                'files': file_hashes,
+                'checkpoint': model_registry.checkpoint_digest(),
+                'inference_mode': settings.INFERENCE_MODE,
+                'sliding_window': [list(settings.SLIDING_WINDOW_PATCH_SIZE),
+                                   settings.SLIDING_WINDOW_OVERLAP,
+                                   settings.SLIDING_WINDOW_BLEND_MODE],
+            }
+        except (KeyError, OSError) as e:
+            logger.warning(f"Result cache disabled for this upload: {e}")
+            return None
+        # Reduced-precision masks may differ; fp32 keys stay as they were
+        if settings.INFERENCE_PRECISION != "fp32":
+            identity['precision'] = settings.INFERENCE_PRECISION
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def get_mask(self, key: str) -> Optional[Path]:
+        path = self._entry_dir(key) / MASK_FILE
+        return path if self._hit('mask', key, path) else None
+
+    def copy_mask(self, key: str, output_path: Path) -> bool:
+        """Materialise a cached mask at `output_path`; False on a miss."""
+        cached = self.get_mask(key)
+        if cached is None:
+            return False
+        try:
+            os.link(cached, output_path)
+        except FileNotFoundError:
+            # Evicted since the lookup; the caller recomputes
+            return False
+        except OSError:
+            try:
+                shutil.copyfile(cached, output_path)
+            except OSError as e:
+                logger.warning(f"Could not copy cached mask {cached}: {e}")
+                Path(output_path).unlink(missing_ok=True)
+                return False
+        return True
+
+    def put_mask(self, key: str, mask_path: Path):
+        def write(tmp_path: Path):
+            shutil.copyfile(mask_path, tmp_path)
+        self._put(key, MASK_FILE, write)
+
+    def get_features(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._get_json('features', key)
+
+    def put_features(self, key: str, features: Dict[str, Any]):
+        self._put_json('features', key, features)
+
+    def get_visualizations(self, key: str) -> Optional[Dict[str, str]]:
+        visualizations = self._get_json('visualizations', key)
+        # Entries hold image URLs; once the images are evicted they must be rendered again
+        if visualizations and not render_store.reuse(visualizations.values()):
+            return None
+        return visualizations
+
+    def put_visualizations(self, key: str, visualizations: Dict[str, str]):
+        self._put_json('visualizations', key, visualizations)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._load_index()
+            stats = {
+                'enabled': self.enabled,
+                'entries': len(entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self._evictions,
+            }
+            for name in ARTIFACTS:
+                lookups = self._hits[name] + self._misses[name]
+                stats[name] = {
+                    'hits': self._hits[name],
+                    'misses': self._misses[name],
+                    'hit_rate': round(self._hits[name] / lookups, 3) if lookups else 0.0,
+                }
+            return stats
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _hit(self, name: str, key: str, path: Path) -> bool:
+        with self._lock:
+            found = path.exists()
+            if found:
+                self._hits[name] += 1
+                self._touch(key)
+            else:
+                self._misses[name] += 1
+            return found
+
+    def _get_json(self, name: str, key: str) -> Optional[Any]:
+        path = self._entry_dir(key) / f"{name}.json"
+        if not self._hit(name, key, path):
+            return None
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            # Evicted between the check and the read, or a torn file
+            logger.warning(f"Discarding cached {name} for {key}: {e}")
+            return None
+
+    def _put_json(self, name: str, key: str, value: Any):
+        def write(tmp_path: Path):
+            tmp_path.write_text(dumps(value))
+        self._put(key, f"{name}.json", write)
+
+    def _put(self, key: str, filename: str, write):
+        entry_dir = self._entry_dir(key)
+        try:
+            entry_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = entry_dir / f".{filename}.{threading.get_ident()}.tmp"
+            write(tmp_path)
+            os.replace(tmp_path, entry_dir / filename)
+        except OSError as e:
+            logger.error(f"Failed to cache {filename} for {key}: {e}")
+            return
+
+        with self._lock:
+            entries = self._load_index()
+            self._bytes -= entries.pop(key, 0)
+            entries[key] = self._dir_size(entry_dir)
+            self._bytes += entries[key]
+            self._touch(key)
+            self._evict()
+
+    def _touch(self, key: str):
+        entries = self._load_index()
+        if key in entries:
+            entries.move_to_end(key)
+            try:
+                os.utime(self._entry_dir(key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        entries = self._load_index()
+        while self._bytes > self.max_bytes and len(entries) > 1:
+            key, size = entries.popitem(last=False)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._bytes -= size
+            self._evictions += 1
+            logger.info(f"Evicted cached result {key} ({size} bytes)")
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        if self._entries is None:
+            found = []
+            if self.root.exists():
+                for entry_dir in self.root.glob("*/*"):
+                    if entry_dir.is_dir():
+                        found.append((entry_dir.stat().st_mtime, entry_dir.name,
+                                      self._dir_size(entry_dir)))
+            self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+            self._bytes = sum(self._entries.values())
+        return self._entries
+
+    @staticmethod
+    def _dir_size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+result_cache = ResultCache(settings.RESULT_CACHE_DIR, settings.RESULT_CACHE_MAX_BYTES,
+                           settings.RESULT_CACHE_ENABLED)
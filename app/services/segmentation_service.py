@@ -1,57 +1,132 @@
 # app/services/segmentation_service.py
 import torch
 import numpy as np
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Tuple
-from app.models.unet3d import UNet3D
-from app.utils.preprocessing import ImagePreprocessor
+from typing import Dict, Optional, Tuple
+from app.services.model_registry import model_registry
+from app.services.inference_scheduler import inference_scheduler
+from app.services.volume_cache import volume_cache
+from app.services.slice_ranking import save_slice_ranking
+from app.services.result_cache import result_cache
+from app.utils.label_statistics import nonzero_box
+from app.utils.preprocessing import ImagePreprocessor, CROP_SOURCE_SHAPE
 from app.utils.postprocessing import PostProcessor
+from app.utils.sliding_window import SlidingWindowInferer
+from app.utils.volume_io import write_cropped_copy
 from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class SegmentationResult:
+    output_path: Path
+    mask: np.ndarray
+    affine: np.ndarray
+
 class SegmentationService:
     def __init__(self):
         self.device = torch.device(settings.DEVICE)
         self.model = None
-        self.preprocessor = ImagePreprocessor()
+        self.label_predictor = None
+        self.preprocessor = ImagePreprocessor(volume_cache)
         self.postprocessor = PostProcessor()
+        self.inferer = SlidingWindowInferer(
+            patch_size=settings.SLIDING_WINDOW_PATCH_SIZE,
+            overlap=settings.SLIDING_WINDOW_OVERLAP,
+            batch_size=settings.SLIDING_WINDOW_BATCH_SIZE,
+            blend_mode=settings.SLIDING_WINDOW_BLEND_MODE
+        )
         self._load_model()
     
     def _load_model(self):
+        self.model = model_registry.get_model(settings.MODEL_PATH, settings.DEVICE)
+        self.label_predictor = model_registry.get_label_predictor(settings.MODEL_PATH,
+                                                                  settings.DEVICE)
+    
+    def _forward(self, inputs: torch.Tensor) -> torch.Tensor:
+        if settings.INFERENCE_BATCHING:
+            return inference_scheduler.infer(self.model, inputs)
+        with torch.no_grad():
+            return self.model(inputs)
 
-        try:
-            self.model = UNet3D(in_channels=3, out_channels=4)
-            checkpoint = torch.load(settings.MODEL_PATH, map_location=self.device)
-            self.model.load_state_dict(checkpoint['model'])
-            self.model.to(self.device)
-            self.model.eval()
-            logger.info("Model loaded successfully")
-        except Exception as e:
-            logger.error(f"Failed to load model: {e}")
-            raise
+    def _forward_labels(self, inputs: torch.Tensor) -> torch.Tensor:
+        if settings.INFERENCE_BATCHING:
+            return inference_scheduler.infer(self.label_predictor, inputs)
+        with torch.no_grad():
+            return self.label_predictor(inputs)
     
-    def predict(self, file_paths: Dict[str, Path], task_id: str) -> Path:
+    def _use_crop(self, flair_path: Path) -> bool:
+        if settings.INFERENCE_MODE == "sliding_window":
+            return False
+        shape = self.preprocessor.get_shape(flair_path)
+        if shape != CROP_SOURCE_SHAPE:
+            logger.warning(f"Volume shape {shape} does not match the crop ROI, "
+                           f"falling back to sliding-window inference")
+            return False
+        return True
+    
+    def _index_mask(self, output_path: Path, mask: np.ndarray, affine: np.ndarray, zooms):
+        """Tumor bounding box, cropped working copy and slice ranking of a saved mask."""
+        roi = nonzero_box(mask)
+        if settings.MASK_CROPPED_COPY:
+            write_cropped_copy(output_path, mask, affine, zooms, roi)
+        save_slice_ranking(output_path, mask, roi)
+    
+    def predict(self, file_paths: Dict[str, Path], task_id: str,
+                cache_key: Optional[str] = None) -> Path:
+        return self.segment(file_paths, task_id, cache_key).output_path
+    
+    def segment_from_cache(self, task_id: str, cache_key: str) -> Optional[SegmentationResult]:
+        """Copy and index the cached mask for this task; None when it is not cached."""
+        output_path = settings.OUTPUT_DIR / f"{task_id}_segmentation.nii.gz"
+        if not result_cache.copy_mask(cache_key, output_path):
+            return None
+        logger.info(f"Reusing cached segmentation for task {task_id}")
+        cached = volume_cache.load(output_path)
+        self._index_mask(output_path, cached.data, cached.affine, cached.zooms)
+        return SegmentationResult(output_path=output_path, mask=cached.data,
+                                  affine=cached.affine)
+
+    def segment(self, file_paths: Dict[str, Path], task_id: str,
+                cache_key: Optional[str] = None) -> SegmentationResult:
+        """Run segmentation, save the mask and also return it in memory for later stages."""
+        output_path = settings.OUTPUT_DIR / f"{task_id}_segmentation.nii.gz"
+        if cache_key:
+            cached = self.segment_from_cache(task_id, cache_key)
+            if cached is not None:
+                return cached
+
         try:
+            crop = self._use_crop(file_paths['flair'])
    
             input_tensor, original_shape, reference_nifti = self.preprocessor.preprocess_input(
-                file_paths['flair'], file_paths['t1ce'], file_paths['t2']
+                file_paths['flair'], file_paths['t1ce'], file_paths['t2'], crop=crop
             )
 
-            with torch.no_grad():
-                input_tensor = input_tensor.to(self.device)
-                output_logits = self.model(input_tensor)
-                pred_mask = torch.argmax(output_logits, dim=1)
-                pred_mask_np = pred_mask.squeeze(0).cpu().numpy()
+            if crop:
+                with torch.no_grad():
+                    input_tensor = input_tensor.to(self.device)
+                    # uint8 labels; the full-volume logits never reach the host
+                    pred_mask_np = self._forward_labels(input_tensor).squeeze(0).cpu().numpy()
+            else:
+                pred_mask_np = self.inferer(input_tensor, self._forward, self.device).numpy()
+            del input_tensor
 
-            output_path = settings.OUTPUT_DIR / f"{task_id}_segmentation.nii.gz"
-            self.postprocessor.save_segmentation_mask(
-                pred_mask_np, original_shape, reference_nifti, output_path
+            mask = self.postprocessor.to_full_size(pred_mask_np, original_shape, crop=crop)
+            mask_nifti = self.postprocessor.save_full_size_mask(
+                mask, reference_nifti, output_path, settings.MASK_COMPRESSION_LEVEL
             )
+            # Later stages read the mask through the cache instead of decoding the file again
+            mask = volume_cache.put(output_path, mask, mask_nifti.affine, mask_nifti.header).data
+            self._index_mask(output_path, mask, mask_nifti.affine, mask_nifti.header.get_zooms())
+            if cache_key:
+                result_cache.put_mask(cache_key, output_path)
             
             logger.info(f"Segmentation completed for task {task_id}")
-            return output_path
+            return SegmentationResult(output_path=output_path, mask=mask,
+                                      affine=mask_nifti.affine)
             
         except Exception as e:
             logger.error(f"Segmentation failed for task {task_id}: {e}")
@@ -0,0 +1,73 @@
+# app/services/slice_ranking.py
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+import numpy as np
+from app.services.volume_cache import volume_cache
+from app.utils.label_statistics import SliceRanking, compute_slice_ranking
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MAX_ENTRIES = 64
+_rankings: "OrderedDict[tuple, SliceRanking]" = OrderedDict()
+_lock = threading.Lock()
+
+def sidecar_path(mask_path: Path) -> Path:
+    """`<task>_segmentation.nii.gz` -> `<task>_segmentation.slices.json`"""
+    mask_path = Path(mask_path)
+    return mask_path.with_name(mask_path.name.split(".")[0] + ".slices.json")
+
+def save_slice_ranking(mask_path: Path, mask: np.ndarray,
+                       roi: Optional[Tuple[slice, ...]] = None) -> SliceRanking:
+    """
+    Rank the slices of a mask that was just written and store the result
+    next to it; `roi` is the box around its labels when already known.
+    """
+    ranking = compute_slice_ranking(mask, roi=roi)
+    stat = os.stat(mask_path)
+    try:
+        payload = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'counts': ranking.to_dict()}
+        tmp = sidecar_path(mask_path).with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(payload))
+        os.replace(tmp, sidecar_path(mask_path))
+    except OSError as e:
+        logger.warning(f"Could not store slice ranking for {mask_path}: {e}")
+    _remember((str(Path(mask_path).resolve()), stat.st_mtime_ns, stat.st_size), ranking)
+    return ranking
+
+def get_slice_ranking(mask_path: Path) -> SliceRanking:
+    """Ranking of a mask from memory, its sidecar file, or computed once and stored."""
+    stat = os.stat(mask_path)
+    key = (str(Path(mask_path).resolve()), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        ranking = _rankings.get(key)
+        if ranking is not None:
+            _rankings.move_to_end(key)
+            return ranking
+
+    ranking = _read_sidecar(mask_path, stat)
+    if ranking is None:
+        return save_slice_ranking(mask_path, volume_cache.load(mask_path).data)
+    _remember(key, ranking)
+    return ranking
+
+def _read_sidecar(mask_path: Path, stat: os.stat_result) -> Optional[SliceRanking]:
+    try:
+        payload = json.loads(sidecar_path(mask_path).read_text())
+    except (OSError, ValueError):
+        return None
+    # A rewritten mask invalidates its sidecar
+    if payload.get('mtime_ns') != stat.st_mtime_ns or payload.get('size') != stat.st_size:
+        return None
+    return SliceRanking.from_dict(payload['counts'])
+
+def _remember(key: tuple, ranking: SliceRanking):
+    with _lock:
+        _rankings[key] = ranking
+        _rankings.move_to_end(key)
+        while len(_rankings) > _MAX_ENTRIES:
+            _rankings.popitem(last=False)
@@ -0,0 +1,178 @@
+# app/services/slice_service.py
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from PIL import Image
+from app.core.config import settings
+from app.services.visualization_service import VisualizationService
+from app.utils.label_statistics import AXIS_NAMES
+from app.utils.overlay_renderer import build_lut, composite_slice, intensity_window
+from app.utils.volume_io import ensure_memmap, file_identity
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Array axis each view slices along, in the (x, y, z) order of the scans
+AXES = {name: axis for axis, name in enumerate(AXIS_NAMES)}
+MEDIA_TYPES = {'png': 'image/png', 'webp': 'image/webp'}
+
+@dataclass(frozen=True)
+class Tile:
+    content: bytes
+    media_type: str
+    etag: str
+
+class SliceService:
+    """
+    Renders single slices of a case for the interactive viewer.
+
+    Volumes and masks are read through uncompressed memory-mapped copies,
+    so a tile only touches the pages of the requested slice. Encoded tiles
+    are kept in a byte-budgeted LRU because scrolling back and forth asks
+    for the same tiles repeatedly.
+    """
+
+    def __init__(self, cache_dir: Path, memmap_max_bytes: int, tile_cache_max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.memmap_max_bytes = memmap_max_bytes
+        self.tile_cache_max_bytes = tile_cache_max_bytes
+        colors = VisualizationService().tumor_colors
+        self._lut = build_lut(colors, image_alpha=1.0)
+        self._tiles: "OrderedDict[str, Tile]" = OrderedDict()
+        self._tile_bytes = 0
+        self._windows: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def volume(self, path: Path) -> np.ndarray:
+        return ensure_memmap(path, self.cache_dir, self.memmap_max_bytes)
+
+    def volume_info(self, path: Path) -> Dict[str, Any]:
+        data = self.volume(path)
+        low, high = self._default_window(path, data)
+        return {
+            'shape': list(data.shape[:3]),
+            'slices': {axis: int(data.shape[dim]) for axis, dim in AXES.items()},
+            'window': high - low,
+            'level': (high + low) / 2,
+        }
+
+    def get_tile(self, volume_path: Path, axis: str, index: int,
+                 mask_path: Optional[Path] = None, window: Optional[float] = None,
+                 level: Optional[float] = None, size: Optional[int] = None,
+                 image_format: str = "png") -> Tile:
+        """
+        Encoded slice `index` along `axis`, windowed to [level - window/2,
+        level + window/2] (default: 1st-99th percentile of the scan), with the
+        mask overlaid when given and the longest side scaled to `size`.
+        """
+        if axis not in AXES:
+            raise ValueError(f"axis must be one of {', '.join(AXES)}")
+        if image_format not in MEDIA_TYPES:
+            raise ValueError(f"format must be one of {', '.join(MEDIA_TYPES)}")
+
+        key = hashlib.sha256(json.dumps([
+            file_identity(volume_path), file_identity(mask_path) if mask_path else None,
+            axis, index, window, level, size, image_format,
+        ]).encode()).hexdigest()
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self._hits += 1
+                return tile
+            self._misses += 1
+
+        data = self.volume(volume_path)
+        dim = AXES[axis]
+        if not 0 <= index < data.shape[dim]:
+            raise IndexError(f"{axis} slice {index} out of range 0-{data.shape[dim] - 1}")
+
+        if window is None or level is None:
+            low, high = self._default_window(volume_path, data)
+            window = high - low if window is None else window
+            level = (high + low) / 2 if level is None else level
+        low = level - window / 2
+        scale = 1.0 / window if window > 0 else 1.0
+
+        # Basic indexing so only this slice is read from the map (np.take reads it all)
+        view = tuple(index if d == dim else slice(None) for d in range(3))
+        gray = (data[view].astype(np.float32) - low) * scale
+        labels = np.zeros(gray.shape, dtype=np.uint8)
+        if mask_path is not None:
+            mask = self.volume(mask_path)
+            if mask.shape[:3] != data.shape[:3]:
+                raise ValueError(f"mask shape {mask.shape} does not match volume {data.shape}")
+            labels = np.asarray(mask[view])
+        rgb = composite_slice(np.clip(gray, 0.0, 1.0), labels, self._lut)
+        if axis != 'axial':
+            # Same orientation as the 3D view: superior at the top
+            rgb = rgb.transpose(1, 0, 2)[::-1]
+
+        tile = Tile(self._encode(rgb, size, image_format), MEDIA_TYPES[image_format], key)
+        self._insert(key, tile)
+        return tile
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'tiles': len(self._tiles),
+                'bytes': self._tile_bytes,
+                'max_bytes': self.tile_cache_max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _default_window(self, path: Path, data: np.ndarray) -> Tuple[float, float]:
+        key = json.dumps(file_identity(path))
+        with self._lock:
+            window = self._windows.get(key)
+        if window is None:
+            # One pass over the mapped volume per scan, not per tile
+            window = intensity_window(data, 1, 99)
+            with self._lock:
+                self._windows[key] = window
+                if len(self._windows) > 256:
+                    self._windows.popitem(last=False)
+        return window
+
+    def _encode(self, rgb: np.ndarray, size: Optional[int], image_format: str) -> bytes:
+        image = Image.fromarray(np.ascontiguousarray(rgb), "RGB")
+        if size:
+            scale = min(size, settings.SLICE_MAX_SIZE) / max(image.size)
+            target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            # Nearest keeps voxel and label edges crisp when zooming in
+            image = image.resize(target, Image.NEAREST if scale >= 1 else Image.BILINEAR)
+        buffer = io.BytesIO()
+        if image_format == "webp":
+            image.save(buffer, format="WEBP", quality=settings.VISUALIZATION_WEBP_QUALITY)
+        else:
+            image.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def _insert(self, key: str, tile: Tile):
+        size = len(tile.content)
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self._tile_bytes -= len(previous.content)
+            self._tiles[key] = tile
+            self._tile_bytes += size
+            while self._tile_bytes > self.tile_cache_max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self._tile_bytes -= len(evicted.content)
+                self._evictions += 1
+
+slice_service = SliceService(settings.SLICE_CACHE_DIR, settings.SLICE_CACHE_MAX_BYTES,
+                             settings.SLICE_TILE_CACHE_MAX_BYTES)
@@ -0,0 +1,100 @@
+# app/services/task_events.py
+import asyncio
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _merge_text(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    return {**first, 'report_delta': first['report_delta'] + second['report_delta']}
+
+class Subscription:
+    """
+    Event buffer of one subscriber, used only from its own event loop.
+
+    It never loses streamed report text: a `report_delta` arriving behind
+    another unread one is appended to it, and when the buffer is full the
+    oldest status event is dropped instead, since later events and the
+    stream's periodic re-read carry the current status.
+    """
+
+    def __init__(self, max_events: int):
+        self.max_events = max(1, max_events)
+        self._events: Deque[Dict[str, Any]] = deque()
+        self._ready = asyncio.Event()
+
+    def offer(self, event: Dict[str, Any]):
+        events = self._events
+        if 'report_delta' in event and events and 'report_delta' in events[-1]:
+            events[-1] = _merge_text(events[-1], event)
+            return
+        if len(events) >= self.max_events:
+            status = next((i for i, queued in enumerate(events)
+                           if 'report_delta' not in queued), None)
+            if status is None:
+                # Only report text is buffered; this status is superseded by the next re-read
+                return
+            del events[status]
+            if 0 < status < len(events) and 'report_delta' in events[status - 1] \
+                    and 'report_delta' in events[status]:
+                # The text on either side of the dropped status is now adjacent
+                events[status - 1] = _merge_text(events[status - 1], events[status])
+                del events[status]
+        events.append(event)
+        self._ready.set()
+
+    async def get(self) -> Dict[str, Any]:
+        """Wait for and remove the oldest buffered event."""
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._events.popleft()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+class TaskEventBroker:
+    """
+    Fans TaskService updates out to streaming subscribers.
+
+    Updates are published from worker threads; each subscriber owns a
+    Subscription on its event loop and receives events through
+    call_soon_threadsafe, so publishing never blocks a job.
+    """
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, Subscription]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, task_id: str) -> Subscription:
+        """Register a subscription for `task_id`; must be called from the event loop that reads it."""
+        subscription = Subscription(self.max_queue)
+        with self._lock:
+            self._subscribers[task_id].append((asyncio.get_running_loop(), subscription))
+        return subscription
+
+    def unsubscribe(self, task_id: str, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(task_id, [])
+            subscribers[:] = [(loop, s) for loop, s in subscribers if s is not subscription]
+            if not subscribers:
+                self._subscribers.pop(task_id, None)
+
+    def publish(self, task_id: str, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers.get(task_id, ()))
+        for loop, subscription in subscribers:
+            try:
+                loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Subscriber's loop has shut down
+                self.unsubscribe(task_id, subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+task_event_broker = TaskEventBroker()
@@ -1,64 +1,115 @@
 # app/services/task_service.py
+import time
 import uuid
 from typing import Dict, Any, Optional
 from datetime import datetime
 from app.models.schemas import TaskStatus, TaskStatusResponse
-import json
+from app.services.task_store import TaskStore, create_task_store
+from app.services.job_executor import job_executor
+from app.services.task_events import task_event_broker
+from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
 class TaskService:
-    def __init__(self):
-        self.tasks: Dict[str, Dict[str, Any]] = {}
-    
+    def __init__(self, store: Optional[TaskStore] = None):
+        self.store = store or create_task_store(settings.TASK_STORE_BACKEND,
+                                                settings.TASK_DB_PATH)
+        self.ttl = settings.TASK_TTL_SECONDS
+        self.events = task_event_broker
+        self._last_purge = 0.0
+
     def create_task(self, task_type: str, **kwargs) -> str:
+        self._maybe_purge()
         task_id = str(uuid.uuid4())
-        self.tasks[task_id] = {
+        now = datetime.now()
+        self.store.create({
             'task_id': task_id,
             'task_type': task_type,
             'status': TaskStatus.PENDING,
             'progress': 0.0,
             'message': 'Task created',
-            'result': None,
-            'created_at': datetime.now(),
-            'updated_at': datetime.now(),
-            **kwargs
-        }
+            'created_at': now,
+            'updated_at': now,
+        }, kwargs, time.time() + self.ttl)
         logger.info(f"Created task {task_id} of type {task_type}")
         return task_id
-    
-    def update_task(self, task_id: str, status: TaskStatus = None, 
-                   progress: float = None, message: str = None, 
+
+    def update_task(self, task_id: str, status: TaskStatus = None,
+                   progress: float = None, message: str = None,
                    result: Any = None):
-        if task_id not in self.tasks:
-            return False
-        
-        task = self.tasks[task_id]
+        fields = {'updated_at': datetime.now()}
         if status:
-            task['status'] = status
+            fields['status'] = status
         if progress is not None:
-            task['progress'] = progress
+            fields['progress'] = progress
         if message:
-            task['message'] = message
-        if result is not None:
-            task['result'] = result
-        
-        task['updated_at'] = datetime.now()
+            fields['message'] = message
+
+        if not self.store.update(task_id, fields, time.time() + self.ttl, result):
+            return False
         logger.info(f"Updated task {task_id}: status={status}, progress={progress}")
+        self.events.publish(task_id, self._event(task_id, fields, result is not None))
         return True
-    
-    def get_task(self, task_id: str) -> Optional[TaskStatusResponse]:
-        if task_id not in self.tasks:
+
+    def publish_event(self, task_id: str, event: Dict[str, Any]):
+        """Push an out-of-band event (e.g. streamed report text) to live subscribers."""
+        self.events.publish(task_id, {'task_id': task_id, **event})
+
+    def get_task_event(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Current status of a task as a small progress event, without its result."""
+        task = self.get_task(task_id, include_result=False)
+        if task is None:
             return None
-        
-        task = self.tasks[task_id]
+        return {
+            'task_id': task_id,
+            'status': task.status.value,
+            'progress': task.progress,
+            'message': task.message,
+            'queue_position': task.queue_position,
+        }
+
+    def _event(self, task_id: str, fields: Dict[str, Any], has_result: bool) -> Dict[str, Any]:
+        event = {'task_id': task_id}
+        for key in ('status', 'progress', 'message'):
+            if key in fields:
+                value = fields[key]
+                event[key] = value.value if isinstance(value, TaskStatus) else value
+        if has_result:
+            event['has_result'] = True
+        return event
+
+    def get_task(self, task_id: str, include_result: bool = True) -> Optional[TaskStatusResponse]:
+        task = self.store.get(task_id, include_result)
+        if task is None:
+            return None
+        if task['status'] == TaskStatus.PENDING:
+            task['queue_position'] = job_executor.queue_position(task_id)
         return TaskStatusResponse(**task)
-    
+
+    def get_task_params(self, task_id: str) -> Dict[str, Any]:
+        """Extra keyword arguments the task was created with (upload_id, patient_info, ...)."""
+        return self.store.get_params(task_id) or {}
+
     def delete_task(self, task_id: str) -> bool:
-        if task_id in self.tasks:
-            del self.tasks[task_id]
+        if self.store.delete(task_id):
             logger.info(f"Deleted task {task_id}")
             return True
         return False
-task_service = TaskService()
\ No newline at end of file
+
+    def purge_expired(self) -> int:
+        removed = self.store.purge_expired(time.time())
+        if removed:
+            logger.info(f"Purged {removed} expired tasks")
+        return removed
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge >= settings.TASK_PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            try:
+                self.purge_expired()
+            except Exception as e:
+                logger.error(f"Failed to purge expired tasks: {e}")
+task_service = TaskService()
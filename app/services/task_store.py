@@ -0,0 +1,244 @@
+# app/services/task_store.py
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns kept in the hot status row; everything else passed to create_task is a param
+STATUS_FIELDS = ('task_id', 'task_type', 'status', 'progress', 'message',
+                 'created_at', 'updated_at')
+
+def _json_default(value):
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    if hasattr(value, 'tolist'):  # numpy arrays
+        return value.tolist()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Path):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _enum_value(value):
+    return value.value if isinstance(value, Enum) else value
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+class TaskStore(ABC):
+    """
+    Storage backend for TaskService records. Reads skip records past their
+    expiry even before `purge_expired` has removed them.
+    """
+
+    @abstractmethod
+    def create(self, record: Dict[str, Any], params: Dict[str, Any], expires_at: float):
+        ...
+
+    @abstractmethod
+    def update(self, task_id: str, fields: Dict[str, Any], expires_at: float,
+               result: Any = None) -> bool:
+        ...
+
+    @abstractmethod
+    def get(self, task_id: str, include_result: bool = True) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def get_params(self, task_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def delete(self, task_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def purge_expired(self, now: float) -> int:
+        ...
+
+class MemoryTaskStore(TaskStore):
+    """Process-local store; state is lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, record, params, expires_at):
+        with self._lock:
+            self._tasks[record['task_id']] = {
+                'record': dict(record), 'params': dict(params),
+                'result': None, 'expires_at': expires_at
+            }
+
+    def update(self, task_id, fields, expires_at, result=None):
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                return False
+            entry['record'].update(fields)
+            entry['expires_at'] = expires_at
+            if result is not None:
+                entry['result'] = result
+            return True
+
+    def get(self, task_id, include_result=True):
+        with self._lock:
+            entry = self._live(task_id)
+            if entry is None:
+                return None
+            record = dict(entry['record'])
+            record['result'] = entry['result'] if include_result else None
+            return record
+
+    def get_params(self, task_id):
+        with self._lock:
+            entry = self._live(task_id)
+            return dict(entry['params']) if entry else None
+
+    def delete(self, task_id):
+        with self._lock:
+            return self._tasks.pop(task_id, None) is not None
+
+    def purge_expired(self, now):
+        with self._lock:
+            expired = [k for k, v in self._tasks.items() if v['expires_at'] <= now]
+            for task_id in expired:
+                del self._tasks[task_id]
+            return len(expired)
+
+    def _live(self, task_id):
+        """Callers hold the lock."""
+        entry = self._tasks.get(task_id)
+        if entry is None or entry['expires_at'] <= time.time():
+            return None
+        return entry
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Embedded SQLite store shared by every worker on the host.
+
+    Status rows are small and looked up by primary key; results (features,
+    report text, visualizations) live in a separate table and are only read
+    when asked for.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            task_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL,
+            message TEXT,
+            params TEXT NOT NULL DEFAULT '{}',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+        CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_expires_at ON tasks(expires_at);
+        CREATE TABLE IF NOT EXISTS task_results (
+            task_id TEXT PRIMARY KEY REFERENCES tasks(task_id) ON DELETE CASCADE,
+            result TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def create(self, record, params, expires_at):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO tasks (task_id, task_type, status, progress, message, params, "
+                "created_at, updated_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record['task_id'], record['task_type'], _enum_value(record['status']),
+                 record['progress'], record['message'], dumps(params),
+                 record['created_at'].timestamp(), record['updated_at'].timestamp(),
+                 expires_at)
+            )
+
+    def update(self, task_id, fields, expires_at, result=None):
+        columns = {k: v for k, v in fields.items() if k in STATUS_FIELDS}
+        if 'status' in columns:
+            columns['status'] = _enum_value(columns['status'])
+        if 'updated_at' in columns:
+            columns['updated_at'] = columns['updated_at'].timestamp()
+        columns['expires_at'] = expires_at
+
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._connection() as conn:
+            cursor = conn.execute(f"UPDATE tasks SET {assignments} WHERE task_id = ?",
+                                  (*columns.values(), task_id))
+            if cursor.rowcount == 0:
+                return False
+            if result is not None:
+                conn.execute("INSERT OR REPLACE INTO task_results (task_id, result) VALUES (?, ?)",
+                             (task_id, dumps(result)))
+        return True
+
+    def get(self, task_id, include_result=True):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT task_id, task_type, status, progress, message, created_at, updated_at "
+            "FROM tasks WHERE task_id = ? AND expires_at > ?", (task_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+
+        record = dict(row)
+        record['created_at'] = datetime.fromtimestamp(record['created_at'])
+        record['updated_at'] = datetime.fromtimestamp(record['updated_at'])
+        record['result'] = None
+        if include_result:
+            result_row = conn.execute("SELECT result FROM task_results WHERE task_id = ?",
+                                      (task_id,)).fetchone()
+            if result_row is not None:
+                record['result'] = json.loads(result_row['result'])
+        return record
+
+    def get_params(self, task_id):
+        row = self._connection().execute(
+            "SELECT params FROM tasks WHERE task_id = ? AND expires_at > ?",
+            (task_id, time.time())
+        ).fetchone()
+        return json.loads(row['params']) if row else None
+
+    def delete(self, task_id):
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,)).rowcount > 0
+
+    def purge_expired(self, now):
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM tasks WHERE expires_at <= ?", (now,)).rowcount
+
+def create_task_store(backend: str, db_path: Path) -> TaskStore:
+    if backend == "memory":
+        return MemoryTaskStore()
+    if backend == "sqlite":
+        return SQLiteTaskStore(db_path)
+    raise ValueError(f"Unknown task store backend: {backend}")
@@ -1,17 +1,29 @@
 # app/services/visualization_service.py
 import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
-import nibabel as nib
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
 from pathlib import Path
 from typing import Dict, List, Tuple
-import base64
 import io
+import time
 from scipy import ndimage
+from app.core.config import settings
+from app.services.render_store import image_url, render_store
+from app.services.slice_ranking import get_slice_ranking
+from app.services.volume_cache import volume_cache
+from app.utils.overlay_renderer import build_lut, composite_slice, intensity_window, render_overlay_strip
+from app.utils.label_statistics import AXIS_NAMES
+from app.utils.volume_io import file_identity
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Bump when the figure layout changes so stored renders are not reused
+RENDER_VERSION = 1
+RENDER_DPI = 150
+AXIAL = AXIS_NAMES.index('axial')
+
 class VisualizationService:
     def __init__(self):
         self.tumor_colors = {
@@ -27,73 +39,116 @@ class VisualizationService:
             2: "Peritumoral Edema", 
             3: "Enhancing Tumor"
         }
+        self.backend = settings.VISUALIZATION_BACKEND
+        self.image_format = settings.VISUALIZATION_IMAGE_FORMAT
+        self._lut = build_lut(self.tumor_colors)
     
     def create_segmentation_overlay(self, original_path: Path, segmentation_path: Path, 
                                   file_type: str, num_slices: int = 5) -> str:
 
         try:
+            key = render_store.key(
+                kind='overlay',
+                segmentation=file_identity(segmentation_path),
+                source=file_identity(original_path),
+                modality=file_type,
+                slices={'selection': 'tumor_area', 'num_slices': num_slices},
+                params=self._render_params(),
+            )
+            render = (self._composite_segmentation_overlay if self.backend == "numpy"
+                      else self._render_segmentation_overlay)
+            return self._fetch_or_render(
+                key, lambda: render(original_path, segmentation_path, file_type, num_slices),
+                f"image/{self.image_format}"
+            )
+
+        except Exception as e:
+            logger.error(f"Error creating segmentation overlay for {file_type}: {e}")
+            return ""
 
-            original_img = nib.load(original_path).get_fdata()
-            seg_img = nib.load(segmentation_path).get_fdata()
+    def _render_segmentation_overlay(self, original_path: Path, segmentation_path: Path,
+                                     file_type: str, num_slices: int) -> bytes:
+        original_img = volume_cache.load(original_path).data
+        seg_img = volume_cache.load(segmentation_path).data
 
-            original_normalized = self._normalize_image(original_img)
+        original_normalized = self._normalize_image(original_img)
 
-            tumor_slices = self._find_tumor_slices(seg_img, num_slices)
+        tumor_slices = get_slice_ranking(segmentation_path).top_slices(AXIAL, num_slices)
 
-            fig, axes = plt.subplots(1, num_slices, figsize=(4*num_slices, 6))
-            if num_slices == 1:
-                axes = [axes]
-                
-            fig.suptitle(f'{file_type.upper()} with Segmentation Overlay', 
-                        fontsize=16, fontweight='bold')
+        # A standalone Figure, not pyplot: renders run concurrently on the CPU pool
+        # and pyplot's current-figure state is global
+        fig = Figure(figsize=(4*num_slices, 6))
+        axes = fig.subplots(1, num_slices)
+        if num_slices == 1:
+            axes = [axes]
+            
+        fig.suptitle(f'{file_type.upper()} with Segmentation Overlay', 
+                    fontsize=16, fontweight='bold')
+        
+        for i, slice_idx in enumerate(tumor_slices):
+            ax = axes[i]
+
+            ax.imshow(original_normalized[:, :, slice_idx], 
+                     cmap='gray', alpha=0.8)
+            
+            overlay = np.zeros((*original_normalized.shape[:2], 4))
             
-            for i, slice_idx in enumerate(tumor_slices):
-                ax = axes[i]
-
-                ax.imshow(original_normalized[:, :, slice_idx], 
-                         cmap='gray', alpha=0.8)
-                
-                overlay = np.zeros((*original_normalized.shape[:2], 4))
-                
-                for label, color in self.tumor_colors.items():
-                    if label == 0:
-                        continue
-                    mask = seg_img[:, :, slice_idx] == label
-                    if np.any(mask):
-                        overlay[mask] = color
-
-                ax.imshow(overlay, alpha=0.6)
-                
-                ax.set_title(f'Slice {slice_idx}', fontsize=12)
-                ax.axis('off')
-
-            legend_elements = []
             for label, color in self.tumor_colors.items():
                 if label == 0:
                     continue
-                legend_elements.append(
-                    plt.Rectangle((0,0),1,1, facecolor=color[:3], 
-                                alpha=color[3], label=self.tumor_labels[label])
-                )
-            
-            if legend_elements:
-                fig.legend(handles=legend_elements, loc='lower center', 
-                          bbox_to_anchor=(0.5, -0.05), ncol=3)
-            
-            plt.tight_layout()
-
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight', 
-                       facecolor='white', edgecolor='none')
-            buffer.seek(0)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            
-            return img_str
+                mask = seg_img[:, :, slice_idx] == label
+                if np.any(mask):
+                    overlay[mask] = color
+
+            ax.imshow(overlay, alpha=0.6)
             
-        except Exception as e:
-            logger.error(f"Error creating segmentation overlay for {file_type}: {e}")
-            return ""
+            ax.set_title(f'Slice {slice_idx}', fontsize=12)
+            ax.axis('off')
+
+        legend_elements = []
+        for label, color in self.tumor_colors.items():
+            if label == 0:
+                continue
+            legend_elements.append(
+                Rectangle((0,0),1,1, facecolor=color[:3], 
+                            alpha=color[3], label=self.tumor_labels[label])
+            )
+        
+        if legend_elements:
+            fig.legend(handles=legend_elements, loc='lower center', 
+                      bbox_to_anchor=(0.5, -0.05), ncol=3)
+        
+        fig.tight_layout()
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=self.image_format, dpi=RENDER_DPI, bbox_inches='tight', 
+                   facecolor='white', edgecolor='none')
+        
+        return buffer.getvalue()
+
+    def _composite_segmentation_overlay(self, original_path: Path, segmentation_path: Path,
+                                        file_type: str, num_slices: int) -> bytes:
+        """Same figure as `_render_segmentation_overlay`, built with lookup tables and Pillow."""
+        original_img = volume_cache.load(original_path).data
+        seg_img = volume_cache.load(segmentation_path).data
+
+        p1, p99 = intensity_window(original_img, 1, 99)
+        scale = 1.0 / (p99 - p1) if p99 > p1 else 1.0
+
+        tumor_slices = get_slice_ranking(segmentation_path).top_slices(AXIAL, num_slices)
+        panels = []
+        for slice_idx in tumor_slices:
+            # Only the displayed slices are normalized, not the whole volume
+            gray = (original_img[:, :, slice_idx].astype(np.float32) - p1) * scale
+            panels.append(composite_slice(np.clip(gray, 0.0, 1.0), seg_img[:, :, slice_idx], self._lut))
+
+        legend = [(self.tumor_labels[label], color)
+                  for label, color in self.tumor_colors.items() if label != 0]
+        return render_overlay_strip(
+            panels, [f'Slice {s}' for s in tumor_slices],
+            f'{file_type.upper()} with Segmentation Overlay', legend,
+            self.image_format, settings.VISUALIZATION_WEBP_QUALITY
+        )
     
     def create_all_modality_overlays(self, file_paths: Dict[str, Path], 
                                    segmentation_path: Path) -> Dict[str, str]:
@@ -108,58 +163,93 @@ class VisualizationService:
                 overlays[modality] = overlay
         
         return overlays
+
+    def create_case_figures(self, file_paths: Dict[str, Path],
+                            segmentation_path: Path) -> Dict[str, str]:
+        """URLs of the modality overlays and the 3D view shown in the UI and the PDF."""
+        figures = self.create_all_modality_overlays(file_paths, segmentation_path)
+        volume_viz = self.create_3d_volume_visualization(segmentation_path)
+        if volume_viz:
+            figures['3d_volume'] = volume_viz
+        return figures
     
     def create_3d_volume_visualization(self, segmentation_path: Path) -> str:
 
         try:
-            seg_img = nib.load(segmentation_path).get_fdata()
-            
-            fig = plt.figure(figsize=(12, 10))
-
-            ax1 = plt.subplot(2, 2, 1)
-            ax2 = plt.subplot(2, 2, 2) 
-            ax3 = plt.subplot(2, 2, 3)
-            ax4 = plt.subplot(2, 2, 4)
-
-            sagittal_slice = seg_img.shape[0] // 2
-            ax1.imshow(seg_img[sagittal_slice, :, :].T, cmap='viridis', origin='lower')
-            ax1.set_title('Sagittal View')
-            ax1.axis('off')
-
-            coronal_slice = seg_img.shape[1] // 2
-            ax2.imshow(seg_img[:, coronal_slice, :].T, cmap='viridis', origin='lower')
-            ax2.set_title('Coronal View')
-            ax2.axis('off')
-
-            axial_slice = seg_img.shape[2] // 2  
-            ax3.imshow(seg_img[:, :, axial_slice], cmap='viridis')
-            ax3.set_title('Axial View')
-            ax3.axis('off')
-
-            volumes = {}
-            for label in [1, 2, 3]:
-                volumes[self.tumor_labels[label]] = np.sum(seg_img == label)
-            
-            ax4.bar(volumes.keys(), volumes.values(), 
-                   color=['red', 'green', 'blue'], alpha=0.7)
-            ax4.set_title('Tumor Component Volumes (voxels)')
-            ax4.set_ylabel('Volume (voxels)')
-            plt.xticks(rotation=45)
-            
-            plt.suptitle('3D Tumor Segmentation Views', fontsize=16, fontweight='bold')
-            plt.tight_layout()
-            
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-            buffer.seek(0)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            
-            return img_str
-            
+            key = render_store.key(
+                kind='volume',
+                segmentation=file_identity(segmentation_path),
+                slices={'selection': 'key_slices'},
+                params=self._render_params(),
+            )
+            return self._fetch_or_render(
+                key, lambda: self._render_3d_volume(segmentation_path), "image/png"
+            )
+
         except Exception as e:
             logger.error(f"Error creating 3D visualization: {e}")
             return ""
+
+    def _render_3d_volume(self, segmentation_path: Path) -> bytes:
+        seg_img = volume_cache.load(segmentation_path).data
+        
+        fig = Figure(figsize=(12, 10))
+
+        ax1 = fig.add_subplot(2, 2, 1)
+        ax2 = fig.add_subplot(2, 2, 2) 
+        ax3 = fig.add_subplot(2, 2, 3)
+        ax4 = fig.add_subplot(2, 2, 4)
+
+        # Cut through the largest tumor cross-section rather than the volume center
+        key_slices = get_slice_ranking(segmentation_path).key_slices()
+
+        sagittal_slice = key_slices['sagittal']
+        ax1.imshow(seg_img[sagittal_slice, :, :].T, cmap='viridis', origin='lower')
+        ax1.set_title(f'Sagittal View (slice {sagittal_slice})')
+        ax1.axis('off')
+
+        coronal_slice = key_slices['coronal']
+        ax2.imshow(seg_img[:, coronal_slice, :].T, cmap='viridis', origin='lower')
+        ax2.set_title(f'Coronal View (slice {coronal_slice})')
+        ax2.axis('off')
+
+        axial_slice = key_slices['axial']
+        ax3.imshow(seg_img[:, :, axial_slice], cmap='viridis')
+        ax3.set_title(f'Axial View (slice {axial_slice})')
+        ax3.axis('off')
+
+        # Whole-volume label counts are the sum of any axis' per-slice histograms
+        label_counts = get_slice_ranking(segmentation_path).counts[AXIAL].sum(axis=0)
+        volumes = {}
+        for label in [1, 2, 3]:
+            volumes[self.tumor_labels[label]] = int(label_counts[label])
+        
+        ax4.bar(volumes.keys(), volumes.values(), 
+               color=['red', 'green', 'blue'], alpha=0.7)
+        ax4.set_title('Tumor Component Volumes (voxels)')
+        ax4.set_ylabel('Volume (voxels)')
+        ax4.tick_params(axis='x', rotation=45)
+        
+        fig.suptitle('3D Tumor Segmentation Views', fontsize=16, fontweight='bold')
+        fig.tight_layout()
+        
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=RENDER_DPI, bbox_inches='tight')
+        
+        return buffer.getvalue()
+
+    def _fetch_or_render(self, key: str, render, media_type: str) -> str:
+        """URL of the stored image, rendering and storing it on a miss."""
+        if not render_store.lookup(key):
+            started = time.perf_counter()
+            image = render()
+            render_store.put(key, image, time.perf_counter() - started, media_type)
+        return image_url(key)
+
+    def _render_params(self) -> Dict:
+        return {'version': RENDER_VERSION, 'dpi': RENDER_DPI, 'colors': self.tumor_colors,
+                'backend': self.backend, 'format': self.image_format,
+                'quality': settings.VISUALIZATION_WEBP_QUALITY}
     
     def _normalize_image(self, img: np.ndarray) -> np.ndarray:
 
@@ -172,22 +262,3 @@ class VisualizationService:
         img_norm = (img_norm - p1) / (p99 - p1)
         
         return img_norm
-    
-    def _find_tumor_slices(self, seg_img: np.ndarray, num_slices: int) -> List[int]:
-        slice_tumor_content = []
-        for i in range(seg_img.shape[2]):
-            tumor_voxels = np.sum(seg_img[:, :, i] > 0)
-            slice_tumor_content.append((i, tumor_voxels))
-        slice_tumor_content.sort(key=lambda x: x[1], reverse=True)
-        top_slices = [x[0] for x in slice_tumor_content[:min(num_slices*2, len(slice_tumor_content))]]
-        top_slices.sort()
-
-        if len(top_slices) >= num_slices:
-            indices = np.linspace(0, len(top_slices)-1, num_slices, dtype=int)
-            selected_slices = [top_slices[i] for i in indices]
-        else:
-            middle = seg_img.shape[2] // 2
-            selected_slices = list(range(middle - num_slices//2, middle + num_slices//2 + 1))
-            selected_slices = [max(0, min(seg_img.shape[2]-1, s)) for s in selected_slices]
-        
-        return selected_slices[:num_slices]
\ No newline at end of file
@@ -0,0 +1,151 @@
+# app/services/volume_cache.py
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Tuple
+from app.core.config import settings
+from app.utils.volume_io import read_volume
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Mapped entries cost no budget; this bounds how many maps stay open
+MAX_ENTRIES = 256
+
+@dataclass(frozen=True)
+class CachedVolume:
+    data: np.ndarray
+    affine: np.ndarray
+    header: Any
+
+    @property
+    def shape(self) -> tuple:
+        return self.data.shape
+
+    @property
+    def zooms(self) -> tuple:
+        return self.header.get_zooms()
+
+    @property
+    def mapped(self) -> bool:
+        return isinstance(self.data, np.memmap)
+
+    @property
+    def nbytes(self) -> int:
+        # Mapped working copies live in the page cache, not in the budget
+        return 0 if self.mapped else self.data.nbytes
+
+class VolumeCache:
+    """
+    Byte-budgeted LRU of decoded NIfTI volumes.
+
+    Entries are keyed by path, mtime and size, so a rewritten file is decoded
+    again. Arrays keep their stored dtype (int16 scans, uint8 masks) and are
+    marked read-only because every stage of a case shares the same buffer.
+    Uploads with a working copy are memory-mapped instead of decoded.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int, int], CachedVolume]" = OrderedDict()
+        self._loading: Dict[Tuple[str, int, int], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def load(self, path: Path) -> CachedVolume:
+        key = self._key(path)
+        with self._lock:
+            volume = self._lookup(key)
+            if volume is not None:
+                return volume
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Serialize decodes of the same file so concurrent stages share one inflate
+        with key_lock:
+            with self._lock:
+                volume = self._lookup(key)
+                if volume is not None:
+                    return volume
+                self._misses += 1
+
+            volume = None
+            try:
+                volume = self._decode(path)
+            finally:
+                with self._lock:
+                    if volume is not None:
+                        self._insert(key, volume)
+                    self._loading.pop(key, None)
+        return volume
+
+    def put(self, path: Path, data: np.ndarray, affine: np.ndarray, header) -> CachedVolume:
+        """Register an array that was just written to `path`, so readers skip the decode."""
+        data.setflags(write=False)
+        volume = CachedVolume(data=data, affine=affine, header=header)
+        with self._lock:
+            self._insert(self._key(path), volume)
+        return volume
+
+    def invalidate(self, path: Path):
+        resolved = str(Path(path).resolve())
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == resolved]:
+                self._bytes -= self._entries.pop(key).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'mapped': sum(volume.mapped for volume in self._entries.values()),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _key(self, path: Path) -> Tuple[str, int, int]:
+        resolved = Path(path).resolve()
+        stat = os.stat(resolved)
+        return str(resolved), stat.st_mtime_ns, stat.st_size
+
+    def _lookup(self, key):
+        volume = self._entries.get(key)
+        if volume is not None:
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return volume
+
+    def _decode(self, path: Path) -> CachedVolume:
+        data, affine, header = read_volume(path)
+        data.setflags(write=False)
+        return CachedVolume(data=data, affine=affine, header=header)
+
+    def _insert(self, key, volume: CachedVolume):
+        if volume.nbytes > self.max_bytes:
+            logger.warning(f"Volume {key[0]} ({volume.nbytes} bytes) exceeds the cache budget")
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = volume
+        self._bytes += volume.nbytes
+        while self._bytes > self.max_bytes or len(self._entries) > MAX_ENTRIES:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self._evictions += 1
+
+volume_cache = VolumeCache(settings.VOLUME_CACHE_MAX_BYTES)
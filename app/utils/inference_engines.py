@@ -0,0 +1,163 @@
+# app/utils/inference_engines.py
+import torch
+import torch.nn as nn
+from pathlib import Path
+from typing import Callable, Optional
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("eager", "torchscript", "compile", "onnxruntime")
+
+_CONV_TYPES = (nn.Conv1d, nn.Conv2d, nn.Conv3d)
+_BATCHNORM_TYPES = (nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d)
+
+def configure_threads(intra_op: int = 0, inter_op: int = 0):
+    """
+    Pin torch's intra-op and inter-op thread pools for this worker process;
+    0 keeps the defaults. The inter-op pool can only be sized before the
+    first parallel op runs, so a late call just logs a warning.
+    """
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            logger.warning(f"Could not set inter-op threads to {inter_op}: {e}")
+    logger.info(f"Torch threads: intra-op {torch.get_num_threads()}, "
+                f"inter-op {torch.get_num_interop_threads()}")
+
+def fold_batchnorm(model: nn.Module) -> int:
+    """
+    Fold every BatchNorm that directly follows a convolution inside an
+    `nn.Sequential` into the convolution's weights and bias, in place.
+    Only valid for inference (running statistics). Returns the number folded.
+    """
+    folded = 0
+    for module in list(model.modules()):
+        if not isinstance(module, nn.Sequential):
+            continue
+        children = list(module.named_children())
+        for (conv_name, conv), (bn_name, bn) in zip(children, children[1:]):
+            if isinstance(conv, _CONV_TYPES) and isinstance(bn, _BATCHNORM_TYPES):
+                setattr(module, conv_name, fuse_conv_bn_eval(conv, bn))
+                setattr(module, bn_name, nn.Identity())
+                folded += 1
+    return folded
+
+class ChannelsLast3d(nn.Module):
+    """Runs a model in channels-last-3d memory format and hands back contiguous outputs."""
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last_3d)
+
+    def forward(self, inputs: torch.Tensor) -> torch.Tensor:
+        outputs = self.model(inputs.contiguous(memory_format=torch.channels_last_3d))
+        return outputs.contiguous()
+
+    def segment(self, inputs: torch.Tensor, chunk_depth: int = 32) -> torch.Tensor:
+        return self.model.segment(inputs.contiguous(memory_format=torch.channels_last_3d),
+                                  chunk_depth)
+
+def supports_lean_labels(model) -> bool:
+    """
+    Whether an eager model, through any wrappers (kept in `.model`), has a
+    `segment` method. Looked up on the class, since compiled modules forward
+    attribute access to the uncompiled original.
+    """
+    while hasattr(type(model), "segment"):
+        inner = getattr(model, "model", None)
+        if not isinstance(inner, nn.Module):
+            return True
+        model = inner
+    return False
+
+class LabelPredictor:
+    """
+    Callable returning the uint8 labels (B, D, H, W) of an engine's inputs.
+    Eager models take their memory-lean `segment` path; other engines run a
+    full forward and the argmax is taken straight after.
+    """
+
+    def __init__(self, model: Callable[[torch.Tensor], torch.Tensor], lean: bool = True,
+                 chunk_depth: int = 32):
+        self.model = model
+        self.lean = lean and supports_lean_labels(model)
+        self.chunk_depth = chunk_depth
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        if self.lean:
+            return self.model.segment(inputs, self.chunk_depth)
+        return self.model(inputs).argmax(dim=1).to(torch.uint8)
+
+class OnnxRuntimeModule:
+    """Callable with the `model(inputs)` interface of the other engines, backed by ONNX Runtime."""
+
+    def __init__(self, onnx_path: Path, intra_op: int = 0, inter_op: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("The onnxruntime engine needs the onnxruntime package") from e
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op > 0:
+            options.intra_op_num_threads = intra_op
+        if inter_op > 0:
+            options.inter_op_num_threads = inter_op
+        self.session = ort.InferenceSession(str(onnx_path), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(None, {self.input_name: inputs.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+def export_onnx(model: nn.Module, example: torch.Tensor, onnx_path: Path):
+    """Export with a dynamic batch dimension; written atomically so workers can share it."""
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = onnx_path.with_suffix(".onnx.tmp")
+    try:
+        torch.onnx.export(model, (example,), str(tmp), input_names=["input"],
+                          output_names=["logits"], opset_version=17, dynamo=False,
+                          dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}})
+    except Exception as e:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"ONNX export failed (it needs the onnx package): {e}") from e
+    tmp.replace(onnx_path)
+
+def build_engine(model: nn.Module, engine: str, example: torch.Tensor,
+                 channels_last: bool = False, onnx_path: Optional[Path] = None,
+                 intra_op: int = 0, inter_op: int = 0) -> Callable[[torch.Tensor], torch.Tensor]:
+    """
+    Wrap an eval-mode model for CPU inference with the given engine. Traced
+    and compiled engines are run on `example` here, so their one-off
+    optimization cost is paid at load time rather than by the first case.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown inference engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    if engine == "onnxruntime":
+        if onnx_path is None:
+            raise ValueError("The onnxruntime engine needs an onnx_path")
+        if not Path(onnx_path).exists():
+            with torch.no_grad():
+                export_onnx(model, example, onnx_path)
+        return OnnxRuntimeModule(onnx_path, intra_op, inter_op)
+
+    if channels_last:
+        model = ChannelsLast3d(model).eval()
+    if engine == "eager":
+        return model
+
+    with torch.no_grad():
+        if engine == "torchscript":
+            model = torch.jit.freeze(torch.jit.trace(model, example, check_trace=False))
+        else:
+            model = torch.compile(model)
+        # The profiling executor and the compiler specialize on the first calls
+        for _ in range(2):
+            model(example)
+    return model
@@ -0,0 +1,206 @@
+# app/utils/label_statistics.py
+import numpy as np
+from dataclasses import dataclass
+from scipy import ndimage
+from typing import Dict, List, Optional, Tuple
+
+@dataclass(frozen=True)
+class RegionStats:
+    """Voxel count, bounding box, centroid and intensity aggregates of one region."""
+    voxels: int = 0
+    bbox_min: Optional[Tuple[int, ...]] = None
+    bbox_max: Optional[Tuple[int, ...]] = None  # exclusive
+    coord_sum: Tuple[float, ...] = (0.0, 0.0, 0.0)
+    intensity_sum: float = 0.0
+    intensity_max: Optional[float] = None
+
+    @property
+    def empty(self) -> bool:
+        return self.voxels == 0
+
+    @property
+    def extent(self) -> np.ndarray:
+        """Bounding box size in voxels along each axis."""
+        if self.empty:
+            return np.zeros(len(self.coord_sum), dtype=np.int64)
+        return np.subtract(self.bbox_max, self.bbox_min)
+
+    @property
+    def centroid(self) -> Optional[np.ndarray]:
+        if self.empty:
+            return None
+        return np.asarray(self.coord_sum) / self.voxels
+
+    @property
+    def intensity_mean(self) -> Optional[float]:
+        if self.empty or self.intensity_max is None:
+            return None
+        return self.intensity_sum / self.voxels
+
+def merge_regions(*regions: RegionStats) -> RegionStats:
+    """Statistics of the union of disjoint regions, e.g. tumor core = labels 1 + 3."""
+    regions = [r for r in regions if not r.empty]
+    if not regions:
+        return RegionStats()
+    maxima = [r.intensity_max for r in regions if r.intensity_max is not None]
+    return RegionStats(
+        voxels=sum(r.voxels for r in regions),
+        bbox_min=tuple(np.min([r.bbox_min for r in regions], axis=0).tolist()),
+        bbox_max=tuple(np.max([r.bbox_max for r in regions], axis=0).tolist()),
+        coord_sum=tuple(np.sum([r.coord_sum for r in regions], axis=0).tolist()),
+        intensity_sum=float(sum(r.intensity_sum for r in regions)),
+        intensity_max=max(maxima) if maxima else None,
+    )
+
+def compute_label_statistics(labels: np.ndarray,
+                             intensity: Optional[np.ndarray] = None,
+                             roi: Optional[Tuple[slice, ...]] = None) -> Dict[int, RegionStats]:
+    """
+    Per-label statistics of a label volume in a single sweep.
+
+    One `ndimage.find_objects` pass locates every label's bounding box; all
+    further reductions (`np.bincount` counts, coordinate sums and intensity
+    sums, `ndimage.maximum`) only touch the box that encloses all non-zero
+    labels, which for a tumor is a small fraction of the scan. When that box
+    is already known (`roi`), nothing outside it is read at all. Returns a
+    RegionStats for each label from 1 to the largest label present.
+    """
+    if not np.issubdtype(labels.dtype, np.integer):
+        labels = np.rint(labels).astype(np.uint8 if labels.max(initial=0) < 256 else np.int32)
+
+    if roi is None:
+        objects = ndimage.find_objects(labels)
+    else:
+        objects = [None if s is None else
+                   tuple(slice(r.start + b.start, r.start + b.stop) for r, b in zip(roi, s))
+                   for s in ndimage.find_objects(labels[roi])]
+    present = [s for s in objects if s is not None]
+    if not present:
+        return {label: RegionStats() for label in range(1, len(objects) + 1)}
+
+    roi = tuple(slice(min(s[axis].start for s in present), max(s[axis].stop for s in present))
+                for axis in range(labels.ndim))
+    roi_labels = labels[roi]
+    flat = roi_labels.ravel().astype(np.intp)
+    num_bins = len(objects) + 1
+
+    counts = np.bincount(flat, minlength=num_bins)
+    coord_sums = []
+    for axis, region in enumerate(roi):
+        shape = [1] * labels.ndim
+        shape[axis] = -1
+        index = np.arange(region.start, region.stop, dtype=np.float64).reshape(shape)
+        weights = np.broadcast_to(index, roi_labels.shape).ravel()
+        coord_sums.append(np.bincount(flat, weights=weights, minlength=num_bins))
+
+    intensity_sums = intensity_maxima = None
+    label_ids = np.arange(1, num_bins)
+    if intensity is not None:
+        roi_intensity = intensity[roi]
+        intensity_sums = np.bincount(flat, weights=roi_intensity.ravel().astype(np.float64),
+                                     minlength=num_bins)
+        intensity_maxima = ndimage.maximum(roi_intensity, roi_labels, label_ids)
+
+    stats = {}
+    for label, region in zip(label_ids.tolist(), objects):
+        if region is None:
+            stats[label] = RegionStats()
+            continue
+        stats[label] = RegionStats(
+            voxels=int(counts[label]),
+            bbox_min=tuple(s.start for s in region),
+            bbox_max=tuple(s.stop for s in region),
+            coord_sum=tuple(float(c[label]) for c in coord_sums),
+            intensity_sum=float(intensity_sums[label]) if intensity is not None else 0.0,
+            intensity_max=float(intensity_maxima[label - 1]) if intensity is not None else None,
+        )
+    return stats
+
+AXIS_NAMES = ('sagittal', 'coronal', 'axial')
+
+@dataclass(frozen=True)
+class SliceRanking:
+    """Per-slice voxel counts of every label along each of the three axes."""
+    counts: Tuple[np.ndarray, np.ndarray, np.ndarray]  # (slices along axis, labels)
+
+    def tumor_area(self, axis: int) -> np.ndarray:
+        return self.counts[axis][:, 1:].sum(axis=1)
+
+    def top_slices(self, axis: int, num_slices: int) -> List[int]:
+        """
+        `num_slices` evenly spread picks among the 2 * `num_slices` slices
+        with the most tumor, in index order; the middle slices if the axis
+        is too short.
+        """
+        area = self.tumor_area(axis)
+        # Stable sort so ties keep the lower index first
+        top = np.sort(np.argsort(-area, kind='stable')[:min(num_slices * 2, len(area))])
+        if len(top) >= num_slices:
+            return [int(top[i]) for i in np.linspace(0, len(top) - 1, num_slices, dtype=int)]
+        middle = len(area) // 2
+        selected = range(middle - num_slices // 2, middle + num_slices // 2 + 1)
+        return [max(0, min(len(area) - 1, s)) for s in selected][:num_slices]
+
+    def key_slices(self) -> Dict[str, int]:
+        """Slice with the largest tumor cross-section on each axis, or the center without tumor."""
+        key = {}
+        for axis, name in enumerate(AXIS_NAMES):
+            area = self.tumor_area(axis)
+            key[name] = int(np.argmax(area)) if area.any() else len(area) // 2
+        return key
+
+    def to_dict(self) -> Dict[str, list]:
+        return {name: self.counts[axis].tolist() for axis, name in enumerate(AXIS_NAMES)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, list]) -> "SliceRanking":
+        return cls(tuple(np.asarray(data[name], dtype=np.int64).reshape(len(data[name]), -1)
+                         for name in AXIS_NAMES))
+
+def compute_slice_ranking(labels: np.ndarray, num_labels: int = 4,
+                          roi: Optional[Tuple[slice, ...]] = None) -> SliceRanking:
+    """
+    Label histograms of every sagittal, coronal and axial slice in one
+    reduction. Only the box enclosing the non-zero labels (`roi`, found
+    when not given) is scanned per label; background counts are the remainder.
+    """
+    if not np.issubdtype(labels.dtype, np.integer):
+        labels = np.rint(labels).astype(np.uint8 if labels.max(initial=0) < 256 else np.int32)
+
+    if roi is None:
+        roi = nonzero_box(labels)
+    roi_labels = labels[roi] if roi is not None else labels[:0, :0, :0]
+    present = np.flatnonzero(np.bincount(roi_labels.ravel().astype(np.intp)))
+    num_labels = max(num_labels, int(present[-1]) + 1 if len(present) else 0)
+    counts = [np.zeros((size, num_labels), dtype=np.int64) for size in labels.shape[:3]]
+
+    for label in present[present > 0].tolist():
+        mask = roi_labels == label
+        for axis in range(3):
+            others = tuple(a for a in range(3) if a != axis)
+            counts[axis][roi[axis], label] = np.count_nonzero(mask, axis=others)
+
+    for axis in range(3):
+        slice_size = labels.size // labels.shape[axis]
+        counts[axis][:, 0] = slice_size - counts[axis][:, 1:].sum(axis=1)
+    return SliceRanking(tuple(counts))
+
+def nonzero_box(labels: np.ndarray) -> Optional[Tuple[slice, ...]]:
+    """
+    Bounding box of the non-zero voxels. The full volume is reduced once
+    along its slowest-varying axis, which is far cheaper than
+    `ndimage.find_objects`; the remaining axis is then found inside the box.
+    """
+    outer = 2 if labels.flags.f_contiguous and not labels.flags.c_contiguous else 0
+    inner = [a for a in range(3) if a != outer]
+    plane = labels.max(axis=outer)
+    if not plane.any():
+        return None
+    box = [None] * 3
+    for position, axis in enumerate(inner):
+        hits = np.flatnonzero(plane.any(axis=1 - position))
+        box[axis] = slice(int(hits[0]), int(hits[-1]) + 1)
+    box[outer] = slice(None)
+    hits = np.flatnonzero(labels[tuple(box)].any(axis=tuple(inner)))
+    box[outer] = slice(int(hits[0]), int(hits[-1]) + 1)
+    return tuple(box)
@@ -0,0 +1,139 @@
+# app/utils/overlay_renderer.py
+import io
+import numpy as np
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+from PIL import Image, ImageDraw, ImageFont
+
+# Same blending as the matplotlib figure: slices drawn with alpha 0.8 on
+# white, label colors at their own alpha times the overlay alpha of 0.6
+IMAGE_ALPHA = 0.8
+OVERLAY_ALPHA = 0.6
+
+PANEL_SIZE = 480
+GAP = 16
+TITLE_HEIGHT = 44
+SLICE_TITLE_HEIGHT = 28
+LEGEND_HEIGHT = 40
+
+@lru_cache(maxsize=8)
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def intensity_window(volume: np.ndarray, lower: float, upper: float) -> Tuple[float, float]:
+    """
+    `lower` and `upper` percentiles of the positive voxels, as
+    `np.percentile(volume[volume > 0], ...)`. Integer scans are counted in
+    a histogram instead of sorting a copy of every brain voxel.
+    """
+    if volume.dtype.kind not in "iu" or volume.max(initial=0) >= 2 ** 16:
+        return tuple(float(v) for v in np.percentile(volume[volume > 0], [lower, upper]))
+
+    counts = np.bincount(np.maximum(volume, 0).ravel())
+    counts[0] = 0
+    cumulative = np.cumsum(counts)
+    total = int(cumulative[-1])
+    if total == 0:
+        raise ValueError("volume has no positive voxels")
+
+    def value_at(rank: int) -> int:
+        return int(np.searchsorted(cumulative, rank, side="right"))
+
+    window = []
+    for q in (lower, upper):
+        # Linear interpolation between neighbouring ranks, numpy's default method
+        position = (total - 1) * q / 100.0
+        below = int(np.floor(position))
+        low, high = value_at(below), value_at(min(below + 1, total - 1))
+        window.append(low + (position - below) * (high - low))
+    return tuple(window)
+
+def build_lut(colors: Dict[int, Tuple[float, float, float, float]],
+              image_alpha: float = IMAGE_ALPHA) -> np.ndarray:
+    """
+    (labels, 256, 3) uint8 table mapping a label and an 8-bit gray level
+    straight to the composited RGB pixel.
+    """
+    num_labels = max(colors) + 1
+    gray = np.arange(256, dtype=np.float32) / 255.0
+    base = (1.0 - image_alpha) + image_alpha * gray
+    lut = np.empty((num_labels, 256, 3), dtype=np.float32)
+    lut[:] = base[None, :, None]
+    for label, (r, g, b, a) in colors.items():
+        if label == 0 or a == 0:
+            continue
+        alpha = a * OVERLAY_ALPHA
+        lut[label] = base[:, None] * (1.0 - alpha) + np.array([r, g, b], dtype=np.float32) * alpha
+    return np.round(lut * 255).astype(np.uint8)
+
+def composite_slice(gray: np.ndarray, labels: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """RGB slice from a [0, 1] gray image and its label map, one table lookup per pixel."""
+    gray_u8 = np.clip(gray * 255.0 + 0.5, 0, 255).astype(np.uint8)
+    labels = np.asarray(labels)
+    if labels.dtype != np.uint8:
+        labels = np.rint(labels).astype(np.intp)
+    labels = np.where(labels < lut.shape[0], labels, 0)
+    return lut[labels, gray_u8]
+
+def render_overlay_strip(panels: Sequence[np.ndarray], panel_titles: Sequence[str], title: str,
+                         legend: List[Tuple[str, Tuple[float, float, float, float]]],
+                         image_format: str = "png", quality: int = 90) -> bytes:
+    """
+    Lay out RGB panels like the matplotlib overlay figure - a title, one
+    captioned panel per slice and a legend row - and encode the result.
+    """
+    height, width = panels[0].shape[:2]
+    scale = max(1, round(PANEL_SIZE / max(height, width)))
+    panel_w, panel_h = width * scale, height * scale
+
+    canvas_w = len(panels) * panel_w + (len(panels) + 1) * GAP
+    canvas_h = TITLE_HEIGHT + SLICE_TITLE_HEIGHT + panel_h + LEGEND_HEIGHT + GAP
+    canvas = Image.new("RGB", (canvas_w, canvas_h), "white")
+    draw = ImageDraw.Draw(canvas)
+
+    _centered_text(draw, title, canvas_w / 2, TITLE_HEIGHT / 2, _font(24))
+    top = TITLE_HEIGHT + SLICE_TITLE_HEIGHT
+    for i, (panel, caption) in enumerate(zip(panels, panel_titles)):
+        left = GAP + i * (panel_w + GAP)
+        image = Image.fromarray(np.ascontiguousarray(panel), "RGB")
+        if scale > 1:
+            image = image.resize((panel_w, panel_h), Image.NEAREST)
+        canvas.paste(image, (left, top))
+        _centered_text(draw, caption, left + panel_w / 2, TITLE_HEIGHT + SLICE_TITLE_HEIGHT / 2,
+                       _font(18))
+
+    _draw_legend(draw, legend, canvas_w, top + panel_h + LEGEND_HEIGHT / 2)
+
+    buffer = io.BytesIO()
+    if image_format == "webp":
+        canvas.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        canvas.save(buffer, format="PNG", compress_level=3)
+    return buffer.getvalue()
+
+def _centered_text(draw: ImageDraw.ImageDraw, text: str, x: float, y: float, font):
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    draw.text((x - (right - left) / 2 - left, y - (bottom - top) / 2 - top), text,
+              fill="black", font=font)
+
+def _draw_legend(draw: ImageDraw.ImageDraw, legend, canvas_w: int, y: float):
+    font = _font(16)
+    swatch = 18
+    entries = []
+    for name, (r, g, b, a) in legend:
+        # Swatch shown as it appears over a white background
+        fill = tuple(int(round(255 * (1 - a + a * c))) for c in (r, g, b))
+        text_w = draw.textbbox((0, 0), name, font=font)[2]
+        entries.append((name, fill, swatch + 8 + text_w))
+
+    total = sum(w for _, _, w in entries) + 24 * (len(entries) - 1)
+    x = (canvas_w - total) / 2
+    # One baseline for all labels, whether or not they have descenders
+    _, top, _, bottom = draw.textbbox((0, 0), "Ag", font=font)
+    for name, fill, entry_w in entries:
+        draw.rectangle([x, y - swatch / 2, x + swatch, y + swatch / 2], fill=fill, outline="black")
+        draw.text((x + swatch + 8, y - (bottom - top) / 2 - top), name, fill="black", font=font)
+        x += entry_w + 24
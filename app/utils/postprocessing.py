@@ -1,33 +1,40 @@
 # app/utils/postprocessing.py
+import gzip
 import numpy as np
 import nibabel as nib
 from pathlib import Path
+from app.utils.preprocessing import CROP_ROI
 
 class PostProcessor:
     @staticmethod
-    def save_segmentation_mask(pred_mask: np.ndarray, original_shape: tuple, 
-                             reference_nifti, output_path: Path):
-        """
-        Save segmentation mask as NIfTI file.
-        
-        Args:
-            pred_mask: Predicted segmentation mask
-            original_shape: Original image shape
-            reference_nifti: Reference NIfTI image for affine matrix
-            output_path: Output file path
-        """
+    def to_full_size(pred_mask: np.ndarray, original_shape: tuple, crop: bool = True) -> np.ndarray:
+        """Map a (D, H, W) model-space mask back to a uint8 mask in the original (H, W, D) space."""
         # Transpose mask to original orientation
         pred_mask_transposed = pred_mask.transpose(1, 2, 0)
         
         # Create full-size mask
-        full_size_mask = np.zeros(original_shape, dtype=np.uint8)
-        full_size_mask[56:184, 56:184, 13:141] = pred_mask_transposed
-        
-        # Create NIfTI image with original affine
+        if crop:
+            full_size_mask = np.zeros(original_shape, dtype=np.uint8)
+            full_size_mask[CROP_ROI] = pred_mask_transposed
+        else:
+            full_size_mask = np.ascontiguousarray(pred_mask_transposed, dtype=np.uint8)
+        return full_size_mask
+
+    @staticmethod
+    def save_full_size_mask(full_size_mask: np.ndarray, reference_nifti,
+                            output_path: Path, compresslevel: int = 1) -> nib.Nifti1Image:
+        # Create NIfTI image with original affine; the header declares uint8
+        # without scaling so readers get labels, not floats
         affine = reference_nifti.affine
-        output_nifti = nib.Nifti1Image(full_size_mask, affine)
+        output_nifti = nib.Nifti1Image(full_size_mask.astype(np.uint8, copy=False), affine)
+        output_nifti.header.set_data_dtype(np.uint8)
         
-        # Save
-        nib.save(output_nifti, output_path)
+        # Save; no name or mtime in the gzip header, so identical masks are byte-identical
+        if str(output_path).endswith(".gz"):
+            with open(output_path, "wb") as raw, gzip.GzipFile(
+                    filename="", mode="wb", fileobj=raw, compresslevel=compresslevel, mtime=0) as f:
+                output_nifti.to_file_map({'image': nib.FileHolder(fileobj=f)})
+        else:
+            nib.save(output_nifti, output_path)
         
-        return output_path
+        return output_nifti
@@ -2,57 +2,97 @@
 import numpy as np
 import nibabel as nib
 import torch
-from sklearn.preprocessing import MinMaxScaler
-import torchvision.transforms as transforms
 from pathlib import Path
+from typing import Any, Optional, Tuple
+
+# Fixed 128x128x128 region the model was trained on for 240x240x155 BraTS volumes
+CROP_ROI = (slice(56, 184), slice(56, 184), slice(13, 141))
+CROP_SOURCE_SHAPE = (240, 240, 155)
 
 class ImagePreprocessor:
-    def __init__(self):
-        self.scaler = MinMaxScaler()
-        self.normalizer = transforms.Normalize(mean=[0.5], std=[0.5])
-    
-    def load_nifti(self, file_path: Path) -> np.ndarray:
-        """Load NIfTI file and return data array."""
+    # MinMax scaling to [0, 1] followed by Normalize(mean=0.5, std=0.5)
+    NORMALIZE_MEAN = 0.5
+    NORMALIZE_STD = 0.5
+
+    def __init__(self, volume_cache=None):
+        self.volume_cache = volume_cache
+
+    def load_nifti(self, file_path: Path) -> Tuple[np.ndarray, Any]:
+        """Load NIfTI file and return data array in its stored dtype."""
+        if self.volume_cache is not None:
+            volume = self.volume_cache.load(file_path)
+            return volume.data, volume
         nifti_img = nib.load(file_path)
-        return nifti_img.get_fdata(), nifti_img
-    
-    def preprocess_modality(self, img_data: np.ndarray) -> np.ndarray:
-        """Preprocess a single modality using MinMax scaling."""
-        img_flat = img_data.reshape(-1, img_data.shape[-1])
-        img_scaled = self.scaler.fit_transform(img_flat)
-        return img_scaled.reshape(img_data.shape)
-    
-    def preprocess_input(self, flair_path: Path, t1ce_path: Path, t2_path: Path):
+        return np.asanyarray(nifti_img.dataobj), nifti_img
+
+    def get_shape(self, file_path: Path) -> tuple:
+        """Read the volume shape from the NIfTI header without decoding the data."""
+        return tuple(nib.load(file_path).shape[:3])
+
+    def preprocess_modality(self, img_data: np.ndarray, roi: Optional[tuple] = None,
+                            out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Scale each axial slice to [0, 1] and normalize it in a single float32 pass.
+
+        Slice minima and maxima are taken over the whole slice, so cropping to
+        `roi` first yields exactly what scaling the full volume and cropping
+        afterwards would. Constant slices map to 0 like sklearn's MinMaxScaler.
+
+        Args:
+            img_data: Volume of shape (H, W, D) in any numeric dtype
+            roi: Optional (x, y, z) slices to keep
+            out: Optional float32 array of shape (D, H, W) (cropped) to write into
+
+        Returns:
+            Normalized float32 array of shape (D, H, W)
+        """
+        slice_min = img_data.min(axis=(0, 1)).astype(np.float32)
+        slice_range = img_data.max(axis=(0, 1)).astype(np.float32) - slice_min
+        slice_range[slice_range == 0] = 1.0
+
+        # ((x - min) / range - mean) / std  ==  x * scale + offset
+        scale = np.float32(1.0 / self.NORMALIZE_STD) / slice_range
+        offset = -slice_min * scale - np.float32(self.NORMALIZE_MEAN / self.NORMALIZE_STD)
+
+        if roi is not None:
+            img_data = img_data[roi]
+            scale = scale[roi[2]]
+            offset = offset[roi[2]]
+
+        src = img_data.transpose(2, 0, 1)
+        if out is None:
+            out = np.empty(src.shape, dtype=np.float32)
+        np.multiply(src, scale[:, None, None], out=out, casting='unsafe')
+        np.add(out, offset[:, None, None], out=out)
+        return out
+
+    def preprocess_input(self, flair_path: Path, t1ce_path: Path, t2_path: Path,
+                         crop: bool = True):
         """
         Preprocess multi-modal input for segmentation.
-        
+
         Args:
             flair_path: Path to FLAIR image
-            t1ce_path: Path to T1CE image  
+            t1ce_path: Path to T1CE image
             t2_path: Path to T2 image
-            
+            crop: Crop to the fixed training ROI; otherwise keep the whole volume
+
         Returns:
             Preprocessed tensor and original shape
         """
-        # Load images
-        flair_img, flair_nifti = self.load_nifti(flair_path)
-        t1ce_img, _ = self.load_nifti(t1ce_path)
-        t2_img, _ = self.load_nifti(t2_path)
-        
-        # Scale each modality
-        flair_scaled = self.preprocess_modality(flair_img)
-        t1ce_scaled = self.preprocess_modality(t1ce_img)
-        t2_scaled = self.preprocess_modality(t2_img)
-        
-        # Stack modalities
-        combined_img = np.stack([flair_scaled, t1ce_scaled, t2_scaled], axis=3)
-        
-        # Crop to expected size
-        cropped_img = combined_img[56:184, 56:184, 13:141]
-        
-        # Convert to tensor
-        img_tensor = torch.from_numpy(cropped_img).permute(3, 2, 0, 1)
-        img_tensor = self.normalizer(img_tensor.float())
-        img_tensor = img_tensor.unsqueeze(0)
-        
-        return img_tensor, flair_img.shape, flair_nifti
+        roi = CROP_ROI if crop else None
+        tensor = None
+        flair_nifti = None
+
+        for channel, path in enumerate((flair_path, t1ce_path, t2_path)):
+            img_data, nifti_img = self.load_nifti(path)
+            if channel == 0:
+                flair_nifti = nifti_img
+                original_shape = img_data.shape
+                x, y, z = (img_data[roi] if roi else img_data).shape[:3]
+                # Written in place in the model's (N, C, D, H, W) layout
+                tensor = np.empty((1, 3, z, x, y), dtype=np.float32)
+            self.preprocess_modality(img_data, roi, out=tensor[0, channel])
+            del img_data
+
+        return torch.from_numpy(tensor), original_shape, flair_nifti
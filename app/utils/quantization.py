@@ -0,0 +1,97 @@
+# app/utils/quantization.py
+import copy
+import json
+import numpy as np
+import torch
+import torch.nn as nn
+from pathlib import Path
+from typing import Any, Dict, Iterable, Tuple
+from app.models.unet3d import UNet3D
+
+PRECISIONS = ("fp32", "bf16", "int8")
+TUMOR_LABELS = {1: "necrotic_core", 2: "edema", 3: "enhancing"}
+
+def load_unet3d(checkpoint: str, device: str = "cpu") -> nn.Module:
+    """fp32 UNet3D in eval mode with frozen weights."""
+    model = UNet3D(in_channels=3, out_channels=4)
+    state = torch.load(checkpoint, map_location=device)
+    model.load_state_dict(state['model'])
+    del state
+    model.to(device)
+    model.eval()
+    # Shared between concurrent requests, so nothing may mutate the weights
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return model
+
+class Bf16Autocast(nn.Module):
+    """Runs a model under bf16 autocast and returns fp32 logits."""
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, inputs: torch.Tensor) -> torch.Tensor:
+        with torch.autocast(device_type=inputs.device.type, dtype=torch.bfloat16):
+            outputs = self.model(inputs)
+        return outputs.float()
+
+    def segment(self, inputs: torch.Tensor, chunk_depth: int = 32) -> torch.Tensor:
+        with torch.autocast(device_type=inputs.device.type, dtype=torch.bfloat16):
+            return self.model.segment(inputs, chunk_depth)
+
+def quantize_int8(model: nn.Module, calibration: Iterable[torch.Tensor]) -> torch.jit.ScriptModule:
+    """
+    Static post-training INT8 quantization with FX graph mode: Conv3d, its
+    BatchNorm and ReLU are fused, activation ranges are observed on the
+    calibration inputs and the result is traced and frozen so it can be
+    saved and loaded without the quantization tooling. Dynamic quantization
+    would leave every Conv3d in fp32, so it is not offered.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    backend = torch.backends.quantized.engine
+    inputs = iter(calibration)
+    example = next(inputs)
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(backend),
+                          (example,))
+    with torch.no_grad():
+        prepared(example)
+        for batch in inputs:
+            prepared(batch)
+        quantized = convert_fx(prepared)
+        return torch.jit.freeze(torch.jit.trace(quantized, example, check_trace=False))
+
+def dice_scores(reference: np.ndarray, candidate: np.ndarray) -> Dict[int, float]:
+    """Per-label Dice of two label volumes; a label absent from both scores 1."""
+    scores = {}
+    for label in TUMOR_LABELS:
+        ref = reference == label
+        cand = candidate == label
+        total = int(ref.sum()) + int(cand.sum())
+        scores[label] = 1.0 if total == 0 else 2.0 * int(np.logical_and(ref, cand).sum()) / total
+    return scores
+
+def artifact_paths(model_dir: Path, digest: str, precision: str) -> Tuple[Path, Path]:
+    """Quantized model and accuracy gate report of a checkpoint (by content digest)."""
+    base = Path(model_dir) / "quantized" / f"{digest[:16]}-{precision}"
+    return Path(f"{base}.pt"), Path(f"{base}.gate.json")
+
+def check_gate(gate_path: Path, digest: str, precision: str, min_dice: float) -> Dict[str, Any]:
+    """
+    The accuracy gate report for this checkpoint and precision; raises
+    RuntimeError unless every label's mean Dice against fp32 reaches `min_dice`.
+    """
+    try:
+        gate = json.loads(Path(gate_path).read_text())
+    except (OSError, ValueError):
+        raise RuntimeError(f"No accuracy gate report for {precision} inference at {gate_path}; "
+                           f"run quantize_model.py --precision {precision} first")
+    if gate.get('checkpoint') != digest or gate.get('precision') != precision:
+        raise RuntimeError(f"Accuracy gate report {gate_path} was made for another checkpoint")
+    failing = {label: dice for label, dice in gate.get('mean_dice', {}).items() if dice < min_dice}
+    if failing or not gate.get('mean_dice'):
+        raise RuntimeError(f"{precision} inference failed its accuracy gate "
+                           f"(mean Dice below {min_dice}: {failing or 'no cases evaluated'})")
+    return gate
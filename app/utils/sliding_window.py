@@ -0,0 +1,133 @@
+# app/utils/sliding_window.py
+import numpy as np
+import torch
+import torch.nn.functional as F
+from typing import Callable, List, Sequence, Tuple
+
+class SlidingWindowInferer:
+    """
+    Tiled inference over a whole volume.
+
+    Patches are cut with the given overlap, pushed through the predictor
+    `batch_size` at a time and their softmax outputs are blended back with a
+    Gaussian (or constant) importance map. Only one patch batch lives on the
+    model device at any time, so peak memory follows the batch size rather
+    than the volume size.
+
+    Patches are visited in order along the first axis, so the blended scores
+    are only kept for one patch depth: rows the sweep has passed are final
+    and go straight into the uint8 labels.
+    """
+
+    def __init__(self, patch_size: Sequence[int] = (128, 128, 128), overlap: float = 0.25,
+                 batch_size: int = 1, blend_mode: str = "gaussian",
+                 sigma_scale: float = 0.125, pad_value: float = -1.0):
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        if blend_mode not in ("gaussian", "constant"):
+            raise ValueError(f"Unknown blend mode: {blend_mode}")
+        self.patch_size = tuple(int(p) for p in patch_size)
+        self.overlap = overlap
+        self.batch_size = max(1, int(batch_size))
+        self.blend_mode = blend_mode
+        self.sigma_scale = sigma_scale
+        self.pad_value = pad_value
+        self._importance = self._importance_map()
+
+    def __call__(self, volume: torch.Tensor,
+                 predictor: Callable[[torch.Tensor], torch.Tensor],
+                 device: torch.device = torch.device("cpu")) -> torch.Tensor:
+        """
+        Segment a full volume.
+
+        Args:
+            volume: Input tensor of shape (1, C, D, H, W), kept on the host
+            predictor: Callable mapping (B, C, *patch) to (B, K, *patch) logits
+            device: Device the predictor runs on
+
+        Returns:
+            uint8 label tensor of shape (D, H, W)
+        """
+        spatial = tuple(volume.shape[2:])
+        volume = self._pad(volume)
+        padded = tuple(volume.shape[2:])
+
+        starts = self._patch_starts(padded)
+        importance = self._importance.to(device)
+        depth = self.patch_size[0]
+        labels = torch.empty(padded, dtype=torch.uint8)
+        # Class scores of rows [base, base + depth) along the first axis
+        scores = None
+        base = 0
+
+        for i in range(0, len(starts), self.batch_size):
+            batch_starts = starts[i:i + self.batch_size]
+            batch = torch.cat([volume[(0, slice(None), *self._window(s))].unsqueeze(0)
+                               for s in batch_starts])
+
+            with torch.no_grad():
+                probs = torch.softmax(predictor(batch.to(device)), dim=1)
+                probs.mul_(importance)
+            probs = probs.cpu()
+
+            if scores is None:
+                scores = torch.zeros((probs.shape[1], depth, *padded[1:]), dtype=torch.float32)
+            for patch_probs, s in zip(probs, batch_starts):
+                if s[0] > base:
+                    base = self._flush(scores, labels, base, s[0])
+                window = (slice(None), slice(s[0] - base, s[0] - base + depth),
+                          *self._window(s)[1:])
+                scores[window] += patch_probs
+            del batch, probs
+
+        self._flush(scores, labels, base, padded[0])
+        return labels[tuple(slice(0, s) for s in spatial)]
+
+    @staticmethod
+    def _flush(scores: torch.Tensor, labels: torch.Tensor, base: int, stop: int) -> int:
+        """Write the labels of rows [base, stop), which no later patch touches, and slide the scores."""
+        n = stop - base
+        # Every class in a voxel shares the same blending weight, so the argmax
+        # of the weighted sum equals the argmax of the normalized average.
+        labels[base:stop] = torch.argmax(scores[:, :n], dim=0)
+        keep = scores.shape[1] - n
+        if keep > 0:
+            scores[:, :keep] = scores[:, n:].clone()
+        scores[:, max(keep, 0):] = 0
+        return stop
+
+    def _pad(self, volume: torch.Tensor) -> torch.Tensor:
+        spatial = volume.shape[2:]
+        pad = []
+        for size, patch in reversed(list(zip(spatial, self.patch_size))):
+            pad.extend([0, max(0, patch - size)])
+        if any(pad):
+            volume = F.pad(volume, pad, mode="constant", value=self.pad_value)
+        return volume
+
+    def _patch_starts(self, spatial: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        axes = []
+        for size, patch in zip(spatial, self.patch_size):
+            step = max(1, int(patch * (1 - self.overlap)))
+            positions = list(range(0, size - patch, step)) + [size - patch]
+            axes.append(sorted(set(positions)))
+        grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(axes))
+        return [tuple(int(v) for v in row) for row in grid]
+
+    def _window(self, start: Tuple[int, ...]) -> Tuple[slice, ...]:
+        return tuple(slice(s, s + p) for s, p in zip(start, self.patch_size))
+
+    def _importance_map(self) -> torch.Tensor:
+        if self.blend_mode == "constant":
+            return torch.ones(self.patch_size, dtype=torch.float32)
+
+        weights = np.ones(1, dtype=np.float64)
+        for patch in self.patch_size:
+            sigma = max(patch * self.sigma_scale, 1e-3)
+            coords = np.arange(patch, dtype=np.float64) - (patch - 1) / 2
+            weights = np.multiply.outer(weights, np.exp(-0.5 * (coords / sigma) ** 2))
+        weights = weights.reshape(self.patch_size)
+        weights /= weights.max()
+        # Keep border voxels from contributing exactly nothing
+        weights = np.maximum(weights, 1e-4)
+        return torch.from_numpy(weights.astype(np.float32))
@@ -0,0 +1,218 @@
+# app/utils/volume_io.py
+import hashlib
+import json
+import os
+import threading
+import nibabel as nib
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+_conversion_locks: Dict[str, threading.Lock] = {}
+_conversion_locks_guard = threading.Lock()
+
+NIFTI_SUFFIXES = (".nii.gz", ".nii")
+WORKING_COPY_VERSION = 1
+
+def file_identity(path: Path) -> list:
+    """Path, mtime and size; a rewritten file gets a new identity."""
+    resolved = Path(path).resolve()
+    stat = os.stat(resolved)
+    return [str(resolved), stat.st_mtime_ns, stat.st_size]
+
+def find_volume(directory: Path, name: str) -> Optional[Path]:
+    """`name.nii.gz` or `name.nii` in `directory`, whichever exists."""
+    for suffix in NIFTI_SUFFIXES:
+        path = Path(directory) / f"{name}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+def working_copy_paths(nifti_path: Path) -> Tuple[Path, Path]:
+    """`flair.nii.gz` -> (`flair.npy`, `flair.json`) next to the original."""
+    nifti_path = Path(nifti_path)
+    stem = nifti_path.name
+    for suffix in NIFTI_SUFFIXES:
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+            break
+    return nifti_path.with_name(f"{stem}.npy"), nifti_path.with_name(f"{stem}.json")
+
+def working_dtype(data: np.ndarray) -> np.dtype:
+    """
+    Integer scans are narrowed to int16 when their values fit (int8/uint8
+    stay as they are); floating-point data, including scaled integers that
+    nibabel already returns as float64, becomes float32, which is all the
+    precision the pipeline uses.
+    """
+    if data.dtype.kind == 'b':
+        return np.dtype(np.uint8)
+    if data.dtype.kind not in 'iu':
+        return np.dtype(np.float32)
+    if data.dtype.itemsize == 1 or data.dtype == np.int16:
+        return data.dtype
+    info = np.iinfo(np.int16)
+    fits = data.size == 0 or (info.min <= int(data.min()) and int(data.max()) <= info.max)
+    return np.dtype(np.int16) if fits else data.dtype
+
+def write_working_copy(nifti_path: Path) -> Dict[str, Any]:
+    """
+    Decode a NIfTI file once into an uncompressed Fortran-order `.npy`
+    plus a JSON sidecar with the geometry, both next to the original.
+    Returns the sidecar contents.
+    """
+    image = nib.load(nifti_path)
+    data = np.asanyarray(image.dataobj)
+    data = np.asfortranarray(data, dtype=working_dtype(data))
+    array_path, meta_path = working_copy_paths(nifti_path)
+    stat = os.stat(nifti_path)
+    meta = {
+        'version': WORKING_COPY_VERSION,
+        'source': {'name': Path(nifti_path).name, 'mtime_ns': stat.st_mtime_ns,
+                   'size': stat.st_size},
+        'shape': list(data.shape),
+        'dtype': data.dtype.str,
+        'zooms': [float(z) for z in image.header.get_zooms()],
+        'affine': image.affine.tolist(),
+    }
+    _atomic_write(array_path, lambda f: np.save(f, data))
+    _atomic_write(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+    return meta
+
+def write_cropped_copy(nifti_path: Path, data: np.ndarray, affine: np.ndarray,
+                       zooms, roi: Optional[Tuple[slice, ...]]) -> Dict[str, Any]:
+    """
+    Working copy of a label mask that was just written to `nifti_path`,
+    holding only the box `roi` around its non-zero labels (None: empty).
+    Readers get the box from `cropped_box` and the full mask from
+    `read_volume`, which pastes the crop into a zero volume.
+    """
+    if roi is None:
+        roi = tuple(slice(0, 0) for _ in data.shape)
+    array_path, meta_path = working_copy_paths(nifti_path)
+    stat = os.stat(nifti_path)
+    meta = {
+        'version': WORKING_COPY_VERSION,
+        'source': {'name': Path(nifti_path).name, 'mtime_ns': stat.st_mtime_ns,
+                   'size': stat.st_size},
+        'shape': list(data.shape),
+        'dtype': data.dtype.str,
+        'zooms': [float(z) for z in zooms],
+        'affine': np.asarray(affine).tolist(),
+        'bbox': [[s.start, s.stop] for s in roi],
+    }
+    crop = np.asfortranarray(data[roi])
+    _atomic_write(array_path, lambda f: np.save(f, crop))
+    _atomic_write(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+    return meta
+
+def cropped_box(nifti_path: Path) -> Optional[Tuple[slice, ...]]:
+    """Bounding box of the labels from a mask's cropped copy; None if there is none."""
+    working = open_working_copy(nifti_path)
+    if working is None or 'bbox' not in working[1]:
+        return None
+    return tuple(slice(start, stop) for start, stop in working[1]['bbox'])
+
+def open_working_copy(nifti_path: Path) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Read-only map of the working copy and its sidecar; None if absent or
+    stale. For cropped mask copies the array is only the `bbox` region.
+    """
+    array_path, meta_path = working_copy_paths(nifti_path)
+    try:
+        meta = json.loads(meta_path.read_text())
+        stat = os.stat(nifti_path)
+    except (OSError, ValueError):
+        return None
+    source = meta.get('source', {})
+    if (meta.get('version') != WORKING_COPY_VERSION or source.get('mtime_ns') != stat.st_mtime_ns
+            or source.get('size') != stat.st_size):
+        return None
+    try:
+        data = np.load(array_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    expected = [stop - start for start, stop in meta['bbox']] if 'bbox' in meta else meta['shape']
+    if list(data.shape) != expected:
+        return None
+    return data, meta
+
+def working_copy_header(meta: Dict[str, Any]) -> nib.Nifti1Header:
+    """NIfTI header describing a working copy (dtype, shape, zooms and affine)."""
+    header = nib.Nifti1Header()
+    header.set_data_dtype(np.dtype(meta['dtype']))
+    header.set_data_shape(meta['shape'])
+    header.set_zooms(meta['zooms'])
+    affine = np.array(meta['affine'])
+    header.set_qform(affine, code=1)
+    header.set_sform(affine, code=1)
+    return header
+
+def read_volume(nifti_path: Path) -> Tuple[np.ndarray, np.ndarray, Any]:
+    """(data, affine, header), from the working copy when there is a current one."""
+    working = open_working_copy(nifti_path)
+    if working is not None:
+        data, meta = working
+        if 'bbox' in meta:
+            # Zero pages outside the box are never touched
+            crop = data
+            data = np.zeros(meta['shape'], dtype=crop.dtype, order='F')
+            data[tuple(slice(start, stop) for start, stop in meta['bbox'])] = crop
+        return data, np.array(meta['affine']), working_copy_header(meta)
+    image = nib.load(nifti_path)
+    return np.asanyarray(image.dataobj), image.affine, image.header
+
+def memmap_path(nifti_path: Path, cache_dir: Path) -> Path:
+    digest = hashlib.sha256(json.dumps(file_identity(nifti_path)).encode()).hexdigest()
+    return Path(cache_dir) / digest[:2] / f"{digest}.npy"
+
+def ensure_memmap(nifti_path: Path, cache_dir: Path, max_bytes: Optional[int] = None) -> np.ndarray:
+    """
+    Read-only memory map of an uncompressed copy of a NIfTI volume.
+
+    The first call inflates the file once into `cache_dir` as a `.npy`;
+    later calls only map it, so reading one slice touches a few pages
+    instead of decompressing the whole volume. The copy is stored in
+    Fortran order like NIfTI itself, which keeps axial slices contiguous.
+    Uploads already have a working copy next to them, which is used as is;
+    masks with a cropped copy are expanded from it rather than inflated.
+    """
+    working = open_working_copy(nifti_path)
+    if working is not None and 'bbox' not in working[1]:
+        return working[0]
+    target = memmap_path(nifti_path, cache_dir)
+    if not target.exists():
+        with _conversion_lock(target):
+            if not target.exists():
+                data = np.asfortranarray(read_volume(nifti_path)[0])
+                target.parent.mkdir(parents=True, exist_ok=True)
+                _atomic_write(target, lambda f: np.save(f, data))
+                if max_bytes is not None:
+                    prune_memmaps(cache_dir, max_bytes, keep=target)
+    return np.load(target, mmap_mode="r")
+
+def prune_memmaps(cache_dir: Path, max_bytes: int, keep: Optional[Path] = None):
+    """Delete the least recently created copies beyond `max_bytes`; open maps stay valid."""
+    files = sorted(Path(cache_dir).glob("*/*.npy"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    for path in files:
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        total -= path.stat().st_size
+        path.unlink(missing_ok=True)
+        logger.info(f"Pruned volume copy {path.name}")
+
+def _conversion_lock(target: Path) -> threading.Lock:
+    with _conversion_locks_guard:
+        return _conversion_locks.setdefault(str(target), threading.Lock())
+
+def _atomic_write(target: Path, write):
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, target)
@@ -0,0 +1,183 @@
+# batch_features.py - Cohort feature extraction into one Parquet table
+import argparse
+import multiprocessing
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import nibabel as nib
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.core.config import settings
+from app.models.schemas import ClinicalFeatures
+from app.utils.volume_io import cropped_box, find_volume, read_volume
+
+SEGMENTATION_SUFFIX = "_segmentation.nii.gz"
+ARROW_TYPES = {str: pa.string(), float: pa.float64(), int: pa.int64(), bool: pa.bool_()}
+
+# Extra columns that tie each row back to its inputs
+SOURCE_FIELDS = [
+    pa.field("task_id", pa.string(), nullable=False),
+    pa.field("upload_id", pa.string()),
+    pa.field("segmentation_path", pa.string()),
+]
+
+
+def feature_schema() -> pa.Schema:
+    """Arrow schema with one typed column per ClinicalFeatures field."""
+    fields = [pa.field(name, ARROW_TYPES[info.annotation], nullable=False)
+              for name, info in ClinicalFeatures.model_fields.items()]
+    return pa.schema(SOURCE_FIELDS + fields)
+
+
+def find_cases(segmentation_dir: Path, upload_dir: Path,
+               task_db: Optional[Path]) -> Tuple[List[dict], List[str]]:
+    """Pair every `<task_id>_segmentation.nii.gz` with the upload it was predicted from."""
+    store = None
+    if task_db and task_db.exists():
+        from app.services.task_store import SQLiteTaskStore
+        store = SQLiteTaskStore(task_db)
+
+    cases, missing = [], []
+    for segmentation_path in sorted(segmentation_dir.glob(f"*{SEGMENTATION_SUFFIX}")):
+        task_id = segmentation_path.name[:-len(SEGMENTATION_SUFFIX)]
+        params = (store.get_params(task_id) if store else None) or {}
+        # Fall back to uploads named after the case, as in exported cohorts
+        upload_id = params.get("upload_id") or task_id
+        t1ce_path = find_volume(upload_dir / upload_id, "t1ce")
+        flair_path = find_volume(upload_dir / upload_id, "flair")
+        if t1ce_path is None or flair_path is None:
+            missing.append(task_id)
+            continue
+        cases.append({
+            "task_id": task_id,
+            "upload_id": upload_id,
+            "segmentation_path": str(segmentation_path),
+            "t1ce_path": str(t1ce_path),
+            "flair_path": str(flair_path),
+        })
+    return cases, missing
+
+
+def extract_case(case: dict) -> Tuple[dict, Optional[dict], Optional[str]]:
+    """Worker entry point: (case, feature row or None, error message or None)."""
+    from app.services.feature_extraction_service import FeatureExtractionService
+
+    try:
+        # Read directly (working copies when present) rather than through
+        # the API's shared volume cache
+        t1ce_img = read_volume(case["t1ce_path"])[0]
+        seg_img = read_volume(case["segmentation_path"])[0]
+        voxel_size = nib.load(case["flair_path"]).header.get_zooms()[:3]
+        features = FeatureExtractionService().extract_features_from_arrays(
+            t1ce_img, seg_img, voxel_size, f"case_{case['task_id']}",
+            roi=cropped_box(case["segmentation_path"])
+        )
+        row = ClinicalFeatures(**features).model_dump()
+        row.update(task_id=case["task_id"], upload_id=case["upload_id"],
+                   segmentation_path=case["segmentation_path"])
+        return case, row, None
+    except Exception as e:
+        return case, None, f"{type(e).__name__}: {e}"
+
+
+def completed_task_ids(parts_dir: Path) -> set:
+    """Case IDs already written by an earlier, interrupted run."""
+    done = set()
+    for part in sorted(parts_dir.glob("part-*.parquet")):
+        done.update(pq.read_table(part, columns=["task_id"]).column("task_id").to_pylist())
+    return done
+
+
+def write_part(parts_dir: Path, rows: List[dict], schema: pa.Schema) -> Path:
+    index = len(list(parts_dir.glob("part-*.parquet")))
+    part = parts_dir / f"part-{index:05d}.parquet"
+    tmp = part.with_suffix(".tmp")
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), tmp)
+    tmp.replace(part)  # a crash mid-write never leaves a readable partial part
+    return part
+
+
+def run(cases: List[dict], output: Path, workers: int, chunksize: int,
+        flush_every: int) -> Tuple[int, Dict[str, str]]:
+    schema = feature_schema()
+    parts_dir = output.with_name(output.name + ".parts")
+    parts_dir.mkdir(parents=True, exist_ok=True)
+
+    done = completed_task_ids(parts_dir)
+    pending = [case for case in cases if case["task_id"] not in done]
+    if done:
+        print(f"Resuming: {len(done)} cases already extracted, {len(pending)} to go")
+
+    failures: Dict[str, str] = {}
+    buffer: List[dict] = []
+    processed = 0
+    started = time.perf_counter()
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        results: Iterator = pool.imap_unordered(extract_case, pending, chunksize=chunksize)
+        for case, row, error in results:
+            processed += 1
+            if error:
+                failures[case["task_id"]] = error
+            else:
+                buffer.append(row)
+            if len(buffer) >= flush_every:
+                write_part(parts_dir, buffer, schema)
+                buffer = []
+            if processed % 50 == 0 or processed == len(pending):
+                rate = processed / (time.perf_counter() - started)
+                print(f"  {processed}/{len(pending)} cases  {rate:.1f} cases/s")
+    if buffer:
+        write_part(parts_dir, buffer, schema)
+
+    parts = sorted(parts_dir.glob("part-*.parquet"))
+    table = pa.concat_tables([pq.read_table(part) for part in parts]) if parts \
+        else schema.empty_table()
+    tmp = output.with_suffix(output.suffix + ".tmp")
+    pq.write_table(table.sort_by("task_id"), tmp)
+    tmp.replace(output)
+    # On failure the parts are kept, so a rerun only retries the failed cases
+    if not failures:
+        shutil.rmtree(parts_dir)
+    return table.num_rows, failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Extract clinical features for a cohort of "
+                                                 "segmented cases into one Parquet file")
+    parser.add_argument("--segmentations", type=Path, default=settings.OUTPUT_DIR,
+                        help="directory of <task_id>_segmentation.nii.gz files")
+    parser.add_argument("--uploads", type=Path, default=settings.UPLOAD_DIR,
+                        help="directory of upload folders holding flair/t1ce/t2")
+    parser.add_argument("--task-db", type=Path, default=settings.TASK_DB_PATH,
+                        help="task database used to map task IDs to upload IDs")
+    parser.add_argument("--output", type=Path, default=Path("cohort_features.parquet"))
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=4,
+                        help="cases handed to a worker at a time")
+    parser.add_argument("--flush-every", type=int, default=256,
+                        help="rows per checkpointed part file")
+    args = parser.parse_args()
+
+    cases, missing = find_cases(args.segmentations, args.uploads, args.task_db)
+    for task_id in missing:
+        print(f"Skipping {task_id}: original upload not found")
+    if not cases:
+        print("No segmented cases found")
+        return 1
+
+    print(f"Extracting features for {len(cases)} cases with {args.workers} workers")
+    rows, failures = run(cases, args.output, max(1, args.workers),
+                         max(1, args.chunksize), max(1, args.flush_every))
+    for task_id, error in failures.items():
+        print(f"Failed {task_id}: {error}")
+    print(f"Wrote {rows} rows to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
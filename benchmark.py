@@ -0,0 +1,750 @@
+# benchmark.py - Micro-benchmarks for the processing pipeline
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+
+def make_synthetic_case(directory: Path, shape=(240, 240, 155), seed: int = 0) -> dict:
+    """Write a random BraTS-shaped FLAIR/T1CE/T2 case plus a label mask."""
+    rng = np.random.default_rng(seed)
+    affine = np.eye(4)
+    paths = {}
+    for modality in ("flair", "t1ce", "t2"):
+        data = rng.integers(0, 2000, size=shape, dtype=np.int16)
+        data[:20] = 0
+        paths[modality] = directory / f"{modality}.nii.gz"
+        nib.save(nib.Nifti1Image(data, affine), paths[modality])
+
+    seg = np.zeros(shape, dtype=np.uint8)
+    cx, cy, cz = (s // 2 for s in shape)
+    seg[cx - 30:cx + 30, cy - 25:cy + 25, cz - 20:cz + 20] = 2
+    seg[cx - 15:cx + 15, cy - 15:cy + 15, cz - 10:cz + 10] = 3
+    seg[cx - 6:cx + 6, cy - 6:cy + 6, cz - 4:cz + 4] = 1
+    paths["segmentation"] = directory / "segmentation.nii.gz"
+    nib.save(nib.Nifti1Image(seg, affine), paths["segmentation"])
+    return paths
+
+
+def find_case(case_dir: Path) -> dict:
+    paths = {}
+    for key in ("flair", "t1ce", "t2", "segmentation"):
+        matches = sorted(case_dir.glob(f"*{key}*.nii*"))
+        if matches:
+            paths[key] = matches[0]
+    return paths
+
+
+def measure(fn, repeat: int):
+    """
+    Return (result, best wall time in s, peak traced allocation in bytes).
+    Timed runs are untraced; tracemalloc slows allocation-heavy code by
+    several times, so the peak comes from one extra traced run.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def report(name: str, legacy: tuple, current: tuple):
+    _, legacy_time, legacy_peak = legacy
+    _, current_time, current_peak = current
+    print(f"\n{name}")
+    print(f"  legacy : {legacy_time * 1000:9.1f} ms  peak {legacy_peak / 2**20:8.1f} MB")
+    print(f"  current: {current_time * 1000:9.1f} ms  peak {current_peak / 2**20:8.1f} MB")
+    print(f"  speedup: {legacy_time / current_time:9.2f}x  "
+          f"memory {legacy_peak / max(current_peak, 1):.2f}x lower")
+
+
+# ---------------------------------------------------------------------------
+# preprocess: float32 ImagePreprocessor vs the original sklearn/float64 path
+# ---------------------------------------------------------------------------
+
+def legacy_preprocess_input(flair_path, t1ce_path, t2_path):
+    import torch
+    import torchvision.transforms as transforms
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler = MinMaxScaler()
+    normalizer = transforms.Normalize(mean=[0.5], std=[0.5])
+
+    def scale(img_data):
+        img_flat = img_data.reshape(-1, img_data.shape[-1])
+        return scaler.fit_transform(img_flat).reshape(img_data.shape)
+
+    flair_nifti = nib.load(flair_path)
+    flair_img = flair_nifti.get_fdata()
+    t1ce_img = nib.load(t1ce_path).get_fdata()
+    t2_img = nib.load(t2_path).get_fdata()
+    combined_img = np.stack([scale(flair_img), scale(t1ce_img), scale(t2_img)], axis=3)
+    cropped_img = combined_img[56:184, 56:184, 13:141]
+    img_tensor = torch.from_numpy(cropped_img).permute(3, 2, 0, 1)
+    img_tensor = normalizer(img_tensor.float()).unsqueeze(0)
+    return img_tensor, flair_img.shape, flair_nifti
+
+
+def bench_preprocess(paths: dict, args) -> bool:
+    from app.utils.preprocessing import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor()
+    inputs = (paths["flair"], paths["t1ce"], paths["t2"])
+
+    legacy = measure(lambda: legacy_preprocess_input(*inputs), args.repeat)
+    current = measure(lambda: preprocessor.preprocess_input(*inputs), args.repeat)
+    report("preprocess_input (per case)", legacy, current)
+
+    expected, actual = legacy[0][0], current[0][0]
+    max_diff = float((expected - actual).abs().max())
+    ok = expected.shape == actual.shape and max_diff <= args.tolerance
+    print(f"  parity : shape {tuple(actual.shape)}  max |diff| {max_diff:.2e}  "
+          f"{'OK' if ok else 'FAILED'}")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# features: single-pass label statistics vs per-mask numpy/regionprops
+# ---------------------------------------------------------------------------
+
+def legacy_label_features(t1ce_img, seg_img, voxel_size):
+    """Region measurements as FeatureExtractionService computed them originally."""
+    from skimage import measure
+
+    masks = {
+        "enhancing": (seg_img == 3).astype(int),
+        "necrotic": (seg_img == 1).astype(int),
+        "edema": (seg_img == 2).astype(int),
+        "core": ((seg_img == 1) | (seg_img == 3)).astype(int),
+        "whole": (seg_img > 0).astype(int),
+    }
+    result = {}
+    for name, mask in masks.items():
+        result[f"{name}_mm3"] = np.sum(mask) * np.prod(voxel_size)
+    for name in ("whole", "core", "enhancing"):
+        mask = masks[name]
+        if np.sum(mask) == 0:
+            result[f"{name}_diameter"] = 0
+            continue
+        bbox = measure.regionprops(mask.astype(int))[0].bbox
+        dims = np.array([bbox[3] - bbox[0], bbox[4] - bbox[1], bbox[5] - bbox[2]]) * voxel_size
+        result[f"{name}_diameter"] = np.max(dims)
+    centroid = measure.regionprops(masks["whole"].astype(int))[0].centroid
+    result.update(centroid_x=centroid[0], centroid_y=centroid[1], centroid_z=centroid[2])
+    t1ce_enhancing = t1ce_img[masks["enhancing"] > 0]
+    result["enhancement_mean"] = float(np.mean(t1ce_enhancing))
+    result["enhancement_max"] = float(np.max(t1ce_enhancing))
+    return result
+
+
+def current_label_features(t1ce_img, seg_img, voxel_size):
+    from app.services.feature_extraction_service import FeatureExtractionService
+
+    features = FeatureExtractionService().extract_features_from_arrays(
+        t1ce_img, seg_img, voxel_size, "benchmark")
+    centroid = [float(c) for c in features["centroid_coordinates"].strip("()").split(",")]
+    return features, centroid
+
+
+def bench_features(paths: dict, args) -> bool:
+    if "segmentation" not in paths:
+        print("\nfeatures: skipped, the case has no segmentation")
+        return True
+    t1ce_img = np.asanyarray(nib.load(paths["t1ce"]).dataobj)
+    seg_nifti = nib.load(paths["segmentation"])
+    voxel_size = seg_nifti.header.get_zooms()[:3]
+    # The original service received the mask as float64 from get_fdata()
+    seg_float = seg_nifti.get_fdata()
+    seg_labels = np.rint(seg_float).astype(np.uint8)
+
+    legacy = measure(lambda: legacy_label_features(t1ce_img, seg_float, voxel_size), args.repeat)
+    current = measure(lambda: current_label_features(t1ce_img, seg_labels, voxel_size), args.repeat)
+    report("label statistics (per case)", legacy, current)
+
+    expected = legacy[0]
+    features, centroid = current[0]
+    actual = {
+        "whole_mm3": features["whole_tumor_volume_cm3"] * 1000,
+        "core_mm3": features["tumor_core_volume_cm3"] * 1000,
+        "enhancing_mm3": features["enhancing_volume_cm3"] * 1000,
+        "necrotic_mm3": features["necrotic_volume_cm3"] * 1000,
+        "edema_mm3": features["edema_volume_cm3"] * 1000,
+        "whole_diameter": features["whole_tumor_diameter_mm"],
+        "core_diameter": features["tumor_core_diameter_mm"],
+        "enhancing_diameter": features["enhancing_diameter_mm"],
+        "enhancement_mean": features["enhancement_mean_intensity"],
+        "enhancement_max": features["enhancement_max_intensity"],
+    }
+    max_diff = max(abs(float(expected[k]) - float(v)) / max(1.0, abs(float(expected[k])))
+                   for k, v in actual.items())
+    # The service reports the centroid rounded to whole voxels
+    centroid_diff = max(abs(round(expected[f"centroid_{axis}"]) - c)
+                        for axis, c in zip("xyz", centroid))
+    ok = max_diff <= args.tolerance and centroid_diff == 0
+    print(f"  parity : max relative |diff| {max_diff:.2e}  centroid diff {centroid_diff:.0f}  "
+          f"{'OK' if ok else 'FAILED'}")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# llm: pooled streaming LLMClient vs a blocking request per report
+# ---------------------------------------------------------------------------
+
+def start_stub_llm_server(tokens: int = 40, token_delay: float = 0.01, fail_every: int = 0):
+    """
+    Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+    Streams `tokens` words as SSE chunks (or one JSON body when "stream" is
+    false). Every `fail_every`-th request answers 503 first. Returns the
+    server, its URL and a dict of counters.
+    """
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    counters = {"requests": 0, "failed": 0, "active": 0, "max_active": 0, "connections": set()}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                counters["requests"] += 1
+                counters["connections"].add(self.client_address)
+                fail = fail_every and counters["requests"] % fail_every == 0
+                if fail:
+                    counters["failed"] += 1
+                else:
+                    counters["active"] += 1
+                    counters["max_active"] = max(counters["max_active"], counters["active"])
+            if fail:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            try:
+                words = [f"word{i} " for i in range(tokens)]
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for word in words:
+                        time.sleep(token_delay)
+                        self._chunk("data: " + json.dumps({"choices": [{"delta": {"content": word}}]}) + "\n\n")
+                    self._chunk("data: [DONE]\n\n")
+                    self._chunk("")
+                else:
+                    time.sleep(token_delay * tokens)
+                    payload = json.dumps({"choices": [{"message": {"content": "".join(words)}}]}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+            finally:
+                with lock:
+                    counters["active"] -= 1
+
+        def _chunk(self, text: str):
+            data = text.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    return server, url, counters
+
+
+def bench_llm(paths: dict, args) -> bool:
+    import httpx
+    from concurrent.futures import ThreadPoolExecutor
+    from app.services.llm_client import LLMClient
+
+    reports, workers, limit = 16, 8, 4
+    server, url, counters = start_stub_llm_server(fail_every=5)
+
+    def legacy_call(_):
+        # A fresh client and a blocking, non-streamed request per report
+        started = time.perf_counter()
+        with httpx.Client(timeout=60) as client:
+            for _attempt in range(4):
+                response = client.post(url, json={"messages": [], "stream": False})
+                if response.status_code == 200:
+                    break
+        text = response.json()["choices"][0]["message"]["content"]
+        return text, time.perf_counter() - started
+
+    client = LLMClient(url, "stub-key", "stub-model", max_concurrency=limit,
+                       max_connections=limit, max_retries=3, backoff=0.05)
+
+    def current_call(_):
+        started = time.perf_counter()
+        first = []
+        text = client.complete("prompt", on_delta=lambda d: first or first.append(
+            time.perf_counter() - started))
+        return text, first[0]
+
+    def run_all(call):
+        with ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(call, range(reports)))
+
+    try:
+        counters["connections"].clear()
+        legacy = measure(lambda: run_all(legacy_call), 1)
+        legacy_connections = len(counters["connections"])
+        counters["connections"].clear()
+        counters["max_active"] = 0
+        current = measure(lambda: run_all(current_call), 1)
+        current_connections = len(counters["connections"])
+    finally:
+        client.close()
+        server.shutdown()
+
+    report(f"llm ({reports} reports, {workers} callers, limit {limit})", legacy, current)
+    legacy_ttft = sorted(t for _, t in legacy[0])[reports // 2]
+    current_ttft = sorted(t for _, t in current[0])[reports // 2]
+    print(f"  first text: legacy p50 {legacy_ttft * 1000:.0f} ms  streamed p50 {current_ttft * 1000:.0f} ms")
+    print(f"  connections: legacy {legacy_connections}  pooled {current_connections}  "
+          f"max concurrent {counters['max_active']}  retries {client.stats()['retries']}")
+    ok = ([t for t, _ in legacy[0]] == [t for t, _ in current[0]]
+          and counters["max_active"] <= limit)
+    print(f"  parity : identical text, concurrency within limit  {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# overlay: NumPy lookup-table compositing + Pillow vs the matplotlib figure
+# ---------------------------------------------------------------------------
+
+
+def bench_overlay(paths: dict, args) -> bool:
+    from app.services.visualization_service import VisualizationService
+    from app.utils.overlay_renderer import IMAGE_ALPHA, OVERLAY_ALPHA, composite_slice
+
+    if "segmentation" not in paths:
+        print("\noverlay: skipped, the case has no segmentation")
+        return True
+    service = VisualizationService()
+    inputs = (paths["flair"], paths["segmentation"], "flair", 3)
+    # Decode once so both renderers start from the shared volume cache
+    service._render_segmentation_overlay(*inputs)
+
+    legacy = measure(lambda: service._render_segmentation_overlay(*inputs), args.repeat)
+    current = measure(lambda: service._composite_segmentation_overlay(*inputs), args.repeat)
+    report("overlay (per image, 3 slices)", legacy, current)
+    service.image_format = "webp"
+    webp = measure(lambda: service._composite_segmentation_overlay(*inputs), args.repeat)
+    print(f"  webp   : {webp[1] * 1000:9.1f} ms")
+    print(f"  size   : matplotlib png {len(legacy[0]) / 1024:.0f} KB  numpy png "
+          f"{len(current[0]) / 1024:.0f} KB  numpy webp {len(webp[0]) / 1024:.0f} KB")
+
+    # The lookup table must match straight float blending of the two layers
+    rng = np.random.default_rng(0)
+    gray = rng.random((240, 240))
+    labels = rng.integers(0, 4, size=(240, 240)).astype(np.uint8)
+    expected = np.repeat(((1 - IMAGE_ALPHA) + IMAGE_ALPHA * np.round(gray * 255) / 255)[..., None], 3, -1)
+    for label, (r, g, b, a) in service.tumor_colors.items():
+        if label:
+            alpha = a * OVERLAY_ALPHA
+            mask = labels == label
+            expected[mask] = expected[mask] * (1 - alpha) + np.array([r, g, b]) * alpha
+    actual = composite_slice(gray, labels, service._lut)
+    max_diff = int(np.abs(actual.astype(int) - np.round(expected * 255).astype(int)).max())
+    ok = max_diff <= 1
+    print(f"  parity : max |diff| vs float blending {max_diff} (8-bit)  {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# slices: one multi-axis label histogram vs a Python loop per overlay
+# ---------------------------------------------------------------------------
+
+
+def legacy_find_tumor_slices(seg_img, num_slices):
+    """VisualizationService._find_tumor_slices before slice ranking."""
+    slice_tumor_content = []
+    for i in range(seg_img.shape[2]):
+        tumor_voxels = np.sum(seg_img[:, :, i] > 0)
+        slice_tumor_content.append((i, tumor_voxels))
+    slice_tumor_content.sort(key=lambda x: x[1], reverse=True)
+    top_slices = [x[0] for x in slice_tumor_content[:min(num_slices*2, len(slice_tumor_content))]]
+    top_slices.sort()
+
+    if len(top_slices) >= num_slices:
+        indices = np.linspace(0, len(top_slices)-1, num_slices, dtype=int)
+        selected_slices = [top_slices[i] for i in indices]
+    else:
+        middle = seg_img.shape[2] // 2
+        selected_slices = list(range(middle - num_slices//2, middle + num_slices//2 + 1))
+        selected_slices = [max(0, min(seg_img.shape[2]-1, s)) for s in selected_slices]
+
+    return selected_slices[:num_slices]
+
+
+def bench_slices(paths: dict, args) -> bool:
+    from app.utils.label_statistics import compute_slice_ranking
+
+    if "segmentation" not in paths:
+        print("\nslices: skipped, the case has no segmentation")
+        return True
+    seg_float = nib.load(paths["segmentation"]).get_fdata()
+    seg_labels = np.rint(seg_float).astype(np.uint8)
+
+    # Three modality overlays per case, each ranking the float64 mask again
+    legacy = measure(lambda: [legacy_find_tumor_slices(seg_float, 3) for _ in range(3)], args.repeat)
+
+    def current_fn():
+        ranking = compute_slice_ranking(seg_labels)
+        return [ranking.top_slices(2, 3) for _ in range(3)], ranking
+    current = measure(current_fn, args.repeat)
+    report("slice ranking (per case, 3 overlays, all 3 axes)", legacy, current)
+
+    ranking = current[0][1]
+    rng = np.random.default_rng(0)
+    sparse = np.zeros(seg_labels.shape, dtype=np.uint8)
+    sparse[tuple(rng.integers(0, n, 500) for n in sparse.shape)] = rng.integers(1, 4, 500)
+    cases = [(seg_labels, seg_float), (sparse, sparse.astype(np.float64)),
+             (np.zeros((16, 16, 4), np.uint8), np.zeros((16, 16, 4)))]
+    ok = all(compute_slice_ranking(labels).top_slices(2, n) == legacy_find_tumor_slices(float_img, n)
+             for labels, float_img in cases for n in (1, 3, 5))
+    totals = [np.bincount(seg_labels.ravel(), minlength=4)[:4]]
+    totals += [counts.sum(axis=0) for counts in ranking.counts]
+    ok = ok and all(np.array_equal(totals[0], t) for t in totals[1:])
+    print(f"  key slices: {ranking.key_slices()}")
+    print(f"  parity : axial picks identical, per-axis histograms sum to label totals  "
+          f"{'OK' if ok else 'FAILED'}")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# ingest: uncompressed memory-mapped working copies vs decoding .nii.gz
+# ---------------------------------------------------------------------------
+
+def bench_ingest(paths: dict, args) -> bool:
+    import shutil
+    from app.utils.volume_io import open_working_copy, write_working_copy
+
+    modalities = [m for m in ("flair", "t1ce", "t2") if m in paths]
+    with tempfile.TemporaryDirectory() as tmp:
+        # Working copies are written next to the originals, so use copies of them
+        originals = {m: Path(shutil.copy(paths[m], Path(tmp) / paths[m].name)) for m in modalities}
+
+        start = time.perf_counter()
+        for path in originals.values():
+            write_working_copy(path)
+        ingest_time = time.perf_counter() - start
+
+        # What every stage does with the three scans of a case: read them in full
+        def legacy_fn():
+            return [float(np.asanyarray(nib.load(p).dataobj).max()) for p in originals.values()]
+
+        def current_fn():
+            return [float(open_working_copy(p)[0].max()) for p in originals.values()]
+
+        legacy = measure(legacy_fn, args.repeat)
+        current = measure(current_fn, args.repeat)
+        report("volume read per stage (3 scans, full pass)", legacy, current)
+
+        middle = nib.load(originals[modalities[0]]).shape[2] // 2
+        slice_legacy = measure(
+            lambda: np.asanyarray(nib.load(originals[modalities[0]]).dataobj)[:, :, middle].copy(),
+            args.repeat)
+        slice_current = measure(
+            lambda: open_working_copy(originals[modalities[0]])[0][:, :, middle].copy(), args.repeat)
+        report("single axial slice", slice_legacy, slice_current)
+        print(f"  one-time ingest of {len(originals)} scans: {ingest_time * 1000:.1f} ms")
+
+        ok = True
+        for path in originals.values():
+            data, meta = open_working_copy(path)
+            image = nib.load(path)
+            ok = ok and np.array_equal(data, np.asanyarray(image.dataobj))
+            ok = ok and np.allclose(meta['affine'], image.affine)
+            ok = ok and tuple(meta['zooms']) == tuple(float(z) for z in image.header.get_zooms())
+            ok = ok and data.dtype.kind in "iuf" and data.dtype.itemsize <= 4
+        print(f"  parity : voxels, affine and zooms identical to the originals  "
+              f"{'OK' if ok else 'FAILED'}")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# mask: uint8 writer with a cropped working copy vs nib.save + full decode
+# ---------------------------------------------------------------------------
+
+def bench_mask(paths: dict, args) -> bool:
+    from app.utils.label_statistics import compute_label_statistics, nonzero_box
+    from app.utils.postprocessing import PostProcessor
+    from app.utils.volume_io import cropped_box, read_volume, write_cropped_copy
+
+    if "segmentation" not in paths:
+        print("\nmask: skipped, the case has no segmentation")
+        return True
+    reference = nib.load(paths["segmentation"])
+    mask = np.asanyarray(reference.dataobj).astype(np.uint8)
+    t1ce = np.asanyarray(nib.load(paths["t1ce"]).dataobj) if "t1ce" in paths else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = Path(tmp) / "legacy_segmentation.nii.gz"
+        current_path = Path(tmp) / "current_segmentation.nii.gz"
+
+        # Save once, then the features stage reads the mask and measures it
+        def legacy_fn():
+            nib.save(nib.Nifti1Image(mask, reference.affine), legacy_path)
+            labels = nib.load(legacy_path).get_fdata()
+            return compute_label_statistics(labels, intensity=t1ce)
+
+        def current_fn():
+            PostProcessor.save_full_size_mask(mask, reference, current_path, args.mask_level)
+            write_cropped_copy(current_path, mask, reference.affine,
+                               reference.header.get_zooms(), nonzero_box(mask))
+            labels = read_volume(current_path)[0]
+            return compute_label_statistics(labels, intensity=t1ce, roi=cropped_box(current_path))
+
+        legacy = measure(legacy_fn, args.repeat)
+        current = measure(current_fn, args.repeat)
+        report(f"mask write + read + label statistics (gzip level {args.mask_level})",
+               legacy, current)
+
+        saved = nib.load(current_path)
+        crop_bytes = sum(p.stat().st_size for p in Path(tmp).glob("current_segmentation.*")
+                         if p.suffix in (".npy", ".json"))
+        print(f"  sizes  : .nii.gz {legacy_path.stat().st_size / 1024:.0f} KB -> "
+              f"{current_path.stat().st_size / 1024:.0f} KB, cropped copy {crop_bytes / 1024:.0f} KB")
+        ok = (saved.get_data_dtype() == np.uint8
+              and np.array_equal(np.asanyarray(saved.dataobj), mask)
+              and np.array_equal(read_volume(current_path)[0], mask)
+              and legacy[0] == current[0])
+        print(f"  parity : uint8 header, identical labels and region statistics  "
+              f"{'OK' if ok else 'FAILED'}")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# engines: UNet3D forward on the 128^3 crop for each CPU execution engine
+# ---------------------------------------------------------------------------
+
+def load_benchmark_model(checkpoint):
+    """UNet3D from a checkpoint, or randomly initialised with non-trivial BatchNorm statistics."""
+    import torch
+    from app.models.unet3d import UNet3D
+
+    # Seeded, so separate benchmark processes build the same random model
+    with torch.random.fork_rng():
+        torch.manual_seed(0)
+        model = UNet3D(in_channels=3, out_channels=4)
+    if checkpoint:
+        model.load_state_dict(torch.load(checkpoint, map_location="cpu")["model"])
+    else:
+        generator = torch.Generator().manual_seed(0)
+        for module in model.modules():
+            if isinstance(module, torch.nn.BatchNorm3d):
+                module.running_mean.normal_(0, 0.1, generator=generator)
+                module.running_var.uniform_(0.5, 2.0, generator=generator)
+                module.weight.data.uniform_(0.5, 1.5, generator=generator)
+                module.bias.data.normal_(0, 0.1, generator=generator)
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return model
+
+
+def bench_engines(paths: dict, args) -> bool:
+    import copy
+    import torch
+    from app.utils.inference_engines import build_engine, configure_threads, fold_batchnorm
+    from app.utils.preprocessing import ImagePreprocessor
+
+    configure_threads(args.threads, args.interop_threads)
+    example = ImagePreprocessor().preprocess_input(paths["flair"], paths["t1ce"], paths["t2"])[0]
+    batch = example.repeat(args.engine_batch, 1, 1, 1, 1)
+    base = load_benchmark_model(args.checkpoint)
+    with torch.no_grad():
+        expected = base(example)
+
+    configs = {
+        "eager": ("eager", False, False),
+        "eager+fold": ("eager", True, False),
+        "eager+fold+cl3d": ("eager", True, True),
+        "torchscript+fold": ("torchscript", True, False),
+        "torchscript+fold+cl3d": ("torchscript", True, True),
+        "compile+fold": ("compile", True, False),
+        "compile+fold+cl3d": ("compile", True, True),
+        "onnxruntime+fold": ("onnxruntime", True, False),
+    }
+    selected = args.engines.split(",") if args.engines else list(configs)
+    print(f"\nUNet3D forward, input {tuple(example.shape)}, {torch.get_num_threads()} intra-op "
+          f"threads, throughput at batch {args.engine_batch}")
+    print(f"  {'engine':<24}{'build s':>9}{'latency ms':>12}{'cases/s':>9}"
+          f"{'max |diff|':>12}{'labels equal':>14}")
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in selected:
+            engine, fold, channels_last = configs[name]
+            model = copy.deepcopy(base)
+            start = time.perf_counter()
+            try:
+                if fold:
+                    fold_batchnorm(model)
+                runner = build_engine(model, engine, example, channels_last=channels_last,
+                                      onnx_path=Path(tmp) / f"{name}.onnx",
+                                      intra_op=args.threads, inter_op=args.interop_threads)
+            except RuntimeError as e:
+                print(f"  {name:<24}skipped: {e}")
+                continue
+            build_time = time.perf_counter() - start
+
+            with torch.no_grad():
+                latency = min(_timed(lambda: runner(example)) for _ in range(args.repeat))
+                batch_time = min(_timed(lambda: runner(batch)) for _ in range(args.repeat))
+                actual = runner(example)
+            max_diff = float((actual - expected).abs().max())
+            agreement = float((actual.argmax(1) == expected.argmax(1)).float().mean())
+            ok = ok and max_diff <= args.engine_tolerance
+            print(f"  {name:<24}{build_time:9.1f}{latency * 1000:12.0f}"
+                  f"{args.engine_batch / batch_time:9.3f}{max_diff:12.2e}{agreement:13.4%}")
+    print(f"  parity : logits within {args.engine_tolerance:g} of eager  {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def _memory_probe(mode: str, example_path: str, labels_path: str, args) -> dict:
+    """
+    One crop-inference pass in a fresh process, so ru_maxrss is this mode's
+    own high-water mark: "legacy" takes the argmax of full logits on the
+    host, "lean" uses the uint8 label path.
+    """
+    import resource
+    import torch
+    from app.utils.inference_engines import (LabelPredictor, build_engine, configure_threads,
+                                             fold_batchnorm)
+
+    configure_threads(args.threads, args.interop_threads)
+    model = load_benchmark_model(args.checkpoint)
+    fold_batchnorm(model)
+    runner = build_engine(model, "eager", None, channels_last=True)
+    inputs = torch.from_numpy(np.load(example_path))
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    with torch.no_grad():
+        start = time.perf_counter()
+        if mode == "lean":
+            labels = LabelPredictor(runner, chunk_depth=args.lean_chunk_depth)(inputs).numpy()
+        else:
+            labels = torch.argmax(runner(inputs), dim=1).cpu().numpy()
+        elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    np.save(labels_path, labels.astype(np.uint8))
+    return {"baseline": baseline, "peak": peak, "seconds": elapsed, "dtype": str(labels.dtype)}
+
+
+def bench_memory(paths: dict, args) -> bool:
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    from app.utils.preprocessing import ImagePreprocessor
+
+    example = ImagePreprocessor().preprocess_input(paths["flair"], paths["t1ce"], paths["t2"])[0]
+    mib = 1024 * 1024
+    print(f"\nCrop inference peak RSS, each run in its own process "
+          f"(lean slabs of {args.lean_chunk_depth} slices)")
+    print(f"  {'batch':<7}{'mode':<8}{'peak MB':>9}{'forward MB':>12}{'s':>7}"
+          f"{'labels':>8}{'labels equal':>14}")
+    ok = True
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        for batch in sorted({1, args.engine_batch}):
+            example_path = str(Path(tmp) / f"example-{batch}.npy")
+            np.save(example_path, example.repeat(batch, 1, 1, 1, 1).numpy())
+            results = {}
+            for mode in ("legacy", "lean"):
+                labels_path = str(Path(tmp) / f"{mode}-{batch}.npy")
+                with ProcessPoolExecutor(1, mp_context=context) as pool:
+                    results[mode] = pool.submit(_memory_probe, mode, example_path,
+                                                labels_path, args).result()
+                results[mode]["labels"] = np.load(labels_path)
+            agreement = float((results["lean"]["labels"] == results["legacy"]["labels"]).mean())
+            ok = ok and agreement >= 1 - args.tolerance
+            for mode, r in results.items():
+                print(f"  {batch:<7}{mode:<8}{r['peak'] / mib:9.0f}"
+                      f"{(r['peak'] - r['baseline']) / mib:12.0f}{r['seconds']:7.2f}"
+                      f"{r['dtype']:>8}" + (f"{agreement:13.4%}" if mode == "lean" else ""))
+    print(f"  parity : lean labels match legacy argmax  {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "features": bench_features,
+    "llm": bench_llm,
+    "overlay": bench_overlay,
+    "slices": bench_slices,
+    "ingest": bench_ingest,
+    "mask": bench_mask,
+    "engines": bench_engines,
+    "memory": bench_memory,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pipeline micro-benchmarks")
+    parser.add_argument("benchmarks", nargs="*", metavar="NAME",
+                        help=f"benchmarks to run, any of: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--case-dir", type=Path,
+                        help="directory with flair/t1ce/t2(/segmentation) NIfTI files; "
+                             "a synthetic case is generated when omitted")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mask-level", type=int, default=1,
+                        help="gzip level for the mask benchmark")
+    parser.add_argument("--engines",
+                        help="comma-separated engine configurations for the engines benchmark")
+    parser.add_argument("--engine-batch", type=int, default=2,
+                        help="batch size for the engine throughput measurement")
+    parser.add_argument("--engine-tolerance", type=float, default=1e-3,
+                        help="maximum absolute logit difference accepted for an engine")
+    parser.add_argument("--lean-chunk-depth", type=int, default=32,
+                        help="depth slab of the lean label path in the memory benchmark")
+    parser.add_argument("--checkpoint", help="UNet3D checkpoint for the engines and memory benchmarks "
+                                             "(random weights when omitted)")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0: default)")
+    parser.add_argument("--interop-threads", type=int, default=0,
+                        help="inter-op threads (0: default)")
+    parser.add_argument("--tolerance", type=float, default=1e-5,
+                        help="maximum absolute difference accepted by parity checks")
+    args = parser.parse_args()
+
+    selected = args.benchmarks or list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = find_case(args.case_dir) if args.case_dir else make_synthetic_case(Path(tmp))
+        results = [BENCHMARKS[name](paths, args) for name in selected]
+    return 0 if all(r is not False for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
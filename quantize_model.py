@@ -0,0 +1,172 @@
+# quantize_model.py - Build reduced-precision UNet3D models and their accuracy gate
+import argparse
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import torch
+
+from app.core.config import settings
+from app.services.model_registry import model_registry
+from app.utils.preprocessing import CROP_SOURCE_SHAPE, ImagePreprocessor
+from app.utils.quantization import (TUMOR_LABELS, artifact_paths, dice_scores, load_unet3d,
+                                    quantize_int8)
+
+MODALITIES = ("flair", "t1ce", "t2")
+
+
+def find_cases(directory: Path) -> Tuple[List[Dict[str, Path]], List[str]]:
+    """
+    Every folder under `directory` (or `directory` itself) holding one
+    FLAIR, T1CE and T2 volume, named like uploads (`flair.nii.gz`) or
+    BraTS cases (`BraTS20_Training_001_flair.nii`).
+    """
+    cases, skipped = [], []
+    for folder in [directory, *sorted(p for p in directory.rglob("*") if p.is_dir())]:
+        paths = {}
+        for modality in MODALITIES:
+            matches = sorted(folder.glob(f"*{modality}.nii*"))
+            if matches:
+                paths[modality] = matches[0]
+        if len(paths) == len(MODALITIES):
+            cases.append(paths)
+        elif paths:
+            skipped.append(f"{folder}: missing {', '.join(m for m in MODALITIES if m not in paths)}")
+    return cases, skipped
+
+
+def case_inputs(cases: List[Dict[str, Path]], preprocessor: ImagePreprocessor,
+                skipped: List[str]) -> Iterator[Tuple[str, torch.Tensor]]:
+    """The model's 128^3 crop input of each case; other volume shapes are skipped."""
+    for paths in cases:
+        shape = preprocessor.get_shape(paths["flair"])
+        if shape != CROP_SOURCE_SHAPE:
+            skipped.append(f"{paths['flair'].parent}: shape {shape} is not {CROP_SOURCE_SHAPE}")
+            continue
+        inputs = preprocessor.preprocess_input(paths["flair"], paths["t1ce"], paths["t2"])[0]
+        yield str(paths["flair"].parent), inputs
+
+
+def evaluate(reference_model, candidate_model, inputs) -> Tuple[List[dict], float, float]:
+    """Per-case Dice of the candidate's labels against fp32, plus total time of each model."""
+    results, reference_time, candidate_time = [], 0.0, 0.0
+    with torch.no_grad():
+        for case, x in inputs:
+            if not results:
+                # Traced models specialize on their first calls; keep that out of the timing
+                for _ in range(2):
+                    candidate_model(x)
+            start = time.perf_counter()
+            reference = reference_model(x).argmax(1).squeeze(0).numpy()
+            reference_time += time.perf_counter() - start
+            start = time.perf_counter()
+            candidate = candidate_model(x).argmax(1).squeeze(0).numpy()
+            candidate_time += time.perf_counter() - start
+            dice = dice_scores(reference, candidate)
+            results.append({"case": case,
+                            "dice": {TUMOR_LABELS[label]: round(d, 6) for label, d in dice.items()}})
+            print(f"  {case}: " + "  ".join(f"{TUMOR_LABELS[l]} {d:.4f}" for l, d in dice.items()))
+    return results, reference_time, candidate_time
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build a bf16 or INT8 UNet3D and gate it on "
+                                                 "per-label Dice against the fp32 model")
+    parser.add_argument("--precision", choices=("bf16", "int8"), required=True)
+    parser.add_argument("--checkpoint", default=settings.MODEL_PATH)
+    parser.add_argument("--calibration-dir", type=Path,
+                        help="cases whose activations calibrate INT8 ranges")
+    parser.add_argument("--eval-dir", type=Path, required=True,
+                        help="cases on which the gate compares against fp32 masks")
+    parser.add_argument("--max-calibration-cases", type=int, default=16)
+    parser.add_argument("--min-dice", type=float, default=settings.QUANTIZATION_MIN_DICE,
+                        help="mean Dice every label must reach")
+    parser.add_argument("--model-dir", type=Path, default=settings.MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.precision == "int8" and not args.calibration_dir:
+        parser.error("--calibration-dir is required for int8")
+    digest = model_registry.checkpoint_digest(args.checkpoint)
+    model_path, gate_path = artifact_paths(args.model_dir, digest, args.precision)
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    preprocessor = ImagePreprocessor()
+    reference = load_unet3d(args.checkpoint)
+    skipped: List[str] = []
+
+    calibration_cases = 0
+    if args.precision == "int8":
+        cases, missing = find_cases(args.calibration_dir)
+        skipped += missing
+        cases = cases[:args.max_calibration_cases]
+        calibration = [x for _, x in case_inputs(cases, preprocessor, skipped)]
+        if not calibration:
+            print(f"No usable calibration cases in {args.calibration_dir}")
+            return 1
+        calibration_cases = len(calibration)
+        print(f"Calibrating INT8 on {calibration_cases} cases "
+              f"({torch.backends.quantized.engine} backend)")
+        candidate = quantize_int8(reference, calibration)
+        del calibration
+        torch.jit.save(candidate, str(model_path))
+        print(f"Wrote {model_path}")
+        # Gate the artifact as the registry will load it
+        candidate = torch.jit.load(str(model_path))
+    else:
+        # fold_batchnorm works in place; the reference stays the unfolded fp32 model
+        candidate = copy.deepcopy(reference)
+    example = torch.zeros((1, 3, *settings.SLIDING_WINDOW_PATCH_SIZE))
+    candidate, folded = model_registry.build_serving_engine(
+        candidate, args.checkpoint, args.precision, example)
+    engine = "torchscript" if args.precision == "int8" else settings.INFERENCE_ENGINE
+
+    cases, missing = find_cases(args.eval_dir)
+    skipped += missing
+    print(f"Evaluating {args.precision} ({engine} engine, {folded} BatchNorms folded) "
+          f"against fp32 on {len(cases)} cases")
+    results, reference_time, candidate_time = evaluate(
+        reference, candidate, case_inputs(cases, preprocessor, skipped))
+    for reason in skipped:
+        print(f"Skipped {reason}")
+    if not results:
+        print(f"No usable evaluation cases in {args.eval_dir}")
+        return 1
+
+    mean_dice = {name: round(float(np.mean([r["dice"][name] for r in results])), 6)
+                 for name in TUMOR_LABELS.values()}
+    min_dice = {name: round(float(np.min([r["dice"][name] for r in results])), 6)
+                for name in TUMOR_LABELS.values()}
+    passed = all(dice >= args.min_dice for dice in mean_dice.values())
+    gate = {
+        "precision": args.precision,
+        "checkpoint": digest,
+        "backend": torch.backends.quantized.engine if args.precision == "int8" else None,
+        "engine": engine,
+        "folded_batchnorms": folded,
+        "created_at": time.time(),
+        "calibration_cases": calibration_cases,
+        "min_dice_required": args.min_dice,
+        "mean_dice": mean_dice,
+        "min_dice": min_dice,
+        "passed": passed,
+        "fp32_seconds_per_case": round(reference_time / len(results), 3),
+        "seconds_per_case": round(candidate_time / len(results), 3),
+        "cases": results,
+    }
+    gate_path.write_text(json.dumps(gate, indent=2))
+
+    print(f"Mean Dice vs fp32: " + "  ".join(f"{n} {d:.4f}" for n, d in mean_dice.items()))
+    print(f"Latency per case: fp32 {gate['fp32_seconds_per_case']:.2f}s, "
+          f"{args.precision} {gate['seconds_per_case']:.2f}s")
+    print(f"Gate {'PASSED' if passed else 'FAILED'} (mean Dice >= {args.min_dice} per label); "
+          f"report in {gate_path}")
+    if passed:
+        print(f"Enable with INFERENCE_PRECISION={args.precision}")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+# tests/conftest.py
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Settings needs these at import time; tests never reach the model or the real endpoint
+for name, value in {
+    "MODEL_PATH": str(ROOT / "data" / "models" / "unused.tar"),
+    "DEVICE": "cpu",
+    "BACKEND_CORS_ORIGINS": '["http://localhost"]',
+    "HUGGINGFACEHUB_ACCESS_TOKEN": "test-token",
+    "MODEL_NAME": "test-model",
+    "HUGGINGFACE_API_URL": "http://127.0.0.1:9",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,83 @@
+# tests/test_llm_client.py
+import threading
+import time
+
+import pytest
+
+from app.services.llm_client import LLMClient, LLMError
+from benchmark import start_stub_llm_server
+
+
+@pytest.fixture
+def stub():
+    """Start a stub endpoint and an LLMClient for it; both are closed afterwards."""
+    started = []
+
+    def start(client_kwargs=None, **server_kwargs):
+        server, url, counters = start_stub_llm_server(**server_kwargs)
+        client = LLMClient(url, "stub-key", "stub-model",
+                           **{"max_retries": 3, "backoff": 0.01, **(client_kwargs or {})})
+        started.append((server, client))
+        return client, counters
+
+    yield start
+    for server, client in started:
+        client.close()
+        server.shutdown()
+
+
+def test_streams_deltas_in_order(stub):
+    client, _ = stub(tokens=5, token_delay=0)
+    deltas = []
+    text = client.complete("prompt", on_delta=deltas.append)
+    assert text == "word0 word1 word2 word3 word4 "
+    assert "".join(deltas) == text
+    assert client.stats()["tokens_streamed"] == 5
+
+
+def test_retries_retryable_status(stub):
+    client, counters = stub(tokens=3, token_delay=0, fail_every=2)
+    assert client.complete("first") == "word0 word1 word2 "
+    # The second request gets a 503 and is retried
+    assert client.complete("second") == "word0 word1 word2 "
+    assert counters["failed"] == 1
+    stats = client.stats()
+    assert stats["retries"] == 1
+    assert stats["succeeded"] == 2 and stats["failed"] == 0
+
+
+def test_gives_up_after_max_retries(stub):
+    client, counters = stub({"max_retries": 2}, tokens=3, token_delay=0, fail_every=1)
+    with pytest.raises(LLMError, match="HTTP 503"):
+        client.complete("prompt")
+    assert counters["requests"] == 3
+    assert client.stats()["failed"] == 1
+
+
+def test_deadline_while_streaming_is_not_retried(stub):
+    client, counters = stub(tokens=20, token_delay=0.1)
+    deltas = []
+    started = time.monotonic()
+    with pytest.raises(LLMError):
+        client.complete("prompt", on_delta=deltas.append, timeout=0.5)
+    assert time.monotonic() - started < 2
+    # Tokens already reached the caller, so a retry would have duplicated them
+    assert deltas and counters["requests"] == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_waiting_for_a_slot_counts_against_the_deadline(stub):
+    client, counters = stub({"max_concurrency": 1}, tokens=10, token_delay=0.2)
+    first = threading.Thread(target=client.complete, args=("slow",))
+    first.start()
+    try:
+        while counters["requests"] == 0:
+            time.sleep(0.01)
+        started = time.monotonic()
+        with pytest.raises(LLMError, match="free request slot"):
+            client.complete("queued", timeout=0.3)
+        assert time.monotonic() - started < 1
+        assert counters["requests"] == 1
+    finally:
+        first.join()
+    assert client.stats()["succeeded"] == 1
@@ -0,0 +1,41 @@
+# tests/test_preprocessing.py
+import nibabel as nib
+import numpy as np
+import pytest
+
+from app.utils.preprocessing import ImagePreprocessor
+from benchmark import legacy_preprocess_input, make_synthetic_case
+
+TOLERANCE = 1e-6
+
+
+def _write_case(directory, dtype, seed=1):
+    """BraTS-shaped case with constant slices and a wide intensity range."""
+    rng = np.random.default_rng(seed)
+    paths = {}
+    for modality in ("flair", "t1ce", "t2"):
+        data = (rng.random((240, 240, 155)) * 5000).astype(dtype)
+        # Constant axial slices inside the crop window (z 13-141)
+        data[..., 20:25] = 0
+        data[..., 100:103] = 7
+        paths[modality] = directory / f"{modality}.nii.gz"
+        nib.save(nib.Nifti1Image(data, np.eye(4)), paths[modality])
+    return paths
+
+
+@pytest.mark.parametrize("make_case", [
+    make_synthetic_case,
+    lambda d: _write_case(d, np.int16),
+    lambda d: _write_case(d, np.float32),
+], ids=["synthetic", "int16-constant-slices", "float32-constant-slices"])
+def test_matches_legacy_preprocessing(tmp_path, make_case):
+    paths = make_case(tmp_path)
+    inputs = (paths["flair"], paths["t1ce"], paths["t2"])
+
+    expected, expected_shape, _ = legacy_preprocess_input(*inputs)
+    actual, actual_shape, _ = ImagePreprocessor().preprocess_input(*inputs)
+
+    assert actual.shape == expected.shape == (1, 3, 128, 128, 128)
+    assert actual.dtype == expected.dtype
+    assert actual_shape == expected_shape
+    assert float((actual - expected).abs().max()) <= TOLERANCE